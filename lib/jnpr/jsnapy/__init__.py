@@ -5,14 +5,69 @@
 
 from .version import __version__
 import ConfigParser
+import threading
 import os
 
+DEFAULT_PATHS = {'config_file_path': '/etc/jsnapy', 'snapshot_path': '/etc/jsnapy/snapshots',
+                 'test_file_path': '/etc/jsnapy/testfiles', 'log_file_path': '/etc/logs/jsnapy'}
+
+
+class JsnapyConfig(object):
+
+    """
+    Values of jsnapy.cfg, read only once per process.
+    Location of jsnapy.cfg can be changed using environment variable JSNAPY_CFG
+    and any value can be overridden using JSNAPY_<NAME>, ex: JSNAPY_SNAPSHOT_PATH.
+    Call reload() to read the file and environment again.
+    """
+
+    def __init__(self, cfg_file=None, env_prefix='JSNAPY_'):
+        self.cfg_file = cfg_file
+        self.env_prefix = env_prefix
+        self._lock = threading.Lock()
+        self._parser = None
+        self._values = {}
+
+    def _config_file(self):
+        return self.cfg_file or os.getenv(
+            self.env_prefix + 'CFG',
+            os.path.join('/etc', 'jsnapy', 'jsnapy.cfg'))
+
+    def reload(self):
+        """
+        Forget values read earlier, they are read again on next get()
+        """
+        with self._lock:
+            self._parser = None
+            self._values = {}
+
+    def get(self, section, value):
+        """
+        :param section: section of jsnapy.cfg, ex: DEFAULT
+        :param value: name of value, ex: snapshot_path
+        :return: value from environment if set, otherwise from jsnapy.cfg
+        """
+        key = (section, value)
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._values:
+                path = os.getenv(self.env_prefix + value.upper())
+                if path is None:
+                    if self._parser is None:
+                        parser = ConfigParser.ConfigParser(DEFAULT_PATHS)
+                        parser.read(self._config_file())
+                        self._parser = parser
+                    path = self._parser.get(section, value)
+                self._values[key] = path
+            return self._values[key]
+
+config = JsnapyConfig()
+
 
 def get_path(section, value):
-    config = ConfigParser.ConfigParser({'config_file_path': '/etc/jsnapy', 'snapshot_path': '/etc/jsnapy/snapshots',
-                                        'test_file_path': '/etc/jsnapy/testfiles', 'log_file_path': '/etc/logs/jsnapy'})
-    config.read(os.path.join('/etc', 'jsnapy', 'jsnapy.cfg'))
-    path = config.get(section, value)
-    return path
+    return config.get(section, value)
 
 from jnpr.jsnapy.jsnapy import SnapAdmin
@@ -10,22 +10,74 @@ import re
 import sys
 import colorama
 import logging
-import yaml
+from copy import deepcopy
 from lxml import etree
 from jnpr.jsnapy.testop import Operator
 from jnpr.jsnapy.sqlite_get import SqliteExtractXml
 from icdiff import diff, codec_print, get_options, ConsoleDiff
 from jnpr.jsnapy.xml_comparator import XmlComparator
+from jnpr.jsnapy.snapshot_cache import SnapshotCache
+from jnpr.jsnapy import compression
+from jnpr.jsnapy import content_store
+from jnpr.jsnapy import merkle
+from jnpr.jsnapy import plans
 from jnpr.jsnapy import get_path
 
 colorama.init(autoreset=True)
 
+
+class SqliteSnapshots(object):
+
+    """
+    Snapshots of one device read from database. All commands stored with a snap
+    name are fetched in one query the first time that snap name is used.
+    """
+
+    def __init__(self, db_name, device):
+        self.db = SqliteExtractXml(db_name)
+        self.device = device
+        self.snaps = {}
+
+    def get(self, name, snap_name):
+        """
+        :param name: command/RPC name
+        :param snap_name: snap file tag
+        :return: data and format of snapshot, same as
+                 SqliteExtractXml.get_xml_using_snapname
+        """
+        if snap_name not in self.snaps:
+            self.snaps[snap_name] = self.db.get_all_using_snapname(
+                self.device, snap_name)
+        if name in self.snaps[snap_name]:
+            return self.snaps[snap_name][name]
+        # not found, let it report the error
+        return self.db.get_xml_using_snapname(self.device, name, snap_name)
+
+
 class Comparator:
 
-    def __init__(self):
+    def __init__(self, snap_cache=None, retention=None):
+        """
+        :param snap_cache: SnapshotCache holding parsed snapshots, a new one is
+                           created if not given
+        :param retention: test details kept ('all', 'failures-only' or
+                          'counts-only'), overrides result_retention of main
+                          config file
+        """
         colorama.init(autoreset=True)
         self.logger_check = logging.getLogger(__name__)
         self.log_detail = {'hostname': None}
+        self.snap_cache = snap_cache if snap_cache is not None else SnapshotCache()
+        self.retention = retention
+        # set from main config file, parse snapshot files in streaming mode
+        # when tests allow it
+        self.streaming = False
+        # set from main config file, key nodes used to match sibling nodes
+        # while comparing snapshots without test operators
+        self.diff_keys = None
+        # replies held by snap.Parser, by name and format of snapshot, set for
+        # in memory snapcheck so that replies are tested without reading snapshots
+        self.replies = None
 
     def __del__(self):
         colorama.init(autoreset=True)
@@ -47,38 +99,46 @@ class Comparator:
                 sfile)
             return snapfile
 
+    def reply_tree(self, reply):
+        """
+        Tree of a reply held in memory, looking same as snapshot file parsed
+        from serialized reply. Reply still attached to rpc-reply of device is
+        copied so that absolute xpaths start from the reply.
+        :param reply: lxml Element
+        :return: lxml ElementTree
+        """
+        if reply.getparent() is not None:
+            reply = deepcopy(reply)
+            reply.tail = None
+        return etree.ElementTree(reply)
+
     def get_err_mssg(self, path, ele_list):
         """
         This function generates error message, if nothing is given then it will generate default error message
         """
-        err_mssg = path.get('err', "Test FAILED: " +
-                            ele_list[
-                                0] + " before was < {{pre['" + ele_list[0] + "']}} >"
-                            " now it is < {{post['" + ele_list[0] + "']}} > ")
-        return err_mssg
+        return plans.default_err_mssg(path, ele_list)
 
     def get_info_mssg(self, path, ele_list):
         """
         This function generates info message, if nothing is given then it will generate default info message
         """
-        info_mssg = path.get('info', "Test PASSED: " + ele_list[0] +
-                             " before was < {{pre['" +
-                             ele_list[0] +
-                             "']}} > now it is < {{post['" +
-                             ele_list[0] +
-                             "']}} > ")
-        return info_mssg
-
-    def get_xml_reply(self, db, snap):
+        return plans.default_info_mssg(path, ele_list)
+
+    def get_xml_reply(self, db, snap, x_paths=None):
         """
         function is used to extract values from either xml file or from database
         :param db: name of database
         :param snap: snapfile
+        :param x_paths: xpaths of tests, snapshot file is parsed in streaming
+                        mode keeping only nodes at these xpaths
         :return: parsed snapshot
         """
+        if isinstance(snap, etree._ElementTree):
+            # reply held in memory
+            return snap
         if db.get('check_from_sqlite') is True:
             if snap != str(None):
-                xml_value = etree.fromstring(snap)
+                xml_value = self.snap_cache.parse_string(snap)
             else:
                 self.logger_check.error(
                     colorama.Fore.RED +
@@ -86,7 +146,7 @@ class Comparator:
                     extra=self.log_detail)
                 return
         elif os.path.isfile(snap) and os.stat(snap).st_size > 0:
-            xml_value = etree.parse(snap)
+            xml_value = self.snap_cache.parse_file(snap, x_paths)
         ##### sometimes snapshot files are empty, when cmd/rpc reply do not contain any value
         elif os.path.isfile(snap) and os.stat(snap).st_size <= 0:
             self.logger_check.error(
@@ -102,6 +162,43 @@ class Comparator:
             return
         return xml_value
 
+    def is_identical(self, db, pre_snap, post_snap):
+        """
+        Check if pre and post snapshots have same data, without parsing them.
+        Snapshot files deduplicated in content store are linked to same data,
+        other files are compared using size and digest kept next to them.
+        :param db: database handler
+        :param pre_snap: pre snapshot file name, or data if taken from database
+        :param post_snap: post snapshot file name, or data if taken from database
+        :return: True if snapshots are identical
+        """
+        if db.get('check_from_sqlite') is True:
+            return pre_snap != str(None) and pre_snap == post_snap
+        if not (os.path.isfile(pre_snap) and os.path.isfile(post_snap)):
+            return False
+        return os.stat(pre_snap).st_size > 0 and \
+            content_store.same_file(pre_snap, post_snap)
+
+    def get_merkle(self, db, pre_snap, post_snap):
+        """
+        Hash indexes stored with pre and post snapshots when they were taken
+        :param db: database handler
+        :param pre_snap: pre snapshot file name, or data if taken from database
+        :param post_snap: post snapshot file name, or data if taken from database
+        :return: indexes of pre and post snapshots, None for a snapshot
+                 stored without index
+        """
+        try:
+            if db.get('check_from_sqlite') is True:
+                sqlite_get = SqliteExtractXml(db['db_name'])
+                return sqlite_get.get_merkle(pre_snap), sqlite_get.get_merkle(post_snap)
+            return merkle.read_file(pre_snap), merkle.read_file(post_snap)
+        except Exception as ex:
+            self.logger_check.debug(
+                "Hash index of snapshots not read: %s" % ex,
+                extra=self.log_detail)
+            return None, None
+
     def compare_reply(
             self, op, tests, teston, check, db, snap1, snap2=None, action=None):
         """
@@ -111,7 +208,8 @@ class Comparator:
         Extract xpath and other values for comparing two snapshots and
         testop.Operator methods to perform tests
         :param op: testop.Operator object
-        :param tests: test cases
+        :param tests: plans.CommandPlan of command, or its test cases as given
+                      in test file
         :param teston: command/rpc to perform test
         :param check: variable to check if --check is given
         :param db: database handler
@@ -121,70 +219,42 @@ class Comparator:
         """
 
         ####     extract all test cases in given test file     ####
-        tests = [t for t in tests if ('iterate' in t or 'item' in t)]
-        if not len(tests) and (check is True or action is "check"):
+        if not isinstance(tests, plans.CommandPlan):
+            tests = plans.CommandPlan(tests)
+        # found out only when a test comparing both snapshots needs it
+        identical = None
+        x_paths = None
+        if self.streaming and db.get('check_from_sqlite') is not True:
+            x_paths = tests.stream_paths()
+        if not len(tests.tests) and (check is True or action is "check"):
             res = self.compare_xml(op, db, teston, snap1, snap2)
             if res is False:
                 op.no_failed = op.no_failed + 1
             else:
                 op.no_passed = op.no_passed + 1
 
-        for test in tests:
-            if 'iterate' in test:
-                x_path = test.get('iterate').get('xpath', "no_xpath")
-                if 'id' in test.get('iterate'):
-                    ids = test.get('iterate').get('id')
-                    if isinstance(ids, list):
-                        id_list = ids
-                    else:
-                        id_list = [val.strip() for val in ids.split(',')]
-                else:
-                    id_list = []
-                testcases = test.get('iterate').get(
-                    'tests', [{'Define test operator': 'tests not defined'}])
-                iter = True
-
-            elif 'item' in test:
-                x_path = test.get('item').get('xpath', "no_xpath")
-                if 'id' in test.get('item'):
-                    ids = test.get('item').get('id')
-                    if isinstance(ids, list):
-                        id_list = ids
-                    else:
-                        id_list = [val.strip() for val in ids.split(',')]
-                else:
-                    id_list = []
-                testcases = test['item']['tests']
-                iter = False
-
-            # analyze individual test case and extract element list, info and
-            # err message ####
-            for path in testcases:
-                values = ['err', 'info']
-                testvalues = path.keys()
-                testop1 = [
-                    tvalue for tvalue in testvalues if tvalue not in values]
-                testop = testop1[0] if testop1 else "Define test operator"
-
-                ele = path.get(testop)
-                if ele is not None:
-                    ele_list = [elements.strip()
-                                for elements in ele.split(',')]
-                else:
-                    ele_list = ['no node']
+        for block in tests.blocks():
+            x_path = block.x_path
+            id_list = list(block.id_list)
+            iter = block.iter
 
-                # extract err and info messages , if not given then set the
-                # default error and info message
-                err_mssg = self.get_err_mssg(path, ele_list)
-                info_mssg = self.get_info_mssg(path, ele_list)
+            # test cases are normalized once, when test file is compiled ####
+            for testop, ele_list, err_mssg, info_mssg in block.testcases:
+                ele_list = list(ele_list)
 
                 # check test operators, below mentioned four are allowed only
                 # with --check ####
                 if testop in [
                         'no-diff', 'list-not-less', 'list-not-more', 'delta']:
                     if check is True or action is "check":
-                        xml1 = self.get_xml_reply(db, snap1)
-                        xml2 = self.get_xml_reply(db, snap2)
+                        if identical is None:
+                            identical = self.is_identical(db, snap1, snap2)
+                        xml1 = self.get_xml_reply(db, snap1, x_paths)
+                        if identical and op.identical_snapshots(
+                                self.log_detail, testop, x_path, ele_list,
+                                err_mssg, info_mssg, teston, iter, id_list, xml1):
+                            continue
+                        xml2 = self.get_xml_reply(db, snap2, x_paths)
                         op.define_operator(
                             self.log_detail,
                             testop,
@@ -207,11 +277,11 @@ class Comparator:
                     # if check is used with uni operand test operator then use
                     # second snapshot file
                     if check is True or action is "check":
-                        pre_snap = self.get_xml_reply(db, snap1)
-                        post_snap = self.get_xml_reply(db, snap2)
+                        pre_snap = self.get_xml_reply(db, snap1, x_paths)
+                        post_snap = self.get_xml_reply(db, snap2, x_paths)
                     else:
                         pre_snap = None
-                        post_snap = self.get_xml_reply(db, snap1)
+                        post_snap = self.get_xml_reply(db, snap1, x_paths)
 
                     op.define_operator(
                         self.log_detail,
@@ -226,10 +296,20 @@ class Comparator:
                         pre_snap,
                         post_snap)
 
+        # nodes found by tests are shared only by tests on same command
+        op.clear_node_cache()
+
     def compare_diff(self, pre_snap_file, post_snap_file, check_from_sqlite):
         """
         This function is called when --diff is used
         """
+        if self.is_identical({'check_from_sqlite': check_from_sqlite},
+                             pre_snap_file, post_snap_file):
+            self.logger_check.info(
+                colorama.Fore.BLUE +
+                "    No difference   ",
+                extra=self.log_detail)
+            return
         if check_from_sqlite:
             lines_a = pre_snap_file.splitlines(True)
             lines_b = post_snap_file.splitlines(True)
@@ -250,7 +330,15 @@ class Comparator:
         else:
             if os.path.isfile(pre_snap_file) and os.path.isfile(
                     post_snap_file):
-                diff(pre_snap_file, post_snap_file)
+                if compression.file_codec(pre_snap_file) is None and \
+                        compression.file_codec(post_snap_file) is None:
+                    diff(pre_snap_file, post_snap_file)
+                else:
+                    # compressed snapshots are compared after decompressing them
+                    self.compare_diff(
+                        compression.read_snapshot(pre_snap_file),
+                        compression.read_snapshot(post_snap_file),
+                        True)
             else:
                 self.logger_check.info(
                     colorama.Fore.RED +
@@ -272,6 +360,18 @@ class Comparator:
             30 *
             '-',
             extra=self.log_detail)
+        if self.is_identical(db, pre_snap_value, post_snap_value):
+            # same data, no need to parse and compare snapshots node by node
+            self.logger_check.info(
+                colorama.Fore.BLUE +
+                "    No difference   ",
+                extra=self.log_detail)
+            self.logger_check.info(
+                colorama.Fore.GREEN +
+                "Final result of --diff without test operator: PASSED",
+                extra=self.log_detail)
+            op.add_test_details(teston, XmlComparator().tresult)
+            return True
         pre_snap = self.get_xml_reply(db, pre_snap_value)
         post_snap = self.get_xml_reply(db, post_snap_value)
         flag = False
@@ -293,9 +393,11 @@ class Comparator:
                 extra=self.log_detail)
         else:
             result = []
-            xml_comp = XmlComparator()
+            xml_comp = XmlComparator(keys=self.diff_keys)
             if pre_root is not None and post_root is not None:
-                tres = xml_comp.xml_compare(pre_root, post_root, result.append)
+                pre_index, post_index = self.get_merkle(db, pre_snap_value, post_snap_value)
+                tres = xml_comp.xml_compare(pre_root, post_root, result.append,
+                                            pre_index, post_index)
                 self.logger_check.info(
                     colorama.Fore.BLUE +
                     (20) *
@@ -333,7 +435,7 @@ class Comparator:
                         "] " +
                         res,
                         extra=self.log_detail)
-            op.test_details[teston].append(tres)
+            op.add_test_details(teston, tres)
         return flag
 
     def generate_test_files(
@@ -354,9 +456,12 @@ class Comparator:
         :param action: given by module version, either snap, snapcheck or check
         :return: object of testop.Operator containing test details
         """
-        op = Operator()
+        op = Operator(retention=self.retention or main_file.get('result_retention'))
+        self.streaming = bool(main_file.get('streaming', False))
+        self.diff_keys = main_file.get('xml_diff_keys')
         op.device = device
         tests_files = []
+        sqlite_snaps = None
         self.log_detail['hostname'] = device
         # get the test files from config.yml
         if main_file.get('tests') is None:
@@ -373,8 +478,7 @@ class Comparator:
                             'test_file_path'),
                         tfile)
                 if os.path.isfile(tfile):
-                    test_file = open(tfile, 'r')
-                    tests_files.append(yaml.load(test_file))
+                    tests_files.append(plans.load_test_file(tfile))
                 else:
                     self.logger_check.error(
                         colorama.Fore.RED +
@@ -384,40 +488,29 @@ class Comparator:
 
             # check what all test cases need to be included, if nothing given
             # then include all test cases ####
-            for tests in tests_files:
-                tests_included = []
-                if 'tests_include' in tests:
-                    tests_included = tests.get('tests_include')
-                else:
-                    for t in tests:
-                        tests_included.append(t)
+            for plan in tests_files:
                 message= self._print_testmssg("Device: "+device, "*")
                 self.logger_check.info(colorama.Fore.BLUE + message, extra=self.log_detail)
-                for val in tests_included:
+                for val in plan.tests_included:
                     self.logger_check.info(
                         "Tests Included: %s " %
                         (val),
                         extra=self.log_detail)
                     try:
-                        if tests[val][0].keys()[0] == 'command':
-                            command = tests[val][0].get('command').split('|')[0].strip()
-                            reply_format = tests[val][0].get('format', 'xml')
-                            message = self._print_testmssg("Command: "+command, "*")
+                        tests = plan.command(val)
+                        name = tests.name
+                        teston = tests.teston
+                        reply_format = tests.reply_format
+                        if tests.is_command:
+                            message = self._print_testmssg("Command: "+teston, "*")
                         
                             self.logger_check.info(
                                 colorama.Fore.BLUE +
                                 message,
                                 extra=self.log_detail)
-                        
-                            name = '_'.join(command.split())
-                            teston = command
                         else:
-                            rpc = tests[val][0]['rpc']
-                            reply_format = tests[val][0].get('format', 'xml')
                             self.logger_check.info(colorama.Fore.BLUE + (25) * "*" + "RPC is " +
-                                                   rpc + (25) * '*', extra=self.log_detail)
-                            name = rpc
-                            teston = rpc
+                                                   teston + (25) * '*', extra=self.log_detail)
                     except KeyError:
                         self.logger_check.error(
                             colorama.Fore.RED +
@@ -428,22 +521,24 @@ class Comparator:
                             "ERROR Occurred: %s" % str(ex), extra=self.log_detail)
                     else:
                         # extract snap files, if check from sqlite is true t
-                        if db.get(
+                        if self.replies is not None and check is not True and \
+                                diff is not True and etree.iselement(self.replies.get((name, reply_format))):
+                            snapfile1 = self.reply_tree(self.replies[(name, reply_format)])
+                        elif db.get(
                                 'check_from_sqlite') is True and (check is True or diff is True or action in ["check", "diff"]):
-                            a = SqliteExtractXml(db.get('db_name'))
+                            if sqlite_snaps is None:
+                                sqlite_snaps = SqliteSnapshots(db.get('db_name'), str(device))
                             # while checking from database, preference is given
                             # to id and then snap name
                             if (db['first_snap_id'] is not None) and (
                                     db['second_snap_id'] is not None):
-                                snapfile1, data_format1 = a.get_xml_using_snap_id(
+                                snapfile1, data_format1 = sqlite_snaps.db.get_xml_using_snap_id(
                                     str(device), name, db['first_snap_id'])
-                                snapfile2, data_format2 = a.get_xml_using_snap_id(
+                                snapfile2, data_format2 = sqlite_snaps.db.get_xml_using_snap_id(
                                     str(device), name, db['second_snap_id'])
                             else:
-                                snapfile1, data_format1 = a.get_xml_using_snapname(
-                                    str(device), name, pre)
-                                snapfile2, data_format2 = a.get_xml_using_snapname(
-                                    str(device), name, post)
+                                snapfile1, data_format1 = sqlite_snaps.get(name, pre)
+                                snapfile2, data_format2 = sqlite_snaps.get(name, post)
                             if reply_format != data_format1 or reply_format != data_format2:
                                 self.logger_check.error(colorama.Fore.RED + "ERROR!! Data stored in database is not in %s format."
                                                         % reply_format, extra=self.log_detail)
@@ -451,9 +546,9 @@ class Comparator:
                                 # sys.exit(1)
                         ###### taking snapshot for --snapcheck operation ####
                         elif db.get('check_from_sqlite') is True:
-                            a = SqliteExtractXml(db.get('db_name'))
-                            snapfile1, data_format1 = a.get_xml_using_snapname(
-                                str(device), name, pre)
+                            if sqlite_snaps is None:
+                                sqlite_snaps = SqliteSnapshots(db.get('db_name'), str(device))
+                            snapfile1, data_format1 = sqlite_snaps.get(name, pre)
                             if reply_format != data_format1:
                                 self.logger_check.error(
                                     colorama.Fore.RED +
@@ -480,7 +575,7 @@ class Comparator:
                                     reply_format)
                             self.compare_reply(
                                 op,
-                                tests[val],
+                                tests,
                                 teston,
                                 check,
                                 db,
@@ -507,7 +602,7 @@ class Comparator:
                         elif (reply_format == 'xml'):
                             self.compare_reply(
                                 op,
-                                tests[val],
+                                tests,
                                 teston,
                                 check,
                                 db,
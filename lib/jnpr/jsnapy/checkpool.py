@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+"""
+Check phase of devices run on a pool of processes.
+Tests are evaluated in pure Python, so devices run on threads are checked on
+one core at a time. With a pool, check of each device runs in a worker
+process: it is given main config data and names of snapshot files (or ids of
+snapshots in sqlite), reads snapshots itself and sends back test details of
+its Operator in a compact form, trees are never pickled.
+Pool is shared by the whole process and its processes are forked only once,
+it must be started before threads of devices: forking a process while other
+threads hold locks is not safe.
+"""
+
+import atexit
+import threading
+import multiprocessing
+from collections import defaultdict
+from jnpr.jsnapy import sqlite_store
+from jnpr.jsnapy.check import Comparator
+from jnpr.jsnapy.testop import Operator
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    sqlite_store.forget_all()
+
+
+def get_pool(processes):
+    """
+    Pool shared by the whole process, started by first call and reused by next
+    ones till shutdown()
+    :param processes: number of worker processes, used if pool is not started
+    :return: multiprocessing.Pool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = multiprocessing.Pool(processes, _init_worker)
+        return _pool
+
+
+def shutdown():
+    """
+    Wait for checks given to shared pool and end its processes
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+atexit.register(shutdown)
+
+
+def dump_result(op):
+    """
+    :param op: testop.Operator
+    :return: picklable result of operator
+    """
+    return (op.device, op.result, op.no_passed, op.no_failed, op.retention,
+            dict(op.test_details))
+
+
+def load_result(data):
+    """
+    :param data: value given by dump_result()
+    :return: testop.Operator having same results
+    """
+    device, result, no_passed, no_failed, retention, test_details = data
+    op = Operator(retention=retention)
+    op.device = device
+    op.result = result
+    op.no_passed = no_passed
+    op.no_failed = no_failed
+    op.test_details = defaultdict(list, test_details)
+    return op
+
+
+def _check(main_file, device, check, diff, db, snap_del, pre, action, post, retention):
+    comp = Comparator(retention=retention)
+    return dump_result(comp.generate_test_files(
+        main_file, device, check, diff, db, snap_del, pre, action, post))
+
+
+def run_check(pool, main_file, device, check, diff, db, snap_del,
+              pre=None, action=None, post=None, retention=None):
+    """
+    Run Comparator.generate_test_files() on a process of pool, calling thread
+    waits for its result
+    :param pool: pool given by get_pool()
+    :param retention: result retention of Comparator
+    :return: object of testop.Operator containing test details
+    """
+    return load_result(pool.apply(
+        _check, (main_file, device, check, diff, db, snap_del, pre, action, post, retention)))
@@ -0,0 +1,241 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+"""
+Compression of snapshots stored in files and database.
+Compressed data starts with a header naming its compression format, so
+compressed and plain snapshots can be read in the same way. Format is never
+guessed from magic bytes of data: plain text output can start like them.
+"""
+
+import bz2
+import zlib
+import logging
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CODEC = 'gzip'
+
+# header of compressed data, followed by name of format and a newline. Plain
+# XML or text output never starts with a NUL byte
+_HEADER = '\x00jsnapy-compressed:'
+_HEADER_MAX = len(_HEADER) + 8
+
+
+def available_codecs():
+    """
+    :return: list of compression formats usable on this system
+    """
+    codecs = ['gzip', 'zlib', 'bz2']
+    if lzma is not None:
+        codecs.append('lzma')
+    if zstandard is not None:
+        codecs.append('zstd')
+    return codecs
+
+
+def get_codec(name):
+    """
+    Validate compression format given in main config file
+    :param name: gzip, zlib, bz2, lzma or zstd. yes/True means default format
+    :return: name of format to be used, None if compression is not required
+    """
+    if name is None or name is False or str(name).lower() in ('no', 'none', 'false'):
+        return None
+    if name is True or str(name).lower() in ('yes', 'true'):
+        return DEFAULT_CODEC
+    name = str(name).lower()
+    if name not in available_codecs():
+        logger.warning(
+            "Compression format %s is not available, using %s instead" %
+            (name, DEFAULT_CODEC))
+        return DEFAULT_CODEC
+    return name
+
+
+def detect(data):
+    """
+    :param data: starting bytes of snapshot
+    :return: compression format of data, None if data is not compressed
+    """
+    if not data.startswith(_HEADER):
+        return None
+    codec, sep, _ = data[len(_HEADER):_HEADER_MAX].partition('\n')
+    return codec if sep else None
+
+
+def _header_size(codec):
+    return len(_HEADER) + len(codec) + 1
+
+
+def compress(data, codec=DEFAULT_CODEC):
+    """
+    :param data: snapshot data
+    :param codec: compression format
+    :return: compressed data, with header naming its format
+    """
+    if codec == 'gzip':
+        payload = _gzip_compress(data)
+    elif codec == 'zlib':
+        payload = zlib.compress(data)
+    elif codec == 'bz2':
+        payload = bz2.compress(data)
+    elif codec == 'lzma':
+        payload = lzma.compress(data)
+    elif codec == 'zstd':
+        payload = zstandard.ZstdCompressor().compress(data)
+    else:
+        raise ValueError("Unknown compression format %s" % codec)
+    return _HEADER + codec + '\n' + payload
+
+
+def _gzip_compress(data):
+    # gzip container written by zlib, avoids writing through a GzipFile object
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data):
+    """
+    :param data: snapshot data, compressed or not
+    :return: uncompressed data
+    """
+    codec = detect(data)
+    if codec is None:
+        return data
+    if codec == 'zstd':
+        return _require(zstandard, codec).ZstdDecompressor().decompressobj().decompress(
+            data[_header_size(codec):])
+    return _reader(_StringReader(data, _header_size(codec)), codec).read()
+
+
+def _require(module, codec):
+    if module is None:
+        raise IOError("Snapshot is compressed using %s, which is not available" % codec)
+    return module
+
+
+class _StringReader(object):
+
+    def __init__(self, data, start):
+        self.data = data
+        self.pos = start
+
+    def read(self, size=-1):
+        end = len(self.data) if size is None or size < 0 else self.pos + size
+        chunk = self.data[self.pos:end]
+        self.pos += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+class DecompressReader(object):
+
+    """
+    File like object decompressing a stream while it is read
+    """
+
+    def __init__(self, fileobj, decompressor):
+        """
+        :param fileobj: file positioned at start of compressed data
+        :param decompressor: object of zlib/bz2/lzma decompressor type
+        """
+        self.fileobj = fileobj
+        self.decompressor = decompressor
+
+    def _flush(self):
+        flush = getattr(self.decompressor, 'flush', None)
+        return flush() if flush is not None else ''
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.decompressor.decompress(self.fileobj.read()) + self._flush()
+        data = ''
+        while not data:
+            chunk = self.fileobj.read(size)
+            if not chunk:
+                return self._flush()
+            data = self.decompressor.decompress(chunk)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+def _reader(fileobj, codec):
+    """
+    :param fileobj: file positioned after header of compressed data
+    :param codec: compression format given in header
+    :return: file like object giving uncompressed data
+    """
+    if codec == 'gzip':
+        return DecompressReader(fileobj, zlib.decompressobj(16 + zlib.MAX_WBITS))
+    if codec == 'zlib':
+        return DecompressReader(fileobj, zlib.decompressobj())
+    if codec == 'bz2':
+        return DecompressReader(fileobj, bz2.BZ2Decompressor())
+    if codec == 'lzma':
+        return DecompressReader(fileobj, _require(lzma, codec).LZMADecompressor())
+    if codec == 'zstd':
+        return _require(zstandard, codec).ZstdDecompressor().stream_reader(fileobj)
+    raise IOError("Snapshot is compressed using unknown format %s" % codec)
+
+
+def file_codec(filename):
+    """
+    :param filename: snapshot file
+    :return: compression format of file, None if it is not compressed
+    """
+    with open(filename, 'rb') as f:
+        return detect(f.read(_HEADER_MAX))
+
+
+def open_snapshot(filename):
+    """
+    Open snapshot file for reading, compressed file is decompressed while
+    it is read
+    :param filename: snapshot file
+    :return: file like object
+    """
+    f = open(filename, 'rb')
+    try:
+        codec = detect(f.read(_HEADER_MAX))
+        if codec is None:
+            f.seek(0)
+            return f
+        f.seek(_header_size(codec))
+        return _reader(f, codec)
+    except Exception:
+        f.close()
+        raise
+
+
+def read_snapshot(filename):
+    """
+    :param filename: snapshot file
+    :return: uncompressed content of file
+    """
+    f = open_snapshot(filename)
+    try:
+        return f.read()
+    finally:
+        f.close()
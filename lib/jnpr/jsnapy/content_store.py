@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+"""
+Content addressed storage of snapshot files.
+Snapshot data is written once in blob directory, under name of its sha1 digest,
+and every snapshot file having same data is a hard link to that blob. Snapshots
+which are links to same blob are known to be identical without reading them.
+Digest of a snapshot file is kept in a sidecar file next to it, so that
+snapshots can be compared without reading them again.
+"""
+
+import os
+import errno
+import hashlib
+import thread
+import tempfile
+import threading
+
+BLOB_DIR = '.blobs'
+DIGEST_SUFFIX = '.sha1'
+CHUNK_SIZE = 64 * 1024
+
+_digest_lock = threading.Lock()
+_digests = {}
+
+# umask can only be read by setting it, done once while importing and not
+# while threads of devices create files
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def digest(data):
+    """
+    :param data: snapshot data
+    :return: sha1 hex digest of data
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def blob_dir(snap_file):
+    """
+    :param snap_file: snapshot file name
+    :return: blob directory used for snapshots stored next to snap_file
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(snap_file)), BLOB_DIR)
+
+
+def write_new(path, data):
+    """
+    Write file in a temporary file first and rename it, so that readers never
+    see partial data and an existing file (possibly a link to a blob shared by
+    other snapshots) is replaced instead of being written through. File gets
+    same mode as one created by open(), not 0600 of temporary files.
+    :param path: file name
+    :param data: file content
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        os.fchmod(fd, 0o666 & ~_umask)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def store_file(data, snap_file):
+    """
+    Write snapshot file as hard link to blob holding data, blob is created
+    if no earlier snapshot had same data. Falls back to a regular file where
+    hard links are not supported.
+    :param data: snapshot data
+    :param snap_file: snapshot file name
+    """
+    blobs = blob_dir(snap_file)
+    blob = os.path.join(blobs, digest(data))
+    try:
+        os.makedirs(blobs)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+    # blob can be removed by sweep() of another run between its creation and
+    # linking, in that case it is created once again
+    for _ in range(2):
+        if not os.path.isfile(blob):
+            write_new(blob, data)
+        # device threads of a run may store same data at the same time
+        tmp = os.path.join(os.path.dirname(os.path.abspath(snap_file)),
+                           '.tmp%d_%d_%s' % (os.getpid(), thread.get_ident(),
+                                             os.path.basename(blob)))
+        try:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            os.link(blob, tmp)
+        except AttributeError:
+            break
+        except OSError as ex:
+            if ex.errno == errno.ENOENT:
+                continue
+            break
+        try:
+            os.rename(tmp, snap_file)
+        except OSError:
+            break
+        finally:
+            # rename does nothing if snapshot is already a link to same blob
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+        return
+    write_new(snap_file, data)
+
+
+def sweep(snap_dir):
+    """
+    Remove blobs no longer linked to any snapshot file
+    :param snap_dir: directory holding snapshot files
+    """
+    blobs = os.path.join(snap_dir, BLOB_DIR)
+    if not os.path.isdir(blobs):
+        return
+    for name in os.listdir(blobs):
+        path = os.path.join(blobs, name)
+        try:
+            if not name.startswith('.tmp') and os.stat(path).st_nlink == 1:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def digest_record(data):
+    """
+    :param data: snapshot data
+    :return: content of digest sidecar file of snapshot having given data
+    """
+    return "sha1 %s %d\n" % (digest(data), len(data))
+
+
+def _read_sidecar(snap_file, st):
+    # sidecar is valid only if written after snapshot and for same size of data
+    sidecar = snap_file + DIGEST_SUFFIX
+    try:
+        if os.stat(sidecar).st_mtime < st.st_mtime:
+            return None
+        with open(sidecar) as f:
+            algo, hexdigest, size = f.read().split()
+    except (OSError, IOError, ValueError):
+        return None
+    if algo != 'sha1' or int(size) != st.st_size:
+        return None
+    return hexdigest
+
+
+def file_digest(snap_file, st=None):
+    """
+    Digest of snapshot file, taken from its sidecar file if present and up to
+    date, otherwise computed by reading file in chunks. Computed digests are
+    remembered till file changes.
+    :param snap_file: snapshot file name
+    :param st: os.stat() of snap_file, if already known
+    :return: sha1 hex digest of file content
+    """
+    if st is None:
+        st = os.stat(snap_file)
+    key = os.path.abspath(snap_file)
+    stamp = (st.st_ino, st.st_mtime, st.st_size)
+    with _digest_lock:
+        known = _digests.get(key)
+    if known is not None and known[0] == stamp:
+        return known[1]
+    hexdigest = _read_sidecar(snap_file, st)
+    if hexdigest is None:
+        sha = hashlib.sha1()
+        with open(snap_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+                sha.update(chunk)
+        hexdigest = sha.hexdigest()
+    with _digest_lock:
+        _digests[key] = (stamp, hexdigest)
+    return hexdigest
+
+
+def same_file(snap_file1, snap_file2):
+    """
+    Check if two snapshot files hold same data, without parsing them.
+    Files linked to same blob are identical, files of different size are not,
+    otherwise their digests are compared.
+    :return: True if both files have same content
+    """
+    try:
+        st1 = os.stat(snap_file1)
+        st2 = os.stat(snap_file2)
+    except OSError:
+        return False
+    if (st1.st_dev, st1.st_ino) == (st2.st_dev, st2.st_ino):
+        return True
+    if st1.st_size != st2.st_size:
+        return False
+    return file_digest(snap_file1, st1) == file_digest(snap_file2, st2)
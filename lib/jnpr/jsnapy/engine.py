@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+"""
+Execution engine for device sessions of large fleets.
+Device jobs are queued on a shared engine which runs at most max_sessions of
+them at a time, across all runs of the process (CLI run or module calls made
+in parallel). Submitting a job gives a Future, callers wait for its result or
+add callbacks to it instead of blocking on each device.
+Sessions and RPCs of PyEZ are blocking, so a running job takes one thread,
+jobs waiting for a free session take none.
+"""
+
+import sys
+import threading
+from collections import deque
+
+# device sessions open at the same time when not given
+DEFAULT_MAX_SESSIONS = 100
+
+_engine_lock = threading.Lock()
+_engine = None
+
+
+class Future(object):
+
+    """
+    Result of a job, available once job is done
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def _finish(self, result, exc_info):
+        with self._cond:
+            self._result = result
+            self._exc_info = exc_info
+            self._done = True
+            self._cond.notify_all()
+            callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            func(self)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exc_info):
+        """
+        :param exc_info: sys.exc_info() of exception raised by job
+        """
+        self._finish(None, exc_info)
+
+    def add_done_callback(self, func):
+        """
+        :param func: called with this future once job is done, right away if
+                     job is already done
+        """
+        with self._cond:
+            if not self._done:
+                self._callbacks.append(func)
+                return
+        func(self)
+
+    def _wait(self, timeout):
+        with self._cond:
+            if not self._done:
+                self._cond.wait(timeout)
+            if not self._done:
+                raise RuntimeError("job not done in %s seconds" % timeout)
+
+    def result(self, timeout=None):
+        """
+        Wait till job is done
+        :param timeout: seconds to wait, None to wait as long as needed
+        :return: value returned by job, exception raised by job is raised again
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        :return: exception raised by job, None if it succeeded
+        """
+        self._wait(timeout)
+        return self._exc_info[1] if self._exc_info is not None else None
+
+
+def _call(future, func, args, kwargs):
+    try:
+        result = func(*args, **kwargs)
+    except BaseException:
+        future.set_exception(sys.exc_info())
+    else:
+        future.set_result(result)
+
+
+class Engine(object):
+
+    """
+    Runs submitted jobs in order of submission, at most max_sessions at a time.
+    Worker threads are started as needed and end when no job is waiting.
+    """
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS):
+        """
+        :param max_sessions: maximum number of jobs running at the same time
+        """
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._workers = 0
+        # workers running a job, others are about to take next pending job
+        self._running = 0
+        self.max_sessions = max(int(max_sessions), 1)
+
+    def set_max_sessions(self, max_sessions):
+        """
+        Change number of jobs running at the same time, running jobs are not
+        stopped if it is lowered
+        """
+        with self._lock:
+            self.max_sessions = max(int(max_sessions), 1)
+        self._dispatch()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue job, it is run as soon as a session is free
+        :param func: job, called with args and kwargs
+        :return: Future of job
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append((future, func, args, kwargs))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        # one worker for each pending job not taken by an idle worker
+        with self._lock:
+            start = min(self.max_sessions - self._workers,
+                        len(self._pending) - (self._workers - self._running))
+            start = max(start, 0)
+            self._workers += start
+        for _ in range(start):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+
+    def _worker(self):
+        job = None
+        while True:
+            with self._lock:
+                if job is not None:
+                    self._running -= 1
+                if not self._pending or self._workers > self.max_sessions:
+                    self._workers -= 1
+                    return
+                job = self._pending.popleft()
+                self._running += 1
+            _call(*job)
+
+
+def get_engine(max_sessions=None):
+    """
+    Engine shared by the whole process
+    :param max_sessions: if given, changes number of sessions of shared engine
+    :return: Engine
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = Engine(max_sessions or DEFAULT_MAX_SESSIONS)
+            return _engine
+    if max_sessions is not None and max_sessions != _engine.max_sessions:
+        _engine.set_max_sessions(max_sessions)
+    return _engine
+
+
+def spawn(func, *args, **kwargs):
+    """
+    Run job on a thread of its own, not counted as a session. Used for jobs
+    which only wait for device jobs of engine, so that they never hold a
+    session needed by them.
+    :return: Future of job
+    """
+    future = Future()
+    thread = threading.Thread(target=_call, args=(future, func, args, kwargs))
+    thread.daemon = True
+    thread.start()
+    return future
@@ -7,6 +7,7 @@
 
 import os
 import sys
+import time
 import yaml
 import Queue
 import getpass
@@ -15,10 +16,14 @@ import textwrap
 import argparse
 import colorama
 import setup_logging
-from threading import Thread
+from threading import Thread, Lock
 from copy import deepcopy
 from jnpr.jsnapy.snap import Parser
 from jnpr.jsnapy.check import Comparator
+from jnpr.jsnapy import plans
+from jnpr.jsnapy import engine
+from jnpr.jsnapy import checkpool
+from jnpr.jsnapy import sqlite_store
 from jnpr.jsnapy.notify import Notification
 from jnpr.junos import Device
 from jnpr.jsnapy import version
@@ -29,6 +34,24 @@ from jnpr.junos.exception import ConnectAuthError
 logging.getLogger("paramiko").setLevel(logging.WARNING)
 colorama.init(autoreset=True)
 
+# number of devices connected in parallel when neither --workers nor
+# max_workers in main config file is given
+DEFAULT_WORKERS = 10
+
+# devices run on several threads, only one of them asks user for username or
+# password at a time so that prompts and typed input are not mixed
+_prompt_lock = Lock()
+
+
+def _ask(func, prompt):
+    """
+    :param func: raw_input or getpass.getpass
+    :param prompt: prompt shown to user
+    :return: value entered by user
+    """
+    with _prompt_lock:
+        return func(prompt)
+
 class SnapAdmin:
 
     # need to call this function to initialize logging
@@ -39,10 +62,11 @@ class SnapAdmin:
         taking parameters from command line
         """
         colorama.init(autoreset=True)
-        self.q = Queue.Queue()
-        self.snap_q = Queue.Queue()
         self.log_detail = {'hostname': None}
         self.snap_del = False
+        self.retention = None
+        # replies of devices kept by in memory snapcheck till they are tested
+        self.live_replies = {}
         self.logger = logging.getLogger(__name__)
         self.parser = argparse.ArgumentParser(
             formatter_class=argparse.RawTextHelpFormatter,
@@ -140,6 +164,21 @@ class SnapAdmin:
             -vvvv: Error level messages
             -vvvvv: Critical level messages''')
         )
+        self.parser.add_argument(
+            "-w", "--workers",
+            help="maximum number of devices handled in parallel (default: %d)" %
+            DEFAULT_WORKERS,
+            type=int)
+        self.parser.add_argument(
+            "--max-sessions",
+            dest="max_sessions",
+            help="run devices on shared session engine, with at most given "
+            "number of device sessions open at a time",
+            type=int)
+        self.parser.add_argument(
+            "--processes",
+            help="number of processes evaluating checks of devices in parallel",
+            type=int)
        # self.parser.add_argument(
        #     "-m",
        #     "--mail",
@@ -161,6 +200,10 @@ class SnapAdmin:
         self.db['db_name'] = ""
         self.db['first_snap_id'] = None
         self.db['second_snap_id'] = None
+        # set by *_async functions, devices are then always run on engine
+        self.use_engine = False
+        # process pool running checks of devices, while devices are running
+        self.check_pool = None
 
     def get_version(self):
         """
@@ -233,6 +276,11 @@ class SnapAdmin:
                                             # "check")):
             if d.__contains__('database_name'):
                 self.db['db_name'] = d['database_name']
+                # retention of snapshots in database, default is 50 snapshots per command
+                if 'max_snapshots' in d:
+                    self.db['max_snapshots'] = d['max_snapshots']
+                if 'max_snapshot_age' in d:
+                    self.db['max_age_days'] = d['max_snapshot_age']
 
             else:
                 self.logger.error(
@@ -326,15 +374,20 @@ class SnapAdmin:
                                   extra=self.log_detail)
                 self.parser.print_help()
                 sys.exit(1)
+        # processes of check pool are forked before any thread is running
+        if snap is not True:
+            self.start_check_pool(self.main_file)
         self.login(output_file)
 
-    def generate_rpc_reply(self, dev, output_file, hostname, config_data):
+    def generate_rpc_reply(self, dev, output_file, hostname, config_data, snapcheck=False):
         """
         Generates rpc-reply based on command/rpc given and stores them in snap_files
         :param dev: device handler
         :param output_file: filename to store snapshots
         :param hostname: hostname of device
         :param config_data : data of main config file
+        :param snapcheck: True if replies are tested right after, replies are
+                          then kept in memory if in_memory is set in main config file
         """
         val = None
         test_files = []
@@ -346,17 +399,27 @@ class SnapAdmin:
                         'test_file_path'),
                     tfile)
             if os.path.isfile(tfile):
-                test_file = open(tfile, 'r')
-                test_files.append(yaml.load(test_file))
+                test_files.append(plans.load_test_file(tfile).data)
             else:
                 self.logger.error(
                     colorama.Fore.RED +
                     "ERROR!! File %s is not found for taking snapshots" %
                     tfile, extra=self.log_detail)
 
-        g = Parser()
+        in_memory = snapcheck and bool(config_data.get('in_memory', False))
+        # snapshots of in memory snapcheck are written while next commands run,
+        # or not at all if persist is off. Snapshots of snapcheck are tested
+        # right away, never compared by --diff, so they get no hash index
+        g = Parser(pipeline=bool(config_data.get('pipeline', False)) or in_memory,
+                   compress=config_data.get('compression'),
+                   dedup=bool(config_data.get('deduplicate', False)),
+                   persist=not in_memory or bool(config_data.get('persist', True)),
+                   merkle_index=not snapcheck and
+                   bool(config_data.get('merkle_index', False)))
         for tests in test_files:
             val = g.generate_reply(tests, dev, output_file, hostname, self.db)
+        if in_memory:
+            self.live_replies[hostname] = g.reply_trees
         return val
 
     def compare_tests(
@@ -368,32 +431,46 @@ class SnapAdmin:
         :param hostname: device name
         :return: return object of Operator containing test details
         """
-        comp = Comparator()
+        comp = Comparator(retention=self.retention)
         chk = self.args.check
         diff = self.args.diff
         pre_snap_file = self.args.pre_snapfile if pre_snap is None else pre_snap
         if (chk or diff or action in ["check", "diff"]):
             post_snap_file = self.args.post_snapfile if post_snap is None else post_snap
-            test_obj = comp.generate_test_files(
-                config_data,
-                hostname,
-                chk,
-                diff,
-                self.db,
-                self.snap_del,
-                pre_snap_file,
-                action,
-                post_snap_file)
+            if self.check_pool is not None:
+                # evaluated by a process of pool, reading snapshots by name
+                test_obj = checkpool.run_check(
+                    self.check_pool, config_data, hostname, chk, diff, self.db,
+                    self.snap_del, pre_snap_file, action, post_snap_file,
+                    self.retention)
+            else:
+                test_obj = comp.generate_test_files(
+                    config_data,
+                    hostname,
+                    chk,
+                    diff,
+                    self.db,
+                    self.snap_del,
+                    pre_snap_file,
+                    action,
+                    post_snap_file)
         else:
-            test_obj = comp.generate_test_files(
-                config_data,
-                hostname,
-                chk,
-                diff,
-                self.db,
-                self.snap_del,
-                pre_snap_file,
-                action)
+            # replies taken by this snapcheck are tested without reading them back
+            comp.replies = self.live_replies.pop(hostname, None)
+            if comp.replies is None and self.check_pool is not None:
+                test_obj = checkpool.run_check(
+                    self.check_pool, config_data, hostname, chk, diff, self.db,
+                    self.snap_del, pre_snap_file, action, None, self.retention)
+            else:
+                test_obj = comp.generate_test_files(
+                    config_data,
+                    hostname,
+                    chk,
+                    diff,
+                    self.db,
+                    self.snap_del,
+                    pre_snap_file,
+                    action)
         return test_obj
 
     def get_values(self, key_value):
@@ -444,6 +521,7 @@ class SnapAdmin:
                     gp = k.get('group', 'all')
 
                     dgroup = [i.strip().lower() for i in gp.split(',')]
+                    device_jobs = []
                     for dgp in dev_file:
                         if dgroup[0].lower() == 'all' or dgp.lower() in dgroup:
                             for val in dev_file[dgp]:
@@ -466,18 +544,14 @@ class SnapAdmin:
                                     # getpass.getpass("\nEnter Password for
                                     # username: %s " %username)
                                 key_value = self.get_values(key_value)
-                                t = Thread(
-                                    target=self.connect,
-                                    args=(
-                                        hostname,
-                                        username,
-                                        password,
-                                        output_file
-                                    ),
-                                    kwargs= key_value
-                                )
-                                t.start()
-                                t.join()
+                                device_jobs.append(
+                                    (hostname,
+                                     (hostname, username, password, output_file),
+                                     key_value))
+                    self.run_devices(
+                        device_jobs,
+                        self.get_workers(self.main_file),
+                        self.get_engine(self.main_file))
             # login credentials are given in main config file, can connect to only
             # one device
                 else:
@@ -519,6 +593,147 @@ class SnapAdmin:
             key_value = {'port': port} if port is not None else {}
             self.connect(hostname, username, password, output_file, **key_value)
 
+    def get_workers(self, config_data):
+        """
+        Number of devices to be handled in parallel. Value given from command line
+        (--workers) takes precedence over "max_workers" in main config file
+        :param config_data: data of main config file
+        :return: number of worker threads, at least 1
+        """
+        workers = getattr(self.args, 'workers', None)
+        if workers is None and isinstance(config_data, dict):
+            workers = config_data.get('max_workers')
+        try:
+            workers = int(workers) if workers is not None else DEFAULT_WORKERS
+        except (TypeError, ValueError):
+            self.logger.error(
+                colorama.Fore.RED +
+                "ERROR!! max_workers should be a number, using default value %d" %
+                DEFAULT_WORKERS, extra=self.log_detail)
+            workers = DEFAULT_WORKERS
+        return max(workers, 1)
+
+    def get_engine(self, config_data):
+        """
+        Shared session engine devices are run on. It is used when number of
+        sessions is given from command line (--max-sessions) or as
+        "max_sessions" in main config file, or when *_async functions are used
+        :param config_data: data of main config file
+        :return: engine.Engine, None if devices are run on worker threads
+        """
+        max_sessions = getattr(self.args, 'max_sessions', None)
+        if max_sessions is None and isinstance(config_data, dict):
+            max_sessions = config_data.get('max_sessions')
+        if max_sessions is None and not self.use_engine:
+            return None
+        try:
+            max_sessions = int(max_sessions) if max_sessions is not None else None
+        except (TypeError, ValueError):
+            self.logger.error(
+                colorama.Fore.RED +
+                "ERROR!! max_sessions should be a number, using default value %d" %
+                engine.DEFAULT_MAX_SESSIONS, extra=self.log_detail)
+            max_sessions = None
+        return engine.get_engine(max_sessions)
+
+    def start_check_pool(self, config_data):
+        """
+        Use processes evaluating checks of devices, when their number is given
+        from command line (--processes) or as "check_processes" in main config
+        file. Pool is shared by all calls and started by first one, so it is
+        called before any thread is started: by get_hosts(), snapcheck(),
+        check() and by *_async functions before spawning their thread.
+        :param config_data: data of main config file
+        """
+        processes = getattr(self.args, 'processes', None)
+        if processes is None and isinstance(config_data, dict):
+            processes = config_data.get('check_processes')
+        self.check_pool = None
+        if processes is None:
+            return
+        try:
+            processes = int(processes)
+        except (TypeError, ValueError):
+            self.logger.error(
+                colorama.Fore.RED +
+                "ERROR!! check_processes should be a number, checks are run "
+                "by device threads", extra=self.log_detail)
+            return
+        if processes > 0:
+            self.check_pool = checkpool.get_pool(processes)
+
+    def stop_check_pool(self):
+        """
+        End processes of shared check pool, once no check is running. It is
+        also ended at exit.
+        """
+        self.check_pool = None
+        checkpool.shutdown()
+
+    def connect_device(self, hostname, args, kwargs):
+        """
+        Calls connect function for one device and logs time taken by it.
+        Any exception is logged so that it does not stop other devices.
+        :param hostname: ip/ hostname of device
+        :param args: positional arguments for connect function
+        :param kwargs: keyword arguments for connect function
+        :return: value returned by connect function, None in case of error
+        """
+        log_detail = {'hostname': hostname}
+        res = None
+        start = time.time()
+        try:
+            res = self.connect(*args, **kwargs)
+        except Exception as ex:
+            self.logger.error(
+                colorama.Fore.RED +
+                "ERROR!! Device %s failed: %s" %
+                (hostname, str(ex)), extra=log_detail)
+        finally:
+            self.logger.info(
+                colorama.Fore.BLUE +
+                "Device %s done in %.2f seconds" %
+                (hostname, time.time() - start), extra=log_detail)
+        return res
+
+    def run_devices(self, device_jobs, workers, session_engine=None):
+        """
+        Run connect function for all devices using a fixed number of worker threads.
+        :param device_jobs: list of (hostname, args, kwargs) for each device
+        :param workers: maximum number of devices handled at the same time
+        :param session_engine: optional engine.Engine, devices are then queued
+                               on it and workers is not used
+        :return: list of results of connect function, in same order as device_jobs
+        """
+        if session_engine is not None:
+            futures = [session_engine.submit(self.connect_device, hostname, args, kwargs)
+                       for hostname, args, kwargs in device_jobs]
+            results = [future.result() for future in futures]
+            sqlite_store.remove_unused_blobs()
+            return results
+        results = [None] * len(device_jobs)
+        jobs = Queue.Queue()
+        for index, job in enumerate(device_jobs):
+            jobs.put((index,) + tuple(job))
+
+        def worker():
+            while True:
+                try:
+                    index, hostname, args, kwargs = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                results[index] = self.connect_device(hostname, args, kwargs)
+
+        threads = [Thread(target=worker)
+                   for _ in range(min(workers, len(device_jobs)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # data of snapshots pruned by devices of this run
+        sqlite_store.remove_unused_blobs()
+        return results
+
     def get_test(self, config_data, hostname, snap_file, post_snap, action):
         """
         Analyse testfile and return object of testop.Operator containing test details
@@ -561,8 +776,6 @@ class SnapAdmin:
                 snap_file,
                 post_snap,
                 action)
-
-        self.q.put(res)
         return res
 
     def connect(self, hostname, username, password, output_file,
@@ -578,6 +791,7 @@ class SnapAdmin:
                  if snapcheck or check operation is performed then return test details
         """
         res = None
+        log_detail = {'hostname': hostname}
         if config_data is None:
             config_data = self.main_file
 
@@ -585,9 +799,9 @@ class SnapAdmin:
                 "snap", "snapcheck"]:
             self.logger.info(
                 colorama.Fore.BLUE +
-                "Connecting to device %s ................", hostname, extra=self.log_detail)
+                "Connecting to device %s ................", hostname, extra=log_detail)
             if username is None:
-                username = raw_input("\nEnter User name: ")
+                username = _ask(raw_input, "\nEnter User name: ")
             dev = Device(
                 host=hostname,
                 user=username,
@@ -598,7 +812,8 @@ class SnapAdmin:
                 dev.open()
             except ConnectAuthError as ex:
                 if password is None and action is None:
-                    password = getpass.getpass(
+                    password = _ask(
+                        getpass.getpass,
                         "\nEnter Password for username <%s> : " %
                         username)
                     self.connect(
@@ -613,21 +828,21 @@ class SnapAdmin:
                     self.logger.error(colorama.Fore.RED +
                                       "\nERROR occurred %s" %
                                       str(ex),
-                                      extra=self.log_detail)
+                                      extra=log_detail)
                     raise Exception(ex)
             except Exception as ex:
                 self.logger.error(colorama.Fore.RED +
                                   "\nERROR occurred %s" %
                                   str(ex),
-                                  extra=self.log_detail)
+                                  extra=log_detail)
                 raise Exception(ex)
             else:
                 res = self.generate_rpc_reply(
                     dev,
                     output_file,
                     hostname,
-                    config_data)
-                self.snap_q.put(res)
+                    config_data,
+                    self.args.snapcheck is True or action == "snapcheck")
                 dev.close()
         if self.args.check is True or self.args.snapcheck is True or self.args.diff is True or action in [
                 "check", "snapcheck"]:
@@ -652,7 +867,7 @@ class SnapAdmin:
         :param post_name: post snapshot filename or file tag
         :return: return object of testop.Operator containing test details
         """
-        res_obj = []
+        device_jobs = []
         self.host_list = []
         login_file = host['include']
         login_file = login_file if os.path.isfile(
@@ -675,26 +890,15 @@ class SnapAdmin:
                     password = val.get(hostname).get('passwd')
                     key_value = val.get(hostname)
                     key_value= self.get_values(key_value)
-                    t = Thread(
-                        target=self.connect,
-                        args=(
-                            hostname,
-                            username,
-                            password,
-                            pre_name,
-                            config_data,
-                            action,
-                            post_name),
-                        kwargs= key_value
-                    )
-                    t.start()
-                    if action == "snap":
-                        res_obj.append(self.snap_q.get())
-                    elif action in ["snapcheck", "check"]:
-                        res_obj.append(self.q.get())
-                    else:
-                        res_obj.append(None)
-                    t.join()
+                    device_jobs.append(
+                        (hostname,
+                         (hostname, username, password, pre_name,
+                          config_data, action, post_name),
+                         key_value))
+        res_obj = self.run_devices(device_jobs, self.get_workers(config_data),
+                                   self.get_engine(config_data))
+        if action not in ["snap", "snapcheck", "check"]:
+            res_obj = [None] * len(res_obj)
         return res_obj
 
     def extract_data(
@@ -757,15 +961,15 @@ class SnapAdmin:
                 #pre_name = hostname + '_' + pre_name if not os.path.isfile(pre_name) else pre_name
                 # if action is "check":
                 #    post_name= hostname + '_' + post_name if not os.path.isfile(post_name) else post_name
-                val.append(self.connect(
-                    hostname,
-                    username,
-                    password,
-                    pre_name,
-                    config_data,
-                    action,
-                    post_name,
-                    **key_value))
+                args = (hostname, username, password, pre_name,
+                        config_data, action, post_name)
+                session_engine = self.get_engine(config_data)
+                if session_engine is not None:
+                    # waits for a free session, like devices of other calls
+                    val.append(session_engine.submit(
+                        self.connect, *args, **key_value).result())
+                else:
+                    val.append(self.connect(*args, **key_value))
                 return val
 
     def extract_dev_data(
@@ -819,7 +1023,8 @@ class SnapAdmin:
                         dev,
                         pre_name,
                         hostname,
-                        config_data))
+                        config_data,
+                        action == "snapcheck"))
                 except Exception as ex:
                     self.logger.error(colorama.Fore.RED +
                                       "\nERROR occurred %s" %
@@ -851,14 +1056,19 @@ class SnapAdmin:
             res = self.extract_data(data, file_name, "snap")
         return res
 
-    def snapcheck(self, data, file_name=None, dev=None):
+    def snapcheck(self, data, file_name=None, dev=None, retention=None):
         """
         Function equivalent to --snapcheck operator, for module version
         :param data: either main config file or string containing details of main config file
         :param pre_file: pre snap file, either complete filename or file tag
         :param dev: device object
+        :param retention: test details kept, 'all', 'failures-only' or 'counts-only'.
+                          If not given, result_retention of main config file is used
         :return: return object of testop.Operator containing test details
         """
+        self.retention = retention
+        # started here, before threads of devices
+        self.start_check_pool(self._config_dict(data))
         if file_name is None:
             file_name = "snap_temp"
             self.snap_del = True
@@ -868,15 +1078,19 @@ class SnapAdmin:
             res = self.extract_data(data, file_name, "snapcheck")
         return res
 
-    def check(self, data, pre_file=None, post_file=None, dev=None):
+    def check(self, data, pre_file=None, post_file=None, dev=None, retention=None):
         """
         Function equivalent to --check operator, for module version
         :param data: either main config file or string containing details of main config file
         :param pre_file: pre snap file, either complete filename or file tag
         :param post_file: post snap file, either complete filename or file tag
         :param dev: device object
+        :param retention: test details kept, 'all', 'failures-only' or 'counts-only'.
+                          If not given, result_retention of main config file is used
         :return: return object of testop.Operator containing test details
         """
+        self.retention = retention
+        self.start_check_pool(self._config_dict(data))
         if isinstance(dev, Device):
             res = self.extract_dev_data(
                 dev,
@@ -888,6 +1102,57 @@ class SnapAdmin:
             res = self.extract_data(data, pre_file, "check", post_file)
         return res
 
+    def _config_dict(self, data):
+        """
+        :param data: main config file, string containing its details or its data
+        :return: data of main config file, None if it can not be read
+        """
+        if isinstance(data, dict):
+            return data
+        try:
+            if os.path.isfile(data):
+                with open(data, 'r') as f:
+                    return yaml.load(f)
+            return yaml.load(data)
+        except Exception:
+            return None
+
+    def _run_on_engine(self, func, *args):
+        """
+        Call func with its devices run on shared session engine
+        """
+        self.use_engine = True
+        try:
+            return func(*args)
+        finally:
+            self.use_engine = False
+
+    def snap_async(self, data, file_name, dev=None):
+        """
+        Same as snap(), run in background. Devices are run on shared session
+        engine, so that calls made in parallel never open more sessions than
+        max_sessions. Use one SnapAdmin object for each call running at a time.
+        :return: engine.Future, giving value returned by snap()
+        """
+        return engine.spawn(self._run_on_engine, self.snap, data, file_name, dev)
+
+    def snapcheck_async(self, data, file_name=None, dev=None, retention=None):
+        """
+        Same as snapcheck(), run in background on shared session engine
+        :return: engine.Future, giving value returned by snapcheck()
+        """
+        # check pool given in main config file is started before any thread
+        self.start_check_pool(self._config_dict(data))
+        return engine.spawn(self._run_on_engine, self.snapcheck, data, file_name, dev, retention)
+
+    def check_async(self, data, pre_file=None, post_file=None, dev=None, retention=None):
+        """
+        Same as check(), run in background on shared session engine
+        :return: engine.Future, giving value returned by check()
+        """
+        self.start_check_pool(self._config_dict(data))
+        return engine.spawn(self._run_on_engine, self.check, data, pre_file, post_file, dev, retention)
+
     #######  generate init folder ######
     '''
     def generate_init(self):
@@ -979,6 +1244,8 @@ def main():
             except Exception as ex:
                 js.logger.error(colorama.Fore.RED +
                                 "ERROR!! %s \nComplete Message:  %s" % (type(ex).__name__, str(ex)), extra=js.log_detail)
+            finally:
+                js.stop_check_pool()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+"""
+Hash index of snapshot subtrees.
+Every node of a snapshot gets a digest of its tag, attributes, text, tail and
+of digests of its children, computed when snapshot is taken if merkle_index is
+set in main config file. Two subtrees having
+same digest have no difference for --diff, so snapshots are compared by
+descending only into subtrees whose digests differ.
+Index lists digest and size (number of nodes) of every subtree in document
+order: first child of node i is node i + 1, and next sibling of a node is found
+by skipping its size.
+"""
+
+import sys
+import hashlib
+from array import array
+from jnpr.jsnapy import compression
+from jnpr.jsnapy import content_store
+
+MERKLE_SUFFIX = '.merkle'
+_MAGIC = 'merkle1'
+_DIGEST_SIZE = 20
+
+
+def _text(value):
+    # same normalization as XmlComparator.text_compare()
+    value = (value or '').strip()
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value
+
+
+def _node_digest(node, children):
+    sha = hashlib.sha1()
+    tag = node.tag
+    if not isinstance(tag, basestring):
+        # comments and processing instructions
+        tag = '<!%s>' % type(node).__name__
+    parts = [_text(tag), _text(node.text), _text(node.tail)]
+    attrib = node.attrib
+    if attrib:
+        for name, value in sorted(attrib.items()):
+            parts.append(_text(name))
+            parts.append(value.encode('utf-8') if isinstance(value, unicode) else value)
+    sha.update('\0'.join(parts))
+    sha.update('\1')
+    for digest in children:
+        sha.update(digest)
+    return sha.digest()
+
+
+class MerkleIndex(object):
+
+    __slots__ = ('digests', 'sizes')
+
+    def __init__(self, digests, sizes):
+        """
+        :param digests: digests of all nodes, joined in document order
+        :param sizes: array of sizes of all subtrees, in document order
+        """
+        self.digests = digests
+        self.sizes = sizes
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def digest(self, pos):
+        """
+        :param pos: position of node in document order
+        :return: digest of subtree of node
+        """
+        start = pos * _DIGEST_SIZE
+        return self.digests[start:start + _DIGEST_SIZE]
+
+    def children(self, pos):
+        """
+        :param pos: position of node in document order
+        :return: positions of children of node
+        """
+        sizes = self.sizes
+        end = pos + sizes[pos]
+        child = pos + 1
+        children = []
+        while child < end:
+            children.append(child)
+            child += sizes[child]
+        return children
+
+    def dumps(self, data_digest):
+        """
+        :param data_digest: sha1 hex digest of snapshot data the index is made for
+        :return: serialized index
+        """
+        sizes = array('I', self.sizes)
+        if sys.byteorder != 'big':
+            sizes.byteswap()
+        return "%s %s %d\n" % (_MAGIC, data_digest, len(sizes)) + \
+            self.digests + sizes.tostring()
+
+    @classmethod
+    def loads(cls, blob, data_digest):
+        """
+        :param blob: serialized index, compressed or not
+        :param data_digest: sha1 hex digest of snapshot data
+        :return: MerkleIndex, None if blob is not a valid index of this data
+        """
+        blob = compression.decompress(blob)
+        header, sep, body = blob.partition('\n')
+        try:
+            magic, digest, count = header.split()
+            count = int(count)
+        except ValueError:
+            return None
+        if magic != _MAGIC or digest != data_digest or \
+                len(body) != count * (_DIGEST_SIZE + array('I').itemsize):
+            return None
+        digests = body[:count * _DIGEST_SIZE]
+        sizes = array('I')
+        sizes.fromstring(body[count * _DIGEST_SIZE:])
+        if sys.byteorder != 'big':
+            sizes.byteswap()
+        return cls(digests, sizes)
+
+
+def build(root):
+    """
+    Compute hash index of a tree
+    :param root: lxml Element
+    :return: MerkleIndex
+    """
+    nodes = list(root.iter())
+    digests = [None] * len(nodes)
+    sizes = array('I', [0]) * len(nodes)
+    # children are done before their parent when walking backwards, results of
+    # children of a node are on top of stack, its first child being topmost
+    stack = []
+    for pos in xrange(len(nodes) - 1, -1, -1):
+        node = nodes[pos]
+        count = len(node)
+        if count:
+            children = stack[-count:]
+            del stack[-count:]
+            children.reverse()
+        else:
+            children = ()
+        size = 1
+        for child in children:
+            size += sizes[child]
+        sizes[pos] = size
+        digests[pos] = _node_digest(node, [digests[child] for child in children])
+        stack.append(pos)
+    return MerkleIndex(''.join(digests), sizes)
+
+
+def write_file(snap_file, root, data, codec=None):
+    """
+    Write hash index of snapshot next to snapshot file
+    :param snap_file: snapshot file name
+    :param root: tree stored in snapshot file
+    :param data: data written in snapshot file
+    :param codec: compression format of snapshot, index is compressed alike
+    """
+    blob = build(root).dumps(content_store.digest(data))
+    if codec is not None:
+        blob = compression.compress(blob, codec)
+    # replaced at once like snapshot, never read half written
+    content_store.write_new(snap_file + MERKLE_SUFFIX, blob)
+
+
+def read_file(snap_file):
+    """
+    :param snap_file: snapshot file name
+    :return: hash index of snapshot, None if not present or not made for
+             current content of snapshot file
+    """
+    try:
+        with open(snap_file + MERKLE_SUFFIX, 'rb') as f:
+            blob = f.read()
+        data_digest = content_store.file_digest(snap_file)
+    except (OSError, IOError):
+        return None
+    return MerkleIndex.loads(blob, data_digest)
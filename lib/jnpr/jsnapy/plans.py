@@ -0,0 +1,296 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+"""
+Test files compiled once per process and shared by all devices.
+A test file is parsed only when its content changes: parsed data is kept in
+memory for the whole run and in a cache directory (plan_cache_path of
+jsnapy.cfg) as JSON under sha1 digest of file content, for next runs. Tests of each
+command are normalized the first time they are used: ids and nodes are split
+and default messages are made once, not once per device.
+"""
+
+import os
+import errno
+import hashlib
+import tempfile
+import threading
+import json
+import ConfigParser
+import yaml
+from jnpr.jsnapy import get_path
+from jnpr.jsnapy import streaming
+
+# bump when format of cached data changes
+PLAN_VERSION = '2'
+# cache directory under snapshot_path, when plan_cache_path is not given
+PLAN_DIR = '.plans'
+
+# C loader of libyaml is much faster, same documents are accepted by both
+_Loader = getattr(yaml, 'CLoader', yaml.Loader)
+
+_lock = threading.Lock()
+_plans = {}
+
+
+def default_err_mssg(path, ele_list):
+    """
+    :param path: test case of test file
+    :param ele_list: nodes tested
+    :return: err message of test case, default message if not given
+    """
+    return path.get('err', "Test FAILED: " +
+                    ele_list[
+                        0] + " before was < {{pre['" + ele_list[0] + "']}} >"
+                    " now it is < {{post['" + ele_list[0] + "']}} > ")
+
+
+def default_info_mssg(path, ele_list):
+    """
+    :param path: test case of test file
+    :param ele_list: nodes tested
+    :return: info message of test case, default message if not given
+    """
+    return path.get('info', "Test PASSED: " + ele_list[0] +
+                    " before was < {{pre['" +
+                    ele_list[0] +
+                    "']}} > now it is < {{post['" +
+                    ele_list[0] +
+                    "']}} > ")
+
+
+class TestBlock(object):
+
+    """
+    One iterate or item block of a command, with its test cases as
+    (test operator, nodes, err message, info message)
+    """
+
+    __slots__ = ('x_path', 'id_list', 'iter', 'testcases')
+
+    def __init__(self, test):
+        if 'iterate' in test:
+            block = test.get('iterate')
+            testcases = block.get(
+                'tests', [{'Define test operator': 'tests not defined'}])
+            self.iter = True
+        else:
+            block = test.get('item')
+            testcases = test['item']['tests']
+            self.iter = False
+        self.x_path = block.get('xpath', "no_xpath")
+        if 'id' in block:
+            ids = block.get('id')
+            if isinstance(ids, list):
+                self.id_list = ids
+            else:
+                self.id_list = [val.strip() for val in ids.split(',')]
+        else:
+            self.id_list = []
+        self.testcases = []
+        for path in testcases:
+            testop = [tvalue for tvalue in path.keys() if tvalue not in ['err', 'info']]
+            testop = testop[0] if testop else "Define test operator"
+            ele = path.get(testop)
+            if ele is not None:
+                ele_list = [elements.strip() for elements in ele.split(',')]
+            else:
+                ele_list = ['no node']
+            self.testcases.append((testop, ele_list, default_err_mssg(path, ele_list),
+                                   default_info_mssg(path, ele_list)))
+
+
+class CommandPlan(object):
+
+    """
+    Tests of one command or RPC of a test file
+    """
+
+    def __init__(self, tests):
+        """
+        :param tests: test cases of command, as given in test file
+        """
+        if tests[0].keys()[0] == 'command':
+            command = tests[0].get('command').split('|')[0].strip()
+            self.name = '_'.join(command.split())
+            self.teston = command
+            self.is_command = True
+        else:
+            self.name = self.teston = tests[0]['rpc']
+            self.is_command = False
+        self.reply_format = tests[0].get('format', 'xml')
+        self.tests = [t for t in tests if ('iterate' in t or 'item' in t)]
+        self._blocks = None
+        self._stream_paths = False
+
+    def blocks(self):
+        """
+        :return: TestBlock of each iterate or item of command
+        """
+        if self._blocks is None:
+            self._blocks = [TestBlock(test) for test in self.tests]
+        return self._blocks
+
+    def stream_paths(self):
+        """
+        :return: streaming.stream_paths() of tests of command
+        """
+        if self._stream_paths is False:
+            self._stream_paths = streaming.stream_paths(self.tests)
+        return self._stream_paths
+
+
+class TestPlan(object):
+
+    """
+    Test file loaded once, tests of its commands are compiled when first used
+    """
+
+    def __init__(self, path, data):
+        """
+        :param path: test file name
+        :param data: parsed test file
+        """
+        self.path = path
+        self.data = data
+        self._commands = {}
+
+    @property
+    def tests_included(self):
+        """
+        :return: test cases to be run, all of them if tests_include is not given
+        """
+        if 'tests_include' in self.data:
+            return self.data.get('tests_include')
+        return [t for t in self.data]
+
+    def command(self, name):
+        """
+        :param name: name of test case
+        :return: CommandPlan of test case, errors of test file are raised
+                 every time it is asked for
+        """
+        plan = self._commands.get(name)
+        if plan is None:
+            plan = self._commands[name] = CommandPlan(self.data[name])
+        return plan
+
+
+def _native(value):
+    """
+    :param value: data decoded from JSON
+    :return: same data with types given by yaml: str for ascii text, unicode
+             for other text
+    """
+    if isinstance(value, unicode):
+        try:
+            return value.encode('ascii')
+        except UnicodeEncodeError:
+            return value
+    if isinstance(value, list):
+        return [_native(val) for val in value]
+    if isinstance(value, dict):
+        return dict((_native(key), _native(val)) for key, val in value.items())
+    return value
+
+
+def _cache_file(digest):
+    try:
+        try:
+            cache_dir = get_path('DEFAULT', 'plan_cache_path')
+        except ConfigParser.NoOptionError:
+            cache_dir = os.path.join(get_path('DEFAULT', 'snapshot_path'), PLAN_DIR)
+    except Exception:
+        return None
+    return os.path.join(cache_dir, digest + '.json')
+
+
+def _read_cache(cache_file):
+    # cache directory may be writable by other users, only files written by
+    # current user are trusted
+    try:
+        if os.stat(cache_file).st_uid != os.getuid():
+            return None
+        with open(cache_file, 'rb') as f:
+            return _native(json.load(f))
+    except Exception:
+        return None
+
+
+def _write_cache(cache_file, data):
+    # cache is written only if directory holding it exists, and never read
+    # partially written. Data which JSON can not hold as it is (dates, keys
+    # other than text) is not cached.
+    try:
+        content = json.dumps(data)
+    except (TypeError, ValueError):
+        return
+    if _native(json.loads(content)) != data:
+        return
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        os.mkdir(cache_dir)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            return
+    try:
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix='.tmp')
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.rename(tmp, cache_file)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _parse(content):
+    """
+    :param content: content of test file
+    :return: parsed content, taken from cache directory if parsed before
+    """
+    digest = hashlib.sha1(PLAN_VERSION + '\0' + content).hexdigest()
+    cache_file = _cache_file(digest)
+    if cache_file is not None:
+        data = _read_cache(cache_file)
+        if data is not None:
+            return data
+    data = yaml.load(content, Loader=_Loader)
+    if cache_file is not None and data is not None:
+        _write_cache(cache_file, data)
+    return data
+
+
+def load_test_file(test_file):
+    """
+    Return plan of test file, file is parsed again only if it changed since
+    last call
+    :param test_file: test file name
+    :return: TestPlan
+    """
+    path = os.path.abspath(test_file)
+    st = os.stat(path)
+    stamp = (st.st_ino, st.st_mtime, st.st_size)
+    with _lock:
+        known = _plans.get(path)
+    if known is not None and known[0] == stamp:
+        return known[1]
+    with open(path, 'rb') as f:
+        plan = TestPlan(path, _parse(f.read()))
+    with _lock:
+        _plans[path] = (stamp, plan)
+    return plan
+
+
+def clear():
+    """
+    Forget test files loaded earlier
+    """
+    with _lock:
+        _plans.clear()
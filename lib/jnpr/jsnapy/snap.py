@@ -8,23 +8,108 @@
 import os
 import re
 import sys
+import Queue
 import logging
 import colorama
+from threading import Thread
 from lxml import etree
 from jnpr.jsnapy import get_path
 from jnpr.junos.exception import RpcError
-from jnpr.jsnapy.sqlite_store import JsnapSqlite
+from jnpr.jsnapy.sqlite_store import JsnapSqlite, batch_writes
 import lxml
+import sqlite3
+from jnpr.jsnapy import compression
+from jnpr.jsnapy import content_store
+from jnpr.jsnapy import merkle
 
 colorama.init(autoreset=True)
 
+# max number of replies waiting to be written when pipelining is enabled
+PIPELINE_DEPTH = 8
+
 class Parser:
 
-    def __init__(self):
+    def __init__(self, pipeline=False, compress=None, dedup=False, persist=True,
+                 merkle_index=False):
+        """
+        :param pipeline: if True, snapshot files and database are written by a
+                         separate thread so that writing reply of one command
+                         overlaps with device round trip of next one
+        :param compress: compression format of snapshots (gzip, zlib, bz2, lzma,
+                         zstd), None to store them uncompressed
+        :param dedup: if True, snapshot files having same data are hard links
+                      to a single copy of data
+        :param persist: if False, replies are only kept in memory and no snapshot
+                        is written in file or database
+        :param merkle_index: if True, hash index of each snapshot is stored with
+                             it, letting --diff skip unchanged subtrees
+        """
         self.logger_snap = logging.getLogger(__name__)
         self.log_detail = {'hostname': None}
         colorama.init(autoreset=True)
         self.reply = {}
+        # reply of each command/RPC (or error reply of device) by name and format
+        # of its snapshot, used to test replies without reading snapshots back
+        self.reply_trees = {}
+        self.persist = persist
+        # commands/RPCs already taken, shared by all test files of the device
+        self._fetched = set()
+        self.sqlite_handles = {}
+        self.pipeline = pipeline
+        self.compress = compression.get_codec(compress)
+        self.dedup = dedup
+        self.merkle_index = merkle_index
+        self._snap_dirs = set()
+        self._write_q = None
+        self._writer = None
+
+    def _writer_loop(self):
+        """
+        Executes pending writes one by one, in the order they were queued
+        """
+        with batch_writes():
+            while True:
+                job = self._write_q.get()
+                if job is None:
+                    return
+                func, args = job
+                try:
+                    func(*args)
+                except Exception:
+                    self.logger_snap.error(colorama.Fore.RED +
+                                           "ERROR occurred while writing snapshot %s" %
+                                           str(sys.exc_info()[0]), extra=self.log_detail)
+                    self.logger_snap.error(colorama.Fore.RED +
+                                           "\n**********Complete error message***********\n %s" %
+                                           str(sys.exc_info()), extra=self.log_detail)
+
+    def _persist(self, func, *args):
+        """
+        Call function writing snapshot, either right away or through writer thread
+        if pipelining is enabled
+        :param func: function writing snapshot in file or database
+        :param args: arguments of function
+        """
+        if not self.persist:
+            return
+        if not self.pipeline:
+            return func(*args)
+        if self._writer is None:
+            self._write_q = Queue.Queue(PIPELINE_DEPTH)
+            self._writer = Thread(target=self._writer_loop)
+            self._writer.daemon = True
+            self._writer.start()
+        self._write_q.put((func, args))
+
+    def flush(self):
+        """
+        Wait till all queued snapshots are written
+        """
+        if self._writer is not None:
+            self._write_q.put(None)
+            self._writer.join()
+            self._writer = None
+            self._write_q = None
 
     def _write_file(self, rpc_reply, format, output_file):
         """
@@ -38,19 +123,61 @@ class Parser:
 
 
         if rpc_reply is True :
-            with open(output_file, 'w') as f:
-                f.write("")
+            content_store.write_new(output_file, "")
             self.logger_snap.info(
                 colorama.Fore.BLUE +
                 "\nOutput of requested Command/RPC is empty", extra=self.log_detail)
         else:
-            with open(output_file, 'w') as f:
-                f.write(etree.tostring(rpc_reply))
+            data = self._compressed(etree.tostring(rpc_reply))
+            self._store(data, output_file)
+            if data and self.merkle_index:
+                # hash index lets --diff skip unchanged subtrees, snapshot is
+                # compared without it if index can not be written
+                try:
+                    merkle.write_file(output_file, rpc_reply, data, self.compress)
+                except Exception as ex:
+                    self.logger_snap.debug(
+                        "Hash index of snapshot %s not stored: %s" % (output_file, ex),
+                        extra=self.log_detail)
+
+    def _store(self, data, output_file):
+        """
+        Write snapshot data in file, through content addressed store if
+        deduplication is enabled
+        :param data: snapshot data
+        :param output_file: name of file
+        """
+        if self.dedup and data:
+            content_store.store_file(data, output_file)
+            self._snap_dirs.add(os.path.dirname(os.path.abspath(output_file)))
+        else:
+            # existing snapshot may be a link to a blob shared by other
+            # snapshots, it is replaced and not written through
+            content_store.write_new(output_file, data)
+        if data:
+            # digest lets --check find out unchanged snapshots without reading
+            # them, snapshot itself is usable even if digest can not be written
+            try:
+                record = content_store.digest_record(data)
+                with open(output_file + content_store.DIGEST_SUFFIX, 'w') as f:
+                    f.write(record)
+            except Exception as ex:
+                self.logger_snap.debug(
+                    "Digest of snapshot %s not stored: %s" % (output_file, ex),
+                    extra=self.log_detail)
+
+    def _compressed(self, data):
+        """
+        :param data: snapshot data
+        :return: data compressed in format given to Parser, empty data is kept as it is
+        """
+        if self.compress is None or not data:
+            return data
+        return compression.compress(data, self.compress)
 
     def _write_warning(
             self, reply, db, snap_file, hostname, cmd_name, cmd_format, output_file):
-        with open(snap_file, 'w') as f:
-            f.write(reply)
+        self._store(self._compressed(reply), snap_file)
         if db['store_in_sqlite'] is True:
             self.store_in_sqlite(
                 db,
@@ -110,7 +237,14 @@ class Parser:
         :param rpc_reply: RPC reply
         :param snap_name: snap filename
         """
-        sqlite_jsnap = JsnapSqlite(hostname, db['db_name'])
+        key = (hostname, db['db_name'])
+        sqlite_jsnap = self.sqlite_handles.get(key)
+        if sqlite_jsnap is None:
+            # retention is passed only if given in main config file
+            retention = dict((key, db[key]) for key in ('max_snapshots', 'max_age_days')
+                             if key in db)
+            sqlite_jsnap = JsnapSqlite(hostname, db['db_name'], **retention)
+            self.sqlite_handles[key] = sqlite_jsnap
         db_dict = dict()
         db_dict['cli_command'] = cmd_rpc_name
         db_dict['snap_name'] = snap_name
@@ -118,10 +252,38 @@ class Parser:
             '_' + cmd_rpc_name + '.' + reply_format
         db_dict['format'] = reply_format
         if warning is False:
-            db_dict['data'] = self._check_reply(rpc_reply, reply_format)
+            db_dict['data'] = xml_data = self._check_reply(rpc_reply, reply_format)
         else:
             db_dict['data'] = rpc_reply
+        if self.compress is not None and db_dict['data']:
+            db_dict['data'] = sqlite3.Binary(self._compressed(db_dict['data']))
         sqlite_jsnap.insert_data(db_dict)
+        if warning is False and db_dict['data'] and self.merkle_index:
+            try:
+                sqlite_jsnap.insert_merkle(
+                    db_dict['data'], merkle.build(rpc_reply), xml_data, self.compress)
+            except Exception as ex:
+                self.logger_snap.debug(
+                    "Hash index of snapshot %s not stored: %s" % (db_dict['filename'], ex),
+                    extra=self.log_detail)
+
+    def _taken_before(self, *request):
+        """
+        Command/RPC used by several tests, of same or different test files, is
+        asked to device and stored only once. Its tests use snapshot taken
+        the first time.
+        :param request: type, command/RPC, format and arguments of RPC
+        :return: True if snapshot of same request is already taken
+        """
+        key = repr(tuple(sorted(val.items()) if isinstance(val, dict) else val
+                         for val in request))
+        if key in self._fetched:
+            self.logger_snap.debug(colorama.Fore.BLUE +
+                                   "Snapshot of %s already taken" % request[1],
+                                   extra=self.log_detail)
+            return True
+        self._fetched.add(key)
+        return False
 
     def run_cmd(self, test_file, t, formats, dev, output_file, hostname, db):
         """
@@ -137,6 +299,8 @@ class Parser:
         self.logger_snap.debug(colorama.Fore.BLUE +
                                "Tests Included: %s " %t,
                                extra=self.log_detail)
+        if self._taken_before('command', command, cmd_format):
+            return
         self.logger_snap.info(
             colorama.Fore.BLUE +
             "Taking snapshot of COMMAND: %s " %
@@ -154,14 +318,17 @@ class Parser:
             else:
                 rpc_reply_command = dev.rpc.cli(command, format=cmd_format)
             self.reply[command] = rpc_reply_command
+            self.reply_trees[(cmd_name, cmd_format)] = rpc_reply_command
 
         except RpcError as err:
+            self.reply_trees[(cmd_name, cmd_format)] = err.rsp
             snap_file = self.generate_snap_file(
                 output_file,
                 hostname,
                 cmd_name,
                 cmd_format)
-            self._write_warning(
+            self._persist(
+                self._write_warning,
                 etree.tostring(
                     err.rsp),
                 db,
@@ -193,9 +360,11 @@ class Parser:
                 hostname,
                 cmd_name,
                 cmd_format)
-            self._write_file(rpc_reply_command, cmd_format, snap_file)
+            self._persist(
+                self._write_file, rpc_reply_command, cmd_format, snap_file)
             if db['store_in_sqlite'] is True:
-                self.store_in_sqlite(
+                self._persist(
+                    self.store_in_sqlite,
                     db,
                     hostname,
                     cmd_name,
@@ -216,6 +385,10 @@ class Parser:
         self.logger_snap.debug(colorama.Fore.BLUE +
                               "Tests Included : %s " %t,
                               extra=self.log_detail)
+        rpc_args = test_file[t][1].get('kwargs') if len(test_file[t]) >= 2 and \
+            'kwargs' in test_file[t][1] else None
+        if self._taken_before('rpc', rpc, reply_format, rpc_args):
+            return
         self.logger_snap.info(colorama.Fore.BLUE +
                               "Taking snapshot of RPC: %s" %
                               rpc,
@@ -262,12 +435,14 @@ class Parser:
                     rpc_reply = getattr(
                         dev.rpc, rpc.replace('-', '_'))({'format': reply_format}, **kwargs)
                 except RpcError as err:
+                    self.reply_trees[(rpc, reply_format)] = err.rsp
                     snap_file = self.generate_snap_file(
                         output_file,
                         hostname,
                         rpc,
                         reply_format)
-                    self._write_warning(
+                    self._persist(
+                        self._write_warning,
                         etree.tostring(
                             err.rsp),
                         db,
@@ -310,12 +485,14 @@ class Parser:
                     rpc_reply = getattr(
                         dev.rpc, rpc.replace('-', '_'))({'format': reply_format})
             except RpcError as err:
+                self.reply_trees[(rpc, reply_format)] = err.rsp
                 snap_file = self.generate_snap_file(
                     output_file,
                     hostname,
                     rpc,
                     reply_format)
-                self._write_warning(
+                self._persist(
+                    self._write_warning,
                     etree.tostring(
                         err.rsp),
                     db,
@@ -346,11 +523,13 @@ class Parser:
                 hostname,
                 rpc,
                 reply_format)
-            self._write_file(rpc_reply, reply_format, snap_file)
+            self._persist(self._write_file, rpc_reply, reply_format, snap_file)
             self.reply[rpc] = rpc_reply
+            self.reply_trees[(rpc, reply_format)] = rpc_reply
 
         if db['store_in_sqlite'] is True:
-            self.store_in_sqlite(
+            self._persist(
+                self.store_in_sqlite,
                 db,
                 hostname,
                 rpc,
@@ -375,6 +554,21 @@ class Parser:
             for t in test_file:
                 self.test_included.append(t)
 
+        # replies of all commands are committed to database in one transaction
+        with batch_writes():
+            try:
+                self._generate_reply(test_file, formats, dev, output_file, hostname, db)
+            finally:
+                self.flush()
+        # blobs of snapshot files overwritten by this run are not needed anymore
+        while self._snap_dirs:
+            content_store.sweep(self._snap_dirs.pop())
+        return self
+
+    def _generate_reply(self, test_file, formats, dev, output_file, hostname, db):
+        """
+        Take snapshot of all test cases included in test file
+        """
         for t in self.test_included:
             if t in test_file:
                 if test_file.get(t) is not None and (
@@ -405,4 +599,3 @@ class Parser:
                 self.logger_snap.error(
                     colorama.Fore.RED +
                     "ERROR!!! Test case: '%s' not defined !!!!" % t, extra=self.log_detail)
-        return self
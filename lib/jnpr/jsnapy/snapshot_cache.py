@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from lxml import etree
+from jnpr.jsnapy import compression
+from jnpr.jsnapy import streaming
+
+# maximum size of snapshot data (in bytes) whose parsed trees are kept in memory
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class _CountingReader(object):
+
+    """
+    File like object counting bytes read from a decompressing reader
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.count += len(data)
+        return data
+
+
+class SnapshotCache(object):
+
+    """
+    Keeps parsed snapshots in memory so that each snapshot file or database
+    record is parsed only once, however many tests are run on it.
+    Least recently used snapshots are dropped once total size of cached
+    snapshots, counted as uncompressed XML, goes beyond max_bytes. Most recent snapshot is always kept,
+    even if it alone is bigger than max_bytes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _get(self, key, stamp):
+        with self._lock:
+            entry = self._docs.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] != stamp:
+                self.size -= entry[1]
+                return None
+            # re-insert to mark it as most recently used
+            self._docs[key] = entry
+            return entry[2]
+
+    def _put(self, key, stamp, size, doc):
+        with self._lock:
+            old = self._docs.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._docs[key] = (stamp, size, doc)
+            self.size += size
+            while self.size > self.max_bytes and len(self._docs) > 1:
+                _, (_, old_size, _) = self._docs.popitem(last=False)
+                self.size -= old_size
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self.size = 0
+
+    def parse_file(self, snap_file, x_paths=None):
+        """
+        Parse snapshot file, or return tree parsed earlier if file has not
+        changed since (same inode, modification time and size).
+        Compressed file is decompressed while it is parsed.
+        :param snap_file: snapshot file name
+        :param x_paths: if given, snapshot is parsed in streaming mode keeping
+                        only nodes at these xpaths, see streaming.stream_paths()
+        :return: lxml ElementTree
+        """
+        st = os.stat(snap_file)
+        key = ('file', os.path.abspath(snap_file), x_paths)
+        stamp = (st.st_ino, st.st_mtime, st.st_size)
+        doc = self._get(key, stamp)
+        if doc is None:
+            parse = etree.parse if x_paths is None else \
+                lambda source: streaming.parse_paths(source, x_paths)
+            if compression.file_codec(snap_file) is None:
+                doc = parse(snap_file)
+                size = st.st_size
+            else:
+                # weighed by decompressed size, parsed tree grows with it
+                # and not with size of compressed file
+                f = compression.open_snapshot(snap_file)
+                try:
+                    reader = _CountingReader(f)
+                    doc = parse(reader)
+                finally:
+                    f.close()
+                size = reader.count
+            self._put(key, stamp, size, doc)
+        return doc
+
+    def parse_string(self, data):
+        """
+        Parse snapshot extracted from database, or return element parsed
+        earlier from same data. Cache is keyed by digest of data, so that data
+        itself is not kept along with its tree.
+        :param data: snapshot data
+        :return: lxml Element
+        """
+        raw = data.encode('utf-8') if isinstance(data, unicode) else data
+        key = ('sqlite', hashlib.sha1(raw).digest())
+        doc = self._get(key, None)
+        if doc is None:
+            doc = etree.fromstring(data)
+            self._put(key, None, len(data), doc)
+        return doc
@@ -11,6 +11,10 @@ import sqlite3
 import logging
 import colorama
 from jnpr.jsnapy import get_path
+from jnpr.jsnapy.sqlite_store import get_connection, BLOB_TABLE, MERKLE_TABLE, table_columns
+from jnpr.jsnapy.merkle import MerkleIndex
+from jnpr.jsnapy import content_store
+from jnpr.jsnapy.compression import decompress
 
 colorama.init(autoreset=True)
 
@@ -32,6 +36,31 @@ class SqliteExtractXml:
                 db_name, extra=self.sqlite_logs)
             sys.exit(1)
 
+    def _fetch(self, query, table_name, params, fetch_all=False):
+        """
+        Run query on pooled connection of database, connection and its
+        compiled statements are reused across calls
+        :param query: sql query, %(table)s is replaced by table name and
+                      %(data)s by expression giving snapshot data
+        :param table_name: name of table of device
+        :param params: parameters of query
+        :return: first row, or all rows if fetch_all is True
+        """
+        pooled = get_connection(self.db_filename)
+        if pooled.has_blobs(table_name):
+            # data of deduplicated snapshots is kept in blob table
+            data = "coalesce(data, (SELECT data FROM %s WHERE hash = data_hash))" % BLOB_TABLE
+        else:
+            data = "data"
+        with pooled.lock:
+            cursor = pooled.conn.execute(query % {'table': table_name, 'data': data}, params)
+            if fetch_all:
+                return cursor.fetchall()
+            return cursor.fetchone()
+
+    def _is_legacy(self, table_name):
+        return get_connection(self.db_filename).is_legacy_table(table_name)
+
     def get_xml_using_snapname(self, hostname, command_name, snap_name):
         """
         Return name of snap file from database
@@ -41,31 +70,32 @@ class SqliteExtractXml:
         """
         self.sqlite_logs['hostname'] = hostname
         table_name = 'table_' + hostname.replace('.', '__')
-        with sqlite3.connect(self.db_filename) as con:
-            try:
-                cursor = con.cursor()
-                cursor.execute(
-                    "SELECT * FROM sqlite_master WHERE name = :name and type='table'; ", {'name': table_name})
-                cursor.execute("SELECT MIN(id), data_format, data FROM %s WHERE snap_name = :snap AND cli_command = :cli" % table_name,
-                               {'snap': snap_name, 'cli': command_name})
-                row = cursor.fetchone()
-                if not row:
-                    raise Exception("No previous snapshots exists with name = %s for command = %s" %
-                        (snap_name,
-                         command_name.replace(
-                             '_',
-                             ' ')))
-                idd, data_format, data = row
-                if data is None:
-                    raise Exception("No previous snapshots exists with name = %s for command = %s" %(snap_name, command_name.replace('_',' ')))
-            except Exception as ex:
-                self.logger_sqlite.error(
-                    colorama.Fore.RED +
-                    "ERROR!! Complete message is %s" %
-                    ex,
-                    extra=self.sqlite_logs)
+        try:
+            if self._is_legacy(table_name):
+                row = self._fetch("SELECT MIN(id), data_format, %(data)s FROM %(table)s WHERE snap_name = :snap AND cli_command = :cli",
+                                  table_name, {'snap': snap_name, 'cli': command_name})
             else:
-                return str(data), data_format
+                # latest snapshot with given name, ids increase with every snapshot
+                row = self._fetch("SELECT id, data_format, %(data)s FROM %(table)s WHERE cli_command = :cli AND snap_name = :snap "
+                                  "ORDER BY id DESC LIMIT 1",
+                                  table_name, {'snap': snap_name, 'cli': command_name})
+            if not row:
+                raise Exception("No previous snapshots exists with name = %s for command = %s" %
+                    (snap_name,
+                     command_name.replace(
+                         '_',
+                         ' ')))
+            idd, data_format, data = row
+            if data is None:
+                raise Exception("No previous snapshots exists with name = %s for command = %s" %(snap_name, command_name.replace('_',' ')))
+        except Exception as ex:
+            self.logger_sqlite.error(
+                colorama.Fore.RED +
+                "ERROR!! Complete message is %s" %
+                ex,
+                extra=self.sqlite_logs)
+        else:
+            return decompress(str(data)), data_format
 
     def get_xml_using_snap_id(self, hostname, command_name, snap_id):
         """
@@ -76,29 +106,77 @@ class SqliteExtractXml:
         """
         self.sqlite_logs['hostname'] = hostname
         table_name = 'table_' + hostname.replace('.', '__')
-        with sqlite3.connect(self.db_filename) as con:
-            try:
-                cursor = con.cursor()
-                cursor.execute(
-                    "SELECT * FROM sqlite_master WHERE name = :name and type='table'; ", {'name': table_name})
-                cursor.execute("SELECT id, data_format, data FROM %s WHERE id = :id AND cli_command = :cli" % table_name,
-                               {'id': snap_id, 'cli': command_name})
-                row = cursor.fetchone()
-                idd, data_format, data = row
-                if not row:
-                    raise Exception("No previous snapshots exists with id = %s for command = %s" %
-                        (snap_id,
-                         command_name.replace(
-                             '_',
-                             ' ')))
-                idd, data_format, data = row
-                if data is None:
-                    raise Exception("No previous snapshots exists with id = %s for command = %s" %(snap_id, command_name.replace('_',' ')))
-            except Exception as ex:
-                self.logger_sqlite.error(
-                    colorama.Fore.RED +
-                    "ERROR!! Complete message is: %s" % ex, extra=self.sqlite_logs)
-                return str(None), None
+        try:
+            if self._is_legacy(table_name):
+                row = self._fetch("SELECT id, data_format, %(data)s FROM %(table)s WHERE id = :id AND cli_command = :cli",
+                                  table_name, {'id': snap_id, 'cli': command_name})
+            else:
+                # snap_id is age of snapshot, 0 being the latest one
+                row = self._fetch("SELECT id, data_format, %(data)s FROM %(table)s WHERE cli_command = :cli "
+                                  "ORDER BY id DESC LIMIT :limit OFFSET :id",
+                                  table_name, {'id': snap_id, 'limit': 1 if snap_id >= 0 else 0, 'cli': command_name})
+            idd, data_format, data = row
+            if not row:
+                raise Exception("No previous snapshots exists with id = %s for command = %s" %
+                    (snap_id,
+                     command_name.replace(
+                         '_',
+                         ' ')))
+            idd, data_format, data = row
+            if data is None:
+                raise Exception("No previous snapshots exists with id = %s for command = %s" %(snap_id, command_name.replace('_',' ')))
+        except Exception as ex:
+            self.logger_sqlite.error(
+                colorama.Fore.RED +
+                "ERROR!! Complete message is: %s" % ex, extra=self.sqlite_logs)
+            return str(None), None
+
+        else:
+            return decompress(str(data)), data_format
 
+    def get_all_using_snapname(self, hostname, snap_name):
+        """
+        Return latest snapshot of every command stored with given snap name,
+        using a single query
+        :param hostname: hostname of device
+        :param snap_name: name of snap file or snap file tag
+        :return: dict of command/RPC name to (data, data format)
+        """
+        self.sqlite_logs['hostname'] = hostname
+        table_name = 'table_' + hostname.replace('.', '__')
+        snaps = {}
+        try:
+            # sqlite takes values of other columns from the row having max/min id
+            if self._is_legacy(table_name):
+                query = "SELECT cli_command, data_format, %(data)s, MIN(id) FROM %(table)s WHERE snap_name = :snap GROUP BY cli_command"
             else:
-                return str(data), data_format
+                query = "SELECT cli_command, data_format, %(data)s, MAX(id) FROM %(table)s WHERE snap_name = :snap GROUP BY cli_command"
+            rows = self._fetch(query, table_name, {'snap': snap_name}, fetch_all=True)
+        except sqlite3.Error as ex:
+            self.logger_sqlite.error(
+                colorama.Fore.RED +
+                "ERROR!! Complete message is %s" %
+                ex,
+                extra=self.sqlite_logs)
+        else:
+            for cli_command, data_format, data, _ in rows:
+                if data is not None:
+                    snaps[cli_command] = (decompress(str(data)), data_format)
+        return snaps
+
+    def get_merkle(self, data):
+        """
+        Return hash index stored for snapshot data
+        :param data: snapshot data, as returned by other methods
+        :return: merkle.MerkleIndex, None if database has no index for data
+        """
+        xml_hash = content_store.digest(data)
+        pooled = get_connection(self.db_filename)
+        with pooled.lock:
+            if not table_columns(pooled.conn, MERKLE_TABLE):
+                return None
+            row = pooled.conn.execute("SELECT tree FROM %s WHERE hash = :hash" % MERKLE_TABLE,
+                                      {'hash': xml_hash}).fetchone()
+        if row is None:
+            return None
+        return MerkleIndex.loads(str(row[0]), xml_hash)
@@ -6,17 +6,401 @@
 #
 
 import os
+import time
+import hashlib
+import atexit
 import sqlite3
 import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from jnpr.jsnapy import get_path
+from jnpr.jsnapy import compression
+from jnpr.jsnapy import content_store
+
+_pool_lock = threading.Lock()
+_connections = {}
+_batch = threading.local()
+
+# snapshots kept per command when retention is not given in main config file
+DEFAULT_MAX_SNAPSHOTS = 50
+
+# table holding data of snapshots, one row per distinct data shared by all devices
+BLOB_TABLE = 'snapshot_blobs'
+
+# table holding hash index of snapshots, keyed by digest of uncompressed data
+MERKLE_TABLE = 'snapshot_merkle'
+
+
+def table_columns(conn, table_name):
+    """
+    :param conn: sqlite connection
+    :param table_name: name of table
+    :return: list of column names, empty if table does not exist
+    """
+    return [row[1] for row in conn.execute(
+        "PRAGMA table_info(%s)" % table_name)]
+
+
+class PooledConnection(object):
+
+    """
+    One sqlite connection per database file, shared by all threads of the process.
+    Statements are serialized using lock, transactions are begun and ended
+    explicitly while holding it, so that no thread ever commits or rolls back
+    statements of another one. Tables having current schema are remembered
+    so that schema is created only once per database.
+    Tables created by older versions of JSNAPy store age of snapshot in id
+    (0 being the latest) and have no taken_at column, tables created before
+    deduplication have data in each row and no data_hash column.
+    """
+
+    def __init__(self, db_filename):
+        self.db_filename = db_filename
+        self.conn = sqlite3.connect(db_filename, check_same_thread=False,
+                                    isolation_level=None)
+        self.inode = os.stat(db_filename).st_ino
+        self.lock = threading.RLock()
+        self.tables = set()
+        self.pending_prunes = {}
+        # data hashes of pruned rows, their blobs are removed by
+        # remove_unused_blobs() if no other row refers to them
+        self.unused_hashes = set()
+        self.wal = False
+
+    def enable_wal(self):
+        if not self.wal:
+            with self.lock:
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.wal = True
+
+    def create_table(self, table_name):
+        """
+        Create table and its indexes if not present. Table having old schema is
+        migrated: ids are turned into increasing sequence numbers (-age) and
+        taken_at and data_hash columns are added. Rows stored before migration
+        keep their data.
+        :param table_name: name of table
+        """
+        if table_name in self.tables:
+            return
+        with self.lock:
+            self.conn.execute("begin")
+            try:
+                self._create_table(table_name)
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+            self.conn.execute("commit")
+            self.tables.add(table_name)
+
+    def _create_table(self, table_name):
+        columns = table_columns(self.conn, table_name)
+        if not columns:
+            self.conn.execute("""create table if not exists %s (
+                id           integer not null,
+                filename     text,
+                cli_command  text,
+                snap_name    text,
+                data_format  text,
+                data     text,
+                taken_at     real,
+                data_hash    text
+            );""" % table_name)
+        else:
+            if 'taken_at' not in columns:
+                self.conn.execute(
+                    "alter table %s add column taken_at real" % table_name)
+                self.conn.execute("update %s set id = -id" % table_name)
+            if 'data_hash' not in columns:
+                self.conn.execute(
+                    "alter table %s add column data_hash text" % table_name)
+        self.conn.execute("""create table if not exists %s (
+            hash  text primary key,
+            data  blob
+        );""" % BLOB_TABLE)
+        self.conn.execute("""create table if not exists %s (
+            hash       text primary key,
+            data_hash  text,
+            tree       blob
+        );""" % MERKLE_TABLE)
+        self.conn.execute(
+            "create index if not exists %s_cli_id on %s (cli_command, id)" %
+            (table_name, table_name))
+        self.conn.execute(
+            "create index if not exists %s_cli_snap on %s (cli_command, snap_name, id)" %
+            (table_name, table_name))
+        self.conn.execute(
+            "create index if not exists %s_data_hash on %s (data_hash)" %
+            (table_name, table_name))
+
+    def _columns(self, table_name):
+        with self.lock:
+            columns = table_columns(self.conn, table_name)
+        # migration never goes back, so table having current schema is remembered
+        if 'taken_at' in columns and 'data_hash' in columns:
+            self.tables.add(table_name)
+        return columns
+
+    def is_legacy_table(self, table_name):
+        """
+        :param table_name: name of table
+        :return: True if table exists and stores age of snapshot in id
+        """
+        if table_name in self.tables:
+            return False
+        columns = self._columns(table_name)
+        return bool(columns) and 'taken_at' not in columns
+
+    def has_blobs(self, table_name):
+        """
+        :param table_name: name of table
+        :return: True if data of table can be stored in blob table
+        """
+        return table_name in self.tables or 'data_hash' in self._columns(table_name)
+
+    def schedule_prune(self, table_name, cli_command, max_snapshots, max_age_days):
+        """
+        Old snapshots of command are removed when writes being done are committed
+        """
+        with self.lock:
+            self.pending_prunes[(table_name, cli_command)] = (max_snapshots, max_age_days)
+
+    def _prune(self):
+        for (table_name, cli), (max_snapshots, max_age_days) in self.pending_prunes.items():
+            if max_snapshots is not None:
+                self._delete(table_name, """cli_command = :cli and id <= (
+                             select id from %s where cli_command = :cli
+                             order by id desc limit 1 offset :keep)""" % table_name,
+                             {'cli': cli, 'keep': max_snapshots})
+            if max_age_days is not None:
+                self._delete(table_name, "cli_command = :cli and taken_at < :oldest",
+                             {'cli': cli, 'oldest': time.time() - max_age_days * 86400})
+        self.pending_prunes.clear()
+
+    def _delete(self, table_name, where, params):
+        if table_name in self.tables:
+            self.unused_hashes.update(data_hash for (data_hash,) in self.conn.execute(
+                "select distinct data_hash from %s where data_hash is not null and %s" %
+                (table_name, where), params))
+        self.conn.execute("delete from %s where %s" % (table_name, where), params)
+
+    def remove_unused_blobs(self):
+        """
+        Remove data of pruned snapshots no longer referred by any snapshot of
+        any device. Only hashes of pruned rows are looked up, using data_hash
+        index of each table. Done once per run, not in each write.
+        """
+        with self.lock:
+            if not self.unused_hashes:
+                return
+            hashes, self.unused_hashes = self.unused_hashes, set()
+            self.conn.execute("begin immediate")
+            try:
+                tables = [name for (name,) in self.conn.execute(
+                    "select name from sqlite_master where type = 'table' and name like 'table_%'")
+                    if 'data_hash' in table_columns(self.conn, name)]
+                for name in tables:
+                    # table of a device not written since index was added
+                    self.conn.execute(
+                        "create index if not exists %s_data_hash on %s (data_hash)" %
+                        (name, name))
+                referred = " or ".join(
+                    "exists (select 1 from %s where data_hash = :hash)" % name
+                    for name in tables) or "0"
+                for data_hash in hashes:
+                    if self.conn.execute("select %s" % referred,
+                                         {'hash': data_hash}).fetchone()[0]:
+                        continue
+                    self.conn.execute("delete from %s where hash = :hash" % BLOB_TABLE,
+                                      {'hash': data_hash})
+                    # created along with blob table by create_table()
+                    self.conn.execute("delete from %s where data_hash = :hash" % MERKLE_TABLE,
+                                      {'hash': data_hash})
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+            self.conn.execute("commit")
+
+    def write(self, writes):
+        """
+        Run writes in one transaction, each of them inside its own savepoint so
+        that a failing write is rolled back alone. Old snapshots of commands
+        written are removed in same transaction.
+        :param writes: list of (func, args), func is called with this
+                       connection and args
+        :return: list of exceptions raised by failed writes
+        """
+        errors = []
+        with self.lock:
+            self.conn.execute("begin immediate")
+            try:
+                for func, args in writes:
+                    self.conn.execute("savepoint jsnapy_write")
+                    try:
+                        func(self, *args)
+                    except Exception as ex:
+                        self.conn.execute("rollback to jsnapy_write")
+                        errors.append(ex)
+                    self.conn.execute("release jsnapy_write")
+                self._prune()
+            except Exception:
+                self.pending_prunes.clear()
+                self.conn.execute("rollback")
+                raise
+            self.conn.execute("commit")
+        return errors
+
+    def close(self):
+        with self.lock:
+            try:
+                self.remove_unused_blobs()
+            except sqlite3.Error as ex:
+                logging.getLogger(__name__).error(
+                    "\nERROR occurred in database:    %s" % str(ex))
+            self.conn.close()
+            # database file removed while it was open, its write ahead log
+            # left behind must not be applied to a new database with same name
+            if self.wal and not os.path.exists(self.db_filename):
+                for suffix in ('-wal', '-shm'):
+                    try:
+                        os.remove(self.db_filename + suffix)
+                    except OSError:
+                        pass
+
+
+def get_connection(db_filename, wal=False):
+    """
+    Return pooled connection of database, database is opened again if its file
+    was removed or replaced since it was opened.
+    :param db_filename: complete path of database file
+    :param wal: True to switch database to write ahead logging
+    :return: PooledConnection
+    """
+    with _pool_lock:
+        pooled = _connections.get(db_filename)
+        if pooled is not None:
+            try:
+                inode = os.stat(db_filename).st_ino
+            except OSError:
+                inode = None
+            if inode != pooled.inode:
+                del _connections[db_filename]
+                try:
+                    pooled.close()
+                except sqlite3.Error:
+                    pass
+                pooled = None
+        if pooled is None:
+            pooled = PooledConnection(db_filename)
+            _connections[db_filename] = pooled
+    if wal:
+        pooled.enable_wal()
+    return pooled
+
+
+@contextmanager
+def batch_writes():
+    """
+    Inserts done by current thread inside this block are kept by the thread
+    and written together at the end of block, in one transaction per database,
+    instead of one transaction per insert. Other threads sharing connection
+    never commit or roll back inserts of this block. Blocks can be nested,
+    writes happen when outermost block ends.
+    """
+    depth = getattr(_batch, 'depth', 0)
+    if depth == 0:
+        _batch.pending = []
+    _batch.depth = depth + 1
+    try:
+        yield
+    finally:
+        _batch.depth -= 1
+        if _batch.depth == 0:
+            pending, _batch.pending = _batch.pending, []
+            _write_pending(pending)
+
+
+def _write_pending(pending):
+    writes = OrderedDict()
+    for pooled, func, args in pending:
+        writes.setdefault(pooled, []).append((func, args))
+    for pooled, pooled_writes in writes.items():
+        try:
+            errors = pooled.write(pooled_writes)
+        except Exception as ex:
+            errors = [ex]
+        # snapshots of failed writes are lost, others are kept
+        for ex in errors:
+            logging.getLogger(__name__).error(
+                "\nERROR occurred in database:    %s" % str(ex))
+
+
+def _write(pooled, func, *args):
+    """
+    Run write on pooled connection, or keep it till end of batch_writes()
+    block of current thread
+    """
+    if getattr(_batch, 'depth', 0):
+        _batch.pending.append((pooled, func, args))
+        return
+    errors = pooled.write([(func, args)])
+    if errors:
+        raise errors[0]
+
+
+def remove_unused_blobs():
+    """
+    Remove data of snapshots pruned by this run, in all pooled connections
+    """
+    with _pool_lock:
+        pooled_list = _connections.values()
+    for pooled in pooled_list:
+        try:
+            pooled.remove_unused_blobs()
+        except sqlite3.Error as ex:
+            logging.getLogger(__name__).error(
+                "\nERROR occurred in database:    %s" % str(ex))
+
+
+def close_all():
+    """
+    Close all pooled connections
+    """
+    with _pool_lock:
+        while _connections:
+            _, pooled = _connections.popitem()
+            try:
+                pooled.close()
+            except sqlite3.Error:
+                pass
+
+atexit.register(close_all)
+
+
+def forget_all():
+    """
+    Drop pooled connections without closing them. Called in a forked process,
+    connections inherited from parent must not be used there. Lock is not
+    taken, it may have been held by another thread of parent when forking.
+    """
+    _connections.clear()
 
 
 class JsnapSqlite:
 
-    def __init__(self, host, db_name):
+    def __init__(self, host, db_name, max_snapshots=DEFAULT_MAX_SNAPSHOTS, max_age_days=None):
+        """
+        :param host: hostname of device, each device has its own table
+        :param db_name: name of database file
+        :param max_snapshots: number of snapshots kept per command, None for no limit
+        :param max_age_days: snapshots older than these many days are removed
+        """
         self.logger_storesqlite = logging.getLogger(__name__)
         host = host.replace('.', '__')
         self.table_name = "table_" + host
+        self.max_snapshots = max_snapshots
+        self.max_age_days = max_age_days
         # Creating Schema
         self.db_filename = os.path.join(
             get_path(
@@ -24,34 +408,68 @@ class JsnapSqlite:
                 'snapshot_path'),
             db_name)
         try:
-            with sqlite3.connect(self.db_filename) as conn:
-                # Creating schema if it does not exists
-                sqlstr = """create table if not exists %s (
-                    id           integer not null,
-                    filename     text,
-                    cli_command  text,
-                    snap_name    text,
-                    data_format  text,
-                    data     text
-                );""" % self.table_name
-                conn.execute(sqlstr)
+            # Creating schema if it does not exists
+            self._connection()
         except Exception as ex:
             self.logger_storesqlite.error(
                 "\nERROR occurred in database:    %s" %
                 str(ex))
 
+    def _connection(self):
+        pooled = get_connection(self.db_filename, wal=True)
+        pooled.create_table(self.table_name)
+        return pooled
+
     def insert_data(self, db):
         """
-        Function to Insert Data in database
-        :param db: database name
-        """
-        with sqlite3.connect(self.db_filename) as con:
-            con.execute("""update %s set id = id + 1 where cli_command = :cli""" % self.table_name,
-                        {'cli': db['cli_command']})
-            con.execute("""delete from %s where id>49 AND cli_command = :cli""" % self.table_name,
-                        {'cli': db['cli_command']})
-            con.execute("""insert into %s (id, filename, cli_command, snap_name, data_format, data) values (0, :file,
-                         :cli, :snap, :format, :xml)""" % self.table_name, {'file': db['filename'],
-                                                                            'cli': db['cli_command'], 'snap': db['snap_name'],
-                                                                            'format': db['format'], 'xml': db['data']})
-            con.commit()
+        Function to Insert Data in database. Snapshot gets next sequence number
+        of its command, snapshots beyond retention are removed at commit.
+        Data is stored once in blob table, snapshots having same data refer to it
+        by its sha1 digest.
+        :param db: dict containing cli_command, snap_name, filename, format and data
+        """
+        pooled = self._connection()
+        data = db['data']
+        data_hash = hashlib.sha1(data).hexdigest() if data else None
+        values = {'file': db['filename'], 'cli': db['cli_command'], 'snap': db['snap_name'],
+                  'format': db['format'], 'xml': data, 'taken_at': time.time(),
+                  'hash': data_hash}
+        _write(pooled, self._insert_data, values)
+
+    def _insert_data(self, pooled, values):
+        con = pooled.conn
+        if values['hash'] is not None:
+            con.execute("insert or ignore into %s (hash, data) values (:hash, :xml)" % BLOB_TABLE,
+                        values)
+            values = dict(values, xml=None)
+        con.execute("""insert into %s (id, filename, cli_command, snap_name, data_format, data, taken_at, data_hash)
+                    values ((select coalesce(max(id), -1) + 1 from %s where cli_command = :cli),
+                    :file, :cli, :snap, :format, :xml, :taken_at, :hash)""" % (self.table_name, self.table_name),
+                    values)
+        pooled.schedule_prune(
+            self.table_name, values['cli'], self.max_snapshots, self.max_age_days)
+
+    def insert_merkle(self, data, index, xml_data, codec=None):
+        """
+        Store hash index of a snapshot, shared by all snapshots having same data
+        :param data: snapshot data as stored by insert_data()
+        :param index: merkle.MerkleIndex of snapshot
+        :param xml_data: uncompressed snapshot data
+        :param codec: compression format of snapshot, index is compressed alike
+        """
+        pooled = self._connection()
+        xml_hash = content_store.digest(xml_data)
+        tree = index.dumps(xml_hash)
+        if codec is not None:
+            tree = compression.compress(tree, codec)
+        _write(pooled, self._insert_merkle, {
+            'hash': xml_hash, 'data_hash': hashlib.sha1(data).hexdigest(),
+            'tree': sqlite3.Binary(tree)})
+
+    def _insert_merkle(self, pooled, values):
+        con = pooled.conn
+        if con.execute("select 1 from %s where hash = :hash" % MERKLE_TABLE,
+                       values).fetchone() is not None:
+            return
+        con.execute("insert into %s (hash, data_hash, tree) values (:hash, :data_hash, :tree)" % MERKLE_TABLE,
+                    values)
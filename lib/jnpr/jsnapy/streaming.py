@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+# Copyright (c) 1999-2016, Juniper Networks Inc.
+#
+# All rights reserved.
+#
+
+"""
+Streaming parse of big snapshot files.
+When xpath of every test on a command is a simple path of element names,
+tests need only nodes found at those paths. Snapshot is then parsed with
+iterparse, keeping these nodes (along with their ancestors) and dropping every
+other element as soon as it is parsed, so that memory needed is that of nodes
+tested and not of complete snapshot. Tests which need anything else from
+snapshot are run on complete tree.
+"""
+
+import re
+from lxml import etree
+from jnpr.jsnapy.testop import get_placeholders
+
+# xpath of test: element names separated by '/', relative to root element or
+# starting with '/' or '//'
+_NAME = r'[A-Za-z_][\w.-]*'
+_BLOCK_PATH = re.compile(r'^(/{1,2})?%s(/%s)*$' % (_NAME, _NAME))
+# nodes and ids tested, looked up relative to node found at xpath of test,
+# they should not go out of that node
+_NODE_PATH = re.compile(r'^(\./)?@?%s(/@?%s)*$|^\.$' % (_NAME, _NAME))
+
+
+def _test_paths(test):
+    """
+    :param test: one test case (iterate or item) of a command
+    :return: xpath of test, and paths looked up under nodes found at xpath
+    """
+    block = test.get('iterate') if 'iterate' in test else test.get('item')
+    x_path = block.get('xpath', "no_xpath")
+    ids = block.get('id', [])
+    if not isinstance(ids, list):
+        ids = [val.strip() for val in ids.split(',')]
+    paths = list(ids)
+    for path in block.get('tests', []):
+        testop = [key for key in path if key not in ['err', 'info']]
+        testop = testop[0] if testop else None
+        ele = path.get(testop)
+        if ele is None:
+            continue
+        ele_list = [elements.strip() for elements in ele.split(',')]
+        # all-same compares nodes with value at another xpath of snapshot
+        if testop == 'all-same' and len(ele_list) > 1:
+            return x_path, None
+        paths.append(ele_list[0])
+        for mssg in [path.get('err'), path.get('info')]:
+            if mssg is None:
+                continue
+            paths.extend(val for _, val in get_placeholders(mssg)
+                         if val not in [x_path, ele_list[0]])
+    return x_path, paths
+
+
+def stream_paths(tests):
+    """
+    Find out if snapshot can be parsed in streaming mode for given tests
+    :param tests: test cases (iterate or item) of a command
+    :return: set of xpaths to be kept while parsing snapshot, None if some
+             test needs complete snapshot
+    """
+    x_paths = set()
+    for test in tests:
+        x_path, paths = _test_paths(test)
+        if paths is None or not _BLOCK_PATH.match(x_path):
+            return None
+        if not all(_NODE_PATH.match(path) for path in paths):
+            return None
+        x_paths.add(x_path)
+    return frozenset(x_paths) if x_paths else None
+
+
+def _matcher(x_path):
+    """
+    :param x_path: simple xpath, as accepted by stream_paths()
+    :return: function telling if element, given by tags of its ancestors and
+             itself (starting from root element), is found at x_path
+    """
+    names = [name for name in x_path.split('/') if name]
+    if x_path.startswith('//'):
+        return lambda tags: tags[-len(names):] == names
+    if x_path.startswith('/'):
+        return lambda tags: tags == names
+    # relative to root element
+    return lambda tags: len(tags) == len(names) + 1 and tags[1:] == names
+
+
+def parse_paths(source, x_paths):
+    """
+    Parse snapshot keeping only elements found at given xpaths, with their
+    complete subtree and their ancestors
+    :param source: snapshot file name or file like object
+    :param x_paths: xpaths returned by stream_paths()
+    :return: lxml ElementTree
+    """
+    matchers = [_matcher(x_path) for x_path in x_paths]
+    tags = []
+    # for each open element: [found at xpath, has element to be kept under it]
+    stack = []
+    matched = 0
+    root = None
+    for event, elem in etree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            tags.append(elem.tag)
+            found = any(match(tags) for match in matchers)
+            if found:
+                matched += 1
+            stack.append([found, False])
+            continue
+        tags.pop()
+        found, keep = stack.pop()
+        if found:
+            matched -= 1
+            keep = True
+        elif matched:
+            # part of a node found at xpath
+            continue
+        parent = elem.getparent()
+        if parent is None:
+            continue
+        if keep:
+            stack[-1][1] = True
+        else:
+            parent.remove(elem)
+    return etree.ElementTree(root)
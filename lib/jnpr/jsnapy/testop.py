@@ -10,17 +10,376 @@ import colorama
 import jinja2
 import logging
 import lxml
-from collections import defaultdict
+import threading
+from collections import defaultdict, OrderedDict, Mapping
 from lxml import etree
-from copy import deepcopy
 import traceback
 
 colorama.init(autoreset=True)
 
+# number of compiled err/info messages kept, shared by all operators and devices
+TEMPLATE_CACHE_SIZE = 512
+
+
+class MessageCache(object):
+
+    """
+    Values computed from err/info messages (compiled template, placeholders),
+    so that each distinct message is processed only once while it stays in
+    cache. Least recently used messages are dropped beyond size.
+    """
+
+    def __init__(self, size=TEMPLATE_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+
+    def get(self, mssg, create):
+        """
+        :param mssg: err or info message given in test file
+        :param create: function computing value from message if not cached
+        """
+        with self._lock:
+            value = self._values.pop(mssg, None)
+            if value is not None:
+                self._values[mssg] = value
+                return value
+        value = create(mssg)
+        with self._lock:
+            self._values[mssg] = value
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+        return value
+
+_templates = MessageCache()
+_placeholders = MessageCache()
+
+
+def get_template(mssg):
+    """
+    :param mssg: err or info message given in test file
+    :return: compiled jinja2.Template of message
+    """
+    return _templates.get(mssg, jinja2.Template)
+
+
+def _parse_placeholders(mssg):
+    names = []
+    for e in re.findall('{{\s?(.*?)\s?}}', mssg):
+        if (e.startswith("post") or e.startswith("Post")):
+            names.append(('post', e[6:-2]))
+        if (e.startswith("pre") or e.startswith("PRE")):
+            names.append(('pre', e[5:-2]))
+    return tuple(names)
+
+
+def get_placeholders(mssg):
+    """
+    :param mssg: err or info message given in test file
+    :return: tuple of ('pre' or 'post', node name) for every {{pre['node']}}
+             or {{post['node']}} used in message
+    """
+    return _placeholders.get(mssg, _parse_placeholders)
+
+
+class RenderedMessage(object):
+
+    """
+    Err/info message rendered only when a log handler formats it, and only
+    once for all handlers. Values are copied, as operators keep updating same
+    dicts for next nodes.
+    """
+
+    __slots__ = ('template', 'iddict', 'predict', 'postdict', '_text')
+
+    def __init__(self, template, iddict, predict, postdict):
+        self.template = template
+        self.iddict = dict(iddict)
+        self.predict = dict(predict)
+        self.postdict = dict(postdict)
+        self._text = None
+
+    def __unicode__(self):
+        if self._text is None:
+            self._text = self.template.render(
+                self.iddict, pre=self.predict, post=self.postdict)
+        return self._text
+
+    def __str__(self):
+        return self.__unicode__()
+
+class ReadOnlyMapping(object):
+
+    """
+    Read only dict interface built on __getitem__, __iter__ and __len__.
+    Same as collections.Mapping, but without instance __dict__ so that
+    subclasses using __slots__ stay small.
+    """
+
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def iteritems(self):
+        for key in self:
+            yield (key, self[key])
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+class FrozenDict(ReadOnlyMapping):
+
+    """
+    Read only copy of dict, taken when result of a node is recorded
+    """
+
+    __slots__ = ('_dict',)
+
+    def __init__(self, values):
+        self._dict = dict(values)
+
+    def __getitem__(self, key):
+        return self._dict[key]
+
+    def __iter__(self):
+        return iter(self._dict)
+
+    def __len__(self):
+        return len(self._dict)
+
+    def __repr__(self):
+        return repr(self._dict)
+
+    def __reduce__(self):
+        return (FrozenDict, (self._dict,))
+
+    def to_dict(self):
+        return dict(self._dict)
+
+
+class NodeResult(ReadOnlyMapping):
+
+    """
+    Immutable result of test on one node, as kept in 'passed' and 'failed'
+    lists of test details. Behaves like the dict it is built from, tuple of
+    keys is shared by all results having same keys.
+    """
+
+    __slots__ = ('_keys', '_values')
+
+    def __init__(self, keys, values):
+        self._keys = keys
+        self._values = values
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return (NodeResult, (self._keys, self._values))
+
+    def to_dict(self):
+        """
+        :return: plain dict, with nested values converted to dicts as well
+        """
+        return dict((key, value.to_dict() if isinstance(value, FrozenDict) else value)
+                    for key, value in zip(self._keys, self._values))
+
+Mapping.register(FrozenDict)
+Mapping.register(NodeResult)
+
+_key_tuples = {}
+
+
+def node_result(values):
+    """
+    Record result of a node. Dicts operators keep updating for next nodes
+    (id, pre and post values) are copied one level deep, which is enough as
+    their values are replaced rather than modified.
+    :param values: dict of result of node
+    :return: NodeResult
+    """
+    keys = tuple(values)
+    keys = _key_tuples.setdefault(keys, keys)
+    return NodeResult(keys, tuple(FrozenDict(value) if isinstance(value, dict) else value
+                                  for value in values.itervalues()))
+
+def _plain(value):
+    """
+    :return: copy of value with NodeResult and FrozenDict turned into dicts
+    """
+    if isinstance(value, (NodeResult, FrozenDict)):
+        return _plain(value.to_dict())
+    if isinstance(value, dict):
+        return dict((key, _plain(val)) for key, val in value.iteritems())
+    if isinstance(value, list):
+        return [_plain(val) for val in value]
+    return value
+
+# compiled XPath expressions, kept per thread as evaluating same XPath object
+# from several threads at once is not safe
+_xpath_cache = threading.local()
+XPATH_CACHE_SIZE = 1024
+
+
+def xpath(node, expr):
+    """
+    Evaluate XPath expression on node, expression is compiled once per thread
+    and reused for all nodes, tests and devices. Expression which can not be
+    compiled is evaluated by node.xpath(), so that error reported stays same.
+    :param node: lxml Element or ElementTree
+    :param expr: XPath expression
+    :return: result of XPath
+    """
+    compiled = getattr(_xpath_cache, 'compiled', None)
+    if compiled is None:
+        compiled = _xpath_cache.compiled = {}
+    evaluate = compiled.get(expr)
+    if evaluate is None:
+        if len(compiled) >= XPATH_CACHE_SIZE:
+            compiled.clear()
+        try:
+            evaluate = etree.XPath(expr)
+        except etree.XPathSyntaxError:
+            evaluate = False
+        compiled[expr] = evaluate
+    if evaluate is False:
+        return node.xpath(expr)
+    return evaluate(node)
+
+
+class IdIndex(object):
+
+    """
+    Nodes found at an xpath, indexed by values of their ids.
+    Used by "no-diff", "list-not-less", "list-not-more" and "delta", ids of
+    each node and elements tested under it are extracted only once, however
+    many operators are run on same iterate block.
+    """
+    __slots__ = ('nodes', 'id_list', 'data', '_ids', '_elements', '_texts')
+
+    def __init__(self, nodes, id_list):
+        """
+        :param nodes: nodes found at xpath
+        :param id_list: list of ids
+        """
+        self.nodes = nodes
+        self.id_list = id_list
+        # dictionary of id values and their node, filled by Operator._index_data()
+        self.data = None
+        self._ids = {}
+        self._elements = {}
+        self._texts = {}
+
+    def ids(self, k):
+        """
+        :param k: id values of a node
+        :return: ids as shown in messages (id_0, id_1 ..etc) and mapping of
+                 id name to its value
+        """
+        ids = self._ids.get(k)
+        if ids is None:
+            iddict = {}
+            id_val = {}
+            for length in range(len(k)):
+                iddict['id_' + str(length)] = [value.strip() for value in k[length]]
+            for length in range(len(k)):
+                id_val[self.id_list[length]] = k[length][0].strip()
+            ids = self._ids[k] = (iddict, id_val)
+        return ids
+
+    def elements(self, k, element):
+        """
+        :param k: id values of a node
+        :param element: element to be tested, relative to node
+        :return: element nodes found under node having id values k
+        """
+        key = (k, element)
+        nodes = self._elements.get(key)
+        if nodes is None:
+            nodes = self._elements[key] = xpath(self.data[k], element)
+        return nodes
+
+    def texts(self, k, element):
+        """
+        :return: stripped text of element nodes found under node having id values k
+        """
+        key = (k, element)
+        values = self._texts.get(key)
+        if values is None:
+            values = self._texts[key] = [node.text.strip()
+                                         for node in self.elements(k, element)]
+        return values
+
+# what is kept in test details about nodes tested
+RETAIN_ALL = 'all'
+RETAIN_FAILURES = 'failures-only'
+RETAIN_COUNTS = 'counts-only'
+RETENTION_POLICIES = (RETAIN_ALL, RETAIN_FAILURES, RETAIN_COUNTS)
+
+# result messages of operators which always pass when pre and post snapshots
+# are identical, unless tested element has no text
+IDENTICAL_SNAP_MSSG = {
+    'no-diff': 'All "{0}" is same in pre and post snapshot [ {1} matched ]',
+    'list-not-less': 'All "{0}" in pre snapshot is present in post snapshot [ {1} matched ]',
+    'list-not-more': 'All "{0}" in post snapshot is present in pre snapshot [ {1} matched ]',
+}
+
 
 class Operator:
 
-    def __init__(self):
+    def __init__(self, retention=None):
+        """
+        :param retention: details kept for every test, 'all' keeps result of
+                          each node tested, 'failures-only' only of failed nodes,
+                          'counts-only' keeps only count of passed and failed nodes
+        """
         self.result = True
         self.no_failed = 0
         self.no_passed = 0
@@ -29,13 +388,32 @@ class Operator:
         self.test_details = defaultdict(list)
         colorama.init(autoreset=True)
         self.logger_testop = logging.getLogger(__name__)
+        if retention is None:
+            retention = RETAIN_ALL
+        if retention not in RETENTION_POLICIES:
+            self.logger_testop.error(colorama.Fore.RED +
+                                     "ERROR!! result retention can be one of %s, keeping all results" %
+                                     ", ".join(RETENTION_POLICIES), extra=self.log_detail)
+            retention = RETAIN_ALL
+        self.retention = retention
+        # nodes of test blocks and values extracted from them, shared by all
+        # operators of a block so that XPaths are evaluated only once; each
+        # operator still goes through the nodes itself
+        self._block_nodes = {}
+        self._node_values = {}
+        self._id_index_cache = {}
 
     def __del__(self):
         colorama.init(autoreset=True)
 
     @property
     def test_results(self):
-        return dict(self.test_details)
+        """
+        :return: test details made of plain dicts and lists, results of nodes
+                 included, so that they can be serialized as JSON or YAML
+        """
+        return dict((teston, _plain(tresults))
+                    for teston, tresults in self.test_details.items())
 
     def define_operator(
             self, logdetail, testop, x_path, ele_list, err_mssg, info_mssg, teston, iter, id, *args):
@@ -81,6 +459,134 @@ class Operator:
                                      "ERROR!! %s \nComplete Message: %s" % (type(ex).__name__, str(ex)), extra=self.log_detail)
             self.no_failed = self.no_failed + 1
 
+    def identical_snapshots(self, logdetail, testop, x_path, ele_list, err_mssg,
+                            info_mssg, teston, iter, id_list, xml):
+        """
+        Record result of test comparing pre and post snapshots having same data,
+        without comparing their nodes. Passed nodes are taken from id index of
+        snapshot, so test details are same as when test is evaluated.
+        Test is evaluated as usual if its result is not known beforehand, like
+        when xpath selects no node or tested element has no text.
+        :param logdetail: dictionary containing parameters for logging module, ex hostname
+        :param testop: test operation, like "no-diff"
+        :param x_path: Xpath in test file
+        :param ele_list: Node name and other parameters of test operation
+        :param err_mssg: Error message
+        :param info_mssg: Info message
+        :param teston: Command or RPC to be tested
+        :param iter: if true, test operation is iterated to all nodes
+        :param id_list: list of ids
+        :param xml: snapshot, same for pre and post
+        :return: True if test is recorded, False if it has to be evaluated
+        """
+        if testop not in IDENTICAL_SNAP_MSSG:
+            return False
+        self.log_detail = logdetail
+        element = ele_list[0]
+        try:
+            no_node = re.match(element, "no node")
+            if no_node and testop == 'no-diff':
+                return False
+            index = self._id_index(iter, x_path, id_list, xml)
+            if not index.nodes:
+                return False
+            data = self._index_data(index)
+            # ids in same order as operator iterates them, "no-diff" goes
+            # through union of pre and post ids
+            if testop == 'no-diff':
+                keys = list(set(data.keys()).union(set(data.keys())))
+            else:
+                keys = list(data)
+            values = {}
+            for k in keys:
+                index.ids(k)
+                self._get_nodevalue(values, values, data[k], data[k], x_path,
+                                    element, err_mssg)
+                self._get_nodevalue(values, values, data[k], data[k], x_path,
+                                    element, info_mssg)
+                if not no_node:
+                    index.texts(k, element)
+        except Exception:
+            # error is reported by evaluating test
+            return False
+
+        self.print_testmssg(testop)
+        tresult = {
+            'xpath': x_path,
+            'testoperation': testop,
+            'node_name': element,
+            'passed': [],
+            'failed': []
+        }
+        # "list-not-less" logs nodes without element value as info
+        mode = "info" if no_node and testop == 'list-not-less' else "debug"
+        iddict = {}
+        predict = {}
+        postdict = {}
+        id_val = {}
+        count_pass = 0
+        for k in keys:
+            ids, id_values = index.ids(k)
+            iddict.update(ids)
+            id_val.update(id_values)
+            predict, postdict = self._get_nodevalue(
+                predict, postdict, data[k], data[k], x_path, element, err_mssg)
+            predict, postdict = self._get_nodevalue(
+                predict, postdict, data[k], data[k], x_path, element, info_mssg)
+            if no_node:
+                val_list = [None]
+            elif testop == 'no-diff':
+                val_list = [index.texts(k, element) or None]
+            else:
+                val_list = index.texts(k, element)
+            for val in val_list:
+                node_value_passed = {
+                    'id': id_val,
+                    'pre': predict,
+                    'post': postdict}
+                if not no_node:
+                    if testop != 'list-not-more':
+                        predict[element] = val
+                    if testop != 'list-not-less':
+                        postdict[element] = val
+                    node_value_passed['pre_node_value'] = val
+                    node_value_passed['post_node_value'] = val
+                count_pass = count_pass + 1
+                self._print_message(info_mssg, iddict, predict, postdict, mode)
+                self._add_passed(tresult, node_value_passed)
+
+        self._print_result(
+            IDENTICAL_SNAP_MSSG[testop].format(element, count_pass), True)
+        tresult['result'] = True
+        tresult['count'] = {'pass': count_pass, 'fail': 0}
+        self.add_test_details(teston, tresult)
+        return True
+
+    def _add_passed(self, tresult, node_value):
+        """
+        Record passed node in test result, if retention policy keeps it
+        """
+        if self.retention == RETAIN_ALL:
+            tresult['passed'].append(node_result(node_value))
+
+    def _add_failed(self, tresult, node_value):
+        """
+        Record failed node in test result, if retention policy keeps it
+        """
+        if self.retention != RETAIN_COUNTS:
+            tresult['failed'].append(node_result(node_value))
+
+    def add_test_details(self, teston, tresult):
+        """
+        Add result of a test to test details of command/RPC
+        :param teston: Command or RPC tested
+        :param tresult: dict containing result of test
+        """
+        if self.retention == RETAIN_COUNTS and tresult.get('diff_on'):
+            # differences found by --check without test operator
+            tresult['diff_on'] = []
+        self.test_details[teston].append(tresult)
+
     def _print_result(self, testmssg, result):
         if result is False:
             self.no_failed = self.no_failed + 1
@@ -106,13 +612,20 @@ class Operator:
             extra=self.log_detail)
 
     def _print_message(self, mssg, iddict, predict, postdict, mode="info"):
+        """
+        Log err/info message. Message is not rendered at all if logger would
+        discard it, and otherwise only when a handler emits it.
+        :param mode: logging method, like "info" or "debug"
+        """
+        if not self.logger_testop.isEnabledFor(getattr(logging, mode.upper())):
+            return
+        # message goes as argument of unicode format, so that getMessage()
+        # gives unicode text to utf8 file handlers
         getattr(
             self.logger_testop,
             mode)(
-            jinja2.Template(mssg).render(
-                iddict,
-                pre=predict,
-                post=postdict),
+            u"%s",
+            RenderedMessage(get_template(mssg), iddict, predict, postdict),
             extra=self.log_detail)
 
 # two for loops, one for xpath, other for iterating nodes inside xpath, if value is not
@@ -127,25 +640,66 @@ class Operator:
         :param xml2: post snapshot
         :return: return prenodes and postnodes in given xpath
         """
+        # separate lists, as operators may add nodes to them
+        post_nodes = list(self._find_nodes(iter, x_path, xml2))
         if xml1 is not None:
-            pre_nodes = xml1.xpath(x_path)if iter else xml1.xpath(x_path)[0:1]
+            pre_nodes = list(self._find_nodes(iter, x_path, xml1))
         else:
-            pre_nodes = xml2.xpath(x_path) if iter else xml2.xpath(x_path)[0:1]
-        post_nodes = xml2.xpath(x_path) if iter else xml2.xpath(x_path)[0:1]
+            pre_nodes = list(post_nodes)
         return pre_nodes, post_nodes
 
+    def _find_nodes(self, iter, x_path, xml):
+        """
+        Nodes at given xpath in snapshot, found once for all operators of a
+        test block
+        :return: list of nodes, not to be modified
+        """
+        key = (id(xml), x_path, iter)
+        entry = self._block_nodes.get(key)
+        if entry is None or entry[0] is not xml:
+            nodes = xpath(xml, x_path)
+            if not iter:
+                nodes = nodes[0:1]
+            entry = self._block_nodes[key] = (xml, nodes)
+        return entry[1]
+
+    def _node_xpath(self, node, expr):
+        """
+        Evaluate XPath relative to a node of test block, result is reused by
+        other operators of same block
+        """
+        key = (node, expr)
+        value = self._node_values.get(key)
+        if value is None:
+            value = self._node_values[key] = xpath(node, expr)
+        # separate list, as operators may add nodes to it
+        return list(value) if isinstance(value, list) else value
+
+    def _node_text(self, node, path):
+        """
+        Stripped text of element at path under node of test block
+        """
+        key = (node, path, 'text')
+        try:
+            return self._node_values[key]
+        except KeyError:
+            value = node.findtext(path)
+            if value is not None:
+                value = value.strip()
+            self._node_values[key] = value
+            return value
+
     def _find_element(self, id_list, iddict, element, pre_node, post_node):
         """
         get element node for test operation
         Not used by "no-diff", "list-not-less", "list-not-more" and "delta" functions
         """
-        prenode = pre_node.xpath(element)
-        postnode = post_node.xpath(element)
+        prenode = self._node_xpath(pre_node, element)
+        postnode = self._node_xpath(post_node, element)
         id_val = {}
         for j in range(len(id_list)):
-            val = post_node.xpath(
-                id_list[j])[0].text.strip() if post_node.xpath(
-                id_list[j]) else None
+            id_nodes = self._node_xpath(post_node, id_list[j])
+            val = id_nodes[0].text.strip() if id_nodes else None
             iddict[
                 'id_' +
                 str(j)] = val
@@ -198,24 +752,64 @@ class Operator:
             data[tuple(val)] = path
         return data
 
+    def _id_index(self, iter, x_path, id_list, xml):
+        """
+        Id index of nodes at given xpath in snapshot, built once and shared
+        by all operators testing same iterate block
+        """
+        key = (id(xml), x_path, iter, tuple(id_list))
+        entry = self._id_index_cache.get(key)
+        if entry is None or entry[0] is not xml:
+            entry = (xml, IdIndex(self._find_nodes(iter, x_path, xml), id_list))
+            self._id_index_cache[key] = entry
+        return entry[1]
+
+    def _id_indexes(self, iter, x_path, id_list, xml1=None, xml2=None):
+        """
+        Used by "no-diff", "list-not-less", "list-not-more" and "delta" functions
+        in place of _find_xpath() and _get_data()
+        :param iter: if true, it will iterate through all nodes
+        :param x_path: Xpath in Test file
+        :param id_list: list of ids
+        :param xml1: pre snapshot
+        :param xml2: post snapshot
+        :return: IdIndex of pre nodes and of post nodes
+        """
+        post_index = self._id_index(iter, x_path, id_list, xml2)
+        if xml1 is None:
+            return post_index, post_index
+        return self._id_index(iter, x_path, id_list, xml1), post_index
+
+    def _index_data(self, index):
+        """
+        :param index: IdIndex
+        :return: dictionary containing ids and their respective nodes, see _get_data()
+        """
+        if index.data is None:
+            index.data = self._get_data(index.id_list, index.nodes)
+        return index.data
+
+    def clear_node_cache(self):
+        """
+        Drop nodes, values and id indexes kept for test blocks, called once
+        tests on a command are done so that snapshots are not kept in memory
+        """
+        self._block_nodes.clear()
+        self._node_values.clear()
+        self._id_index_cache.clear()
+
     def _get_nodevalue(
             self, predict, postdict, pre_nodes, post_nodes, x_path, element, mssg):
         """
         Used to calculate value of any node mentioned inside info and error messages
         """
-        mssg = re.findall('{{\s?(.*?)\s?}}', mssg)
-        for e in mssg:
-            if (e.startswith("post") or e.startswith("Post")):
-                val = e[6:-2]
-                if val not in [x_path, element]:
-                    postdict[val] = post_nodes.findtext(
-                        val).strip()if post_nodes.findtext(val) is not None else None
-
-            if (e.startswith("pre") or e.startswith("PRE")):
-                val = e[5:-2]
-                if val not in [x_path, element]:
-                    predict[val] = pre_nodes.findtext(
-                        val).strip() if pre_nodes.findtext(val) is not None else None
+        for snap, val in get_placeholders(mssg):
+            if val in [x_path, element]:
+                continue
+            if snap == 'post':
+                postdict[val] = self._node_text(post_nodes, val)
+            else:
+                predict[val] = self._node_text(pre_nodes, val)
         return predict, postdict
 
     def exists(self, x_path, ele_list, err_mssg, info_mssg,
@@ -262,7 +856,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 for i in range(len(post_nodes)):
@@ -296,8 +890,7 @@ class Operator:
                                 'pre': predict,
                                 'post': postdict,
                                 'actual_node_value': post_nodevalue}
-                            tresult['passed'].append(
-                                deepcopy(node_value_passed))
+                            self._add_passed(tresult, node_value_passed)
                             self._print_message(
                                 info_mssg,
                                 iddict,
@@ -318,7 +911,7 @@ class Operator:
                             'id': id_val,
                             'pre': predict,
                             'post': postdict}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
 
         if res is False:
             msg = 'All "%s" do not exists at xpath "%s" [ %d matched / %d failed ]' % (
@@ -331,7 +924,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def not_exists(self, x_path, ele_list, err_mssg, info_mssg,
                    teston, iter, id_list, xml1, xml2):
@@ -373,7 +966,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 for i in range(len(post_nodes)):
@@ -409,8 +1002,7 @@ class Operator:
                                 'pre': predict,
                                 'post': postdict,
                                 'actual_node_value': post_nodevalue}
-                            tresult['failed'].append(
-                                deepcopy(node_value_failed))
+                            self._add_failed(tresult, node_value_failed)
                     else:
                         self._print_message(
                             info_mssg,
@@ -423,7 +1015,7 @@ class Operator:
                             'id': id_val,
                             'PRE': predict,
                             'POST': postdict}
-                        tresult['passed'].append(deepcopy(node_value_passed))
+                        self._add_passed(tresult, node_value_passed)
         if res is False:
             msg = ' "%s" exists at xpath "%s" [ %d matched / %d failed ]' % (
                 element, x_path, count_pass, count_fail)
@@ -434,7 +1026,7 @@ class Operator:
             self._print_result(msg, res)
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def all_same(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -473,16 +1065,17 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 if len(ele_list) >= 2:
                     vpath = x_path + ele_list[1] + '/' + ele_list[0]
-                    value1 = xml2.xpath(vpath)
+                    value1 = xpath(xml2, vpath)
                     value = value1[0].text.strip() if len(
                         value1) != 0 else None
                 else:
-                    value = xml2.xpath(
+                    value = xpath(
+                        xml2,
                         x_path +
                         '/' +
                         ele_list[0])[0].text.strip()
@@ -522,8 +1115,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                             else:
                                 count_pass = count_pass + 1
                                 self._print_message(
@@ -537,8 +1129,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
 
         if res is False:
             msg = 'Value of all "%s" at xpath "%s" is not same [ %d matched / %d failed ]' % (
@@ -550,7 +1141,7 @@ class Operator:
             self._print_result(msg, res)
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def is_equal(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -593,7 +1184,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 for i in range(len(post_nodes)):
@@ -626,8 +1217,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                                 count_pass = count_pass + 1
                                 self._print_message(
                                     info_mssg,
@@ -641,8 +1231,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                                 res = False
                                 count_fail = count_fail + 1
                                 self._print_message(
@@ -659,7 +1248,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
                         res = False
                         count_fail = count_fail + 1
         if res is False:
@@ -673,7 +1262,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def not_equal(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -715,7 +1304,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 for i in range(len(post_nodes)):
@@ -745,8 +1334,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                                 self._print_message(
                                     info_mssg,
                                     iddict,
@@ -760,8 +1348,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                                 res = False
                                 self._print_message(
                                     err_mssg,
@@ -781,7 +1368,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
 
         if res is False:
             msg = 'All "%s" is equal to "%s" [ %d matched / %d failed ]' % (
@@ -794,7 +1381,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def in_range(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -845,7 +1432,7 @@ class Operator:
                         'post': postdict,
                         'actual_node_value': None,
                         'xpath_error': True}
-                    tresult['failed'].append(deepcopy(node_value_failed))
+                    self._add_failed(tresult, node_value_failed)
 
                 else:
                     for i in range(len(post_nodes)):
@@ -884,8 +1471,7 @@ class Operator:
                                         'pre': predict,
                                         'post': postdict,
                                         'actual_node_value': post_nodevalue}
-                                    tresult['passed'].append(
-                                        deepcopy(node_value_passed))
+                                    self._add_passed(tresult, node_value_passed)
                                 else:
                                     res = False
                                     self._print_message(
@@ -900,8 +1486,7 @@ class Operator:
                                         'pre': predict,
                                         'post': postdict,
                                         'actual_node_value': post_nodevalue}
-                                    tresult['failed'].append(
-                                        deepcopy(node_value_failed))
+                                    self._add_failed(tresult, node_value_failed)
 
                         else:
                             self.logger_testop.error(colorama.Fore.RED + "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path,
@@ -913,8 +1498,7 @@ class Operator:
                                 'pre': predict,
                                 'post': postdict,
                                 'actual_node_value': None}
-                            tresult['failed'].append(
-                                deepcopy(node_value_failed))
+                            self._add_failed(tresult, node_value_failed)
         if res is False:
             msg = 'All "%s" is not in range:  "%f - %f" [ %d matched / %d failed ]' % (
                 element, range1, range2, count_pass, count_fail)
@@ -925,7 +1509,7 @@ class Operator:
             self._print_result(msg, res)
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def not_range(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -976,7 +1560,7 @@ class Operator:
                         'post': postdict,
                         'actual_node_value': None,
                         'xpath_error': True}
-                    tresult['failed'].append(deepcopy(node_value_failed))
+                    self._add_failed(tresult, node_value_failed)
 
                 else:
                     for i in range(len(post_nodes)):
@@ -1015,8 +1599,7 @@ class Operator:
                                         'pre': predict,
                                         'post': postdict,
                                         'actual_node_value': post_nodevalue}
-                                    tresult['passed'].append(
-                                        deepcopy(node_value_passed))
+                                    self._add_passed(tresult, node_value_passed)
                                 else:
                                     res = False
                                     count_fail = count_fail + 1
@@ -1031,8 +1614,7 @@ class Operator:
                                         'pre': predict,
                                         'post': postdict,
                                         'actual_node_value': post_nodevalue}
-                                    tresult['failed'].append(
-                                        deepcopy(node_value_failed))
+                                    self._add_failed(tresult, node_value_failed)
                         else:
                             self.logger_testop.error(colorama.Fore.RED + "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path,
                                                                                                                                         id_val), extra=self.log_detail)
@@ -1043,8 +1625,7 @@ class Operator:
                                 'pre': predict,
                                 'post': postdict,
                                 'actual_node_value': None}
-                            tresult['failed'].append(
-                                deepcopy(node_value_failed))
+                            self._add_failed(tresult, node_value_failed)
         if res is False:
             msg = 'All "%s" is in range:  "%f - %f" [ %d matched / %d failed ]' % (
                 element, range1, range2, count_pass, count_fail)
@@ -1056,7 +1637,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def is_gt(self, x_path, ele_list, err_mssg,
               info_mssg, teston, iter, id_list, xml1, xml2):
@@ -1098,7 +1679,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 for i in range(len(post_nodes)):
@@ -1135,8 +1716,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                             else:
                                 res = False
                                 self._print_message(
@@ -1151,8 +1731,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
 
                     else:
                         self.logger_testop.error(colorama.Fore.RED + "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path,
@@ -1164,7 +1743,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
 
         if res is False:
             msg = 'All "%s" is not greater than  "%d" [ %d matched / %d failed ]' % (
@@ -1177,7 +1756,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def is_lt(self, x_path, ele_list, err_mssg,
               info_mssg, teston, iter, id_list, xml1, xml2):
@@ -1220,7 +1799,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
             else:
                 for i in range(len(post_nodes)):
                     # if length of pre node is less than post node, assign
@@ -1256,8 +1835,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                             else:
                                 res = False
                                 self._print_message(
@@ -1272,8 +1850,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                     else:
                         self.logger_testop.error(colorama.Fore.RED + "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path,
                                                                                                                                     id_val), extra=self.log_detail)
@@ -1284,7 +1861,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
 
         if res is False:
             msg = 'All "%s" is not less than %d" [ %d matched / %d failed ]' % (
@@ -1297,7 +1874,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def contains(self, x_path, ele_list, err_mssg, info_mssg,
                  teston, iter, id_list, xml1, xml2):
@@ -1341,7 +1918,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 for i in range(len(post_nodes)):
@@ -1379,8 +1956,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': postnode[k].text}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                             else:
                                 count_pass = count_pass + 1
                                 self._print_message(
@@ -1394,8 +1970,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': postnode[k].text}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                     else:
                         self.logger_testop.error(colorama.Fore.RED + "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path,
                                                                                                                                     id_val), extra=self.log_detail)
@@ -1406,7 +1981,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
         if res is False:
             msg = 'All "%s" do not contains %s" [ %d matched / %d failed ]' % (
                 element, value, count_pass, count_fail)
@@ -1418,7 +1993,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def is_in(self, x_path, ele_list, err_mssg,
               info_mssg, teston, iter, id_list, xml1, xml2):
@@ -1461,7 +2036,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
 
             else:
                 for i in range(len(post_nodes)):
@@ -1499,8 +2074,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                             else:
                                 res = False
                                 count_fail = count_fail + 1
@@ -1515,8 +2089,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                     else:
                         self.logger_testop.error(colorama.Fore.RED + "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path,
                                                                                                                                     id_val), extra=self.log_detail)
@@ -1527,7 +2100,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
 
         if res is False:
             msg = 'All "{0}" is not in list {1} [ {2} matched / {3} failed ]'.format(
@@ -1545,7 +2118,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def not_in(self, x_path, ele_list, err_mssg,
                info_mssg, teston, iter, id_list, xml1, xml2):
@@ -1588,7 +2161,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
             else:
                 for i in range(len(post_nodes)):
                     # if length of pre node is less than post node, assign
@@ -1625,8 +2198,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                             else:
                                 res = False
                                 count_fail = count_fail + 1
@@ -1641,8 +2213,7 @@ class Operator:
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                     else:
                         self.logger_testop.error(colorama.Fore.RED + "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path,
                                                                                                                                     id_val), extra=self.log_detail)
@@ -1653,7 +2224,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
 
         if res is False:
             msg = '"{0}" is in list {1} [ {2} matched / {3} failed ]'.format(
@@ -1671,7 +2242,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     ################## operator requiring two snapshots, pre and post ########
     def no_diff(self, x_path, ele_list, err_mssg,
@@ -1694,7 +2265,8 @@ class Operator:
         count_fail = 0
         id_val = {}
 
-        pre_nodes, post_nodes = self._find_xpath(iter, x_path, xml1, xml2)
+        pre_index, post_index = self._id_indexes(iter, x_path, id_list, xml1, xml2)
+        pre_nodes, post_nodes = pre_index.nodes, post_index.nodes
         if re.match(ele_list[0], "no node"):
             self.logger_testop.error(colorama.Fore.RED +
                                      "ERROR!! 'no-diff' operator requires node value to test !!", extra=self.log_detail)
@@ -1712,13 +2284,13 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
             else:
                 # assuming one iterator has unique set of ids, i.e only one node matching to id
                 # making dictionary for id and its corresponding xpath
                 # one xpath has only one set of id
-                data1 = self._get_data(id_list, pre_nodes)
-                data2 = self._get_data(id_list, post_nodes)
+                data1 = self._index_data(pre_index)
+                data2 = self._index_data(post_index)
                 # making union of id keys
                 data1_key = set(data1.keys())
                 data2_key = set(data2.keys())
@@ -1727,27 +2299,21 @@ class Operator:
                 # iterating through ids which are present either in pre
                 # snapshot or post snapshot or both
                 for k in keys_union:
-                    for length in range(len(k)):
-                        # making dictionary of ids for given xpath, ex id_0,
-                        # id_1 ..etc
-                        iddict[
-                            'id_' + str(length)] = [k[length][i].strip() for i in range(len(k[length]))]
+                    # making dictionary of ids for given xpath, ex id_0,
+                    # id_1 ..etc, and mapping id name to its value
+                    index = pre_index if k in data1 else post_index
+                    ids, id_values = index.ids(k)
+                    iddict.update(ids)
                     if k in data1 and k in data2:
-                        # mapping id name to its value
-                        for length in range(len(k)):
-                            id_val[id_list[length]] = k[length][0].strip()
+                        id_val.update(id_values)
 
                         predict, postdict = self._get_nodevalue(
                             predict, postdict, data1[k], data2[k], x_path, ele_list[0], err_mssg)
                         predict, postdict = self._get_nodevalue(
                             predict, postdict, data1[k], data2[k], x_path, ele_list[0], info_mssg)
 
-                        ele_xpath1 = data1.get(k).xpath(ele_list[0])
-                        ele_xpath2 = data2.get(k).xpath(ele_list[0])
-                        val_list1 = [element.text.strip() for element in ele_xpath1] if len(
-                            ele_xpath1) != 0 else None
-                        val_list2 = [element.text.strip() for element in ele_xpath2] if len(
-                            ele_xpath2) != 0 else None
+                        val_list1 = pre_index.texts(k, ele_list[0]) or None
+                        val_list2 = post_index.texts(k, ele_list[0]) or None
 
                         predict[ele_list[0]] = val_list1
                         postdict[ele_list[0]] = val_list2
@@ -1767,8 +2333,7 @@ class Operator:
                                 'post': postdict,
                                 'pre_node_value': val_list1,
                                 'post_node_value': val_list2}
-                            tresult['failed'].append(
-                                deepcopy(node_value_failed))
+                            self._add_failed(tresult, node_value_failed)
 
                         else:
                             count_pass = count_pass + 1
@@ -1784,34 +2349,30 @@ class Operator:
                                 'post': postdict,
                                 'pre_node_value': val_list1,
                                 'post_node_value': val_list2}
-                            tresult['passed'].append(
-                                deepcopy(node_value_passed))
+                            self._add_passed(tresult, node_value_passed)
 
                     else:
                         self.logger_testop.error(colorama.Fore.RED +
                                                  "ID gone missing!!!", extra=self.log_detail)
                         # mapping id name to its value
-                        for length in range(len(k)):
-                            id_val[id_list[length]] = k[length][0].strip()
+                        id_val.update(id_values)
                         if k in data1:
                             self.logger_testop.error(
                                 "ID list '%s' is not present in post snapshot" %
                                 iddict, extra=self.log_detail)
-                            tresult['failed'].append(
-                                {'id_missing_post': deepcopy(id_val)})
+                            self._add_failed(tresult, {'id_missing_post': id_val})
                         else:
                             self.logger_testop.error(
                                 "ID list '%s' is not present in pre snapshot" %
                                 iddict, extra=self.log_detail)
-                            tresult['failed'].append(
-                                {'id_missing_pre': deepcopy(id_val)})
+                            self._add_failed(tresult, {'id_missing_pre': id_val})
                         # tresult['id_miss_match'].append(iddict.copy())
-                        self.logger_testop.debug(colorama.Fore.RED +
-                                                 jinja2.Template(
-                                                     err_mssg).render(
-                                                     iddict,
-                                                     pre=predict,
-                                                     post=postdict), extra=self.log_detail)
+                        self._print_message(
+                            colorama.Fore.RED + err_mssg,
+                            iddict,
+                            predict,
+                            postdict,
+                            "debug")
                         res = False
                         count_fail = count_fail + 1
         if res is False:
@@ -1828,7 +2389,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def list_not_less(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -1850,7 +2411,8 @@ class Operator:
         count_fail = 0
         id_val = {}
 
-        pre_nodes, post_nodes = self._find_xpath(iter, x_path, xml1, xml2)
+        pre_index, post_index = self._id_indexes(iter, x_path, id_list, xml1, xml2)
+        pre_nodes, post_nodes = pre_index.nodes, post_index.nodes
 
         if not pre_nodes or not post_nodes:
             self.logger_testop.error(colorama.Fore.RED +
@@ -1865,20 +2427,19 @@ class Operator:
                 'post': postdict,
                 'actual_node_value': None,
                 'xpath_error': True}
-            tresult['failed'].append(deepcopy(node_value_failed))
+            self._add_failed(tresult, node_value_failed)
         else:
             # assuming one iterator has unique set of ids, i.e only one node matching to id
             # making dictionary for id and its corresponding xpath
 
-            predata = self._get_data(id_list, pre_nodes)
-            postdata = self._get_data(id_list, post_nodes)
+            predata = self._index_data(pre_index)
+            postdata = self._index_data(post_index)
+            index = pre_index
 
             for k in predata:
-                for length in range(len(k)):
-                    iddict['id_' + str(length)] = [k[length][i].strip()
-                                                   for i in range(len(k[length]))]
-                for length in range(len(k)):
-                    id_val[id_list[length]] = k[length][0].strip()
+                ids, id_values = index.ids(k)
+                iddict.update(ids)
+                id_val.update(id_values)
 
                 if k in postdata:
                     predict, postdict = self._get_nodevalue(predict, postdict, predata[k], postdata[k],
@@ -1891,12 +2452,9 @@ class Operator:
                         #                                        x_path, ele_list[0], err_mssg)
                         # predict, postdict = self._get_nodevalue(predict, postdict, predata[k], postdata[k],
                         # x_path, ele_list[0], info_mssg)
-                        ele_xpath1 = predata.get(k).xpath(ele_list[0])
-                        ele_xpath2 = postdata.get(k).xpath(ele_list[0])
-                        val_list1 = [element.text.strip()
-                                     for element in ele_xpath1]
-                        val_list2 = [element.text.strip()
-                                     for element in ele_xpath2]
+                        ele_xpath1 = pre_index.elements(k, ele_list[0])
+                        val_list1 = pre_index.texts(k, ele_list[0])
+                        val_list2 = post_index.texts(k, ele_list[0])
                         # tresult['pre_node_value'].append(val_list1)
                         # tresult['post_node_value'].append(val_list2)
                         for val1 in val_list1:
@@ -1920,8 +2478,7 @@ class Operator:
                                     'post': postdict,
                                     'pre_node_value': val1,
                                     'post_node_value': ''}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
 
                             else:
                                 count_pass = count_pass + 1
@@ -1937,8 +2494,7 @@ class Operator:
                                     'post': postdict,
                                     'pre_node_value': val1,
                                     'post_node_value': val1}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                     else:
                         count_pass = count_pass + 1
                         self._print_message(
@@ -1950,18 +2506,16 @@ class Operator:
                             'id': id_val,
                             'pre': predict,
                             'post': postdict}
-                        tresult['passed'].append(deepcopy(node_value_passed))
+                        self._add_passed(tresult, node_value_passed)
                 else:
                     self.logger_testop.error(colorama.Fore.RED +
                                              "ID gone missing !! ", extra=self.log_detail)
-                    for length in range(len(k)):
-                        id_val[id_list[length]] = k[length][0].strip()
+                    id_val.update(id_values)
                     self.logger_testop.error(
                         "ID list ' %s ' is not present in post snapshots " %
                         iddict, extra=self.log_detail)
                     # tresult['id_miss_match'].append(iddict.copy())
-                    tresult['failed'].append(
-                        {'id_missing_post': deepcopy(id_val)})
+                    self._add_failed(tresult, {'id_missing_post': id_val})
                     self._print_message(
                         err_mssg,
                         iddict,
@@ -1983,7 +2537,7 @@ class Operator:
             self._print_result(msg, res)
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def list_not_more(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -2005,7 +2559,8 @@ class Operator:
         count_fail = 0
         id_val = {}
 
-        pre_nodes, post_nodes = self._find_xpath(iter, x_path, xml1, xml2)
+        pre_index, post_index = self._id_indexes(iter, x_path, id_list, xml1, xml2)
+        pre_nodes, post_nodes = pre_index.nodes, post_index.nodes
         if not pre_nodes or not post_nodes:
             self.logger_testop.error(colorama.Fore.RED +
                                      "ERROR!! Nodes are not present in given Xpath: <{}>".format(
@@ -2019,20 +2574,18 @@ class Operator:
                 'post': postdict,
                 'actual_node_value': None,
                 'xpath_error': True}
-            tresult['failed'].append(deepcopy(node_value_failed))
+            self._add_failed(tresult, node_value_failed)
         else:
             # assuming one iterator has unique set of ids, i.e only one node matching to id
             # making dictionary for id and its corresponding xpath
-            predata = self._get_data(id_list, pre_nodes)
-            postdata = self._get_data(id_list, post_nodes)
+            predata = self._index_data(pre_index)
+            postdata = self._index_data(post_index)
+            index = post_index
 
             for k in postdata:
-                for length in range(len(k)):
-                    #iddict['id_' + str(length)] = k[length].strip()
-                    iddict['id_' + str(length)] = [k[length][i].strip()
-                                                   for i in range(len(k[length]))]
-                for length in range(len(k)):
-                    id_val[id_list[length]] = k[length][0].strip()
+                ids, id_values = index.ids(k)
+                iddict.update(ids)
+                id_val.update(id_values)
 
                 if k in predata:
                     predict, postdict = self._get_nodevalue(predict, postdict, predata[k], postdata[k],
@@ -2045,12 +2598,9 @@ class Operator:
                         #                                                                x_path, ele_list[0], err_mssg)
                         #                        predict, postdict = self._get_nodevalue(predict, postdict, predata[k], postdata[k],
                         # x_path, ele_list[0], info_mssg)
-                        ele_xpath1 = predata.get(k).xpath(ele_list[0])
-                        ele_xpath2 = postdata.get(k).xpath(ele_list[0])
-                        val_list1 = [element.text.strip()
-                                     for element in ele_xpath1]
-                        val_list2 = [element.text.strip()
-                                     for element in ele_xpath2]
+                        ele_xpath2 = post_index.elements(k, ele_list[0])
+                        val_list1 = pre_index.texts(k, ele_list[0])
+                        val_list2 = post_index.texts(k, ele_list[0])
                         for val2 in val_list2:
                             postdict[ele_list[0]] = val2
                             if val2 not in val_list1:
@@ -2062,8 +2612,7 @@ class Operator:
                                     'post': postdict,
                                     'pre_node_value': '',
                                     'post_node_value': val2}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                                 self.logger_testop.error("Missing node: %s for element tag: %s and parent element %s" % (val2, ele_xpath2[0].tag,
                                                                                                                          ele_xpath2[0].getparent().tag), extra=self.log_detail)
                                 self._print_message(
@@ -2086,8 +2635,7 @@ class Operator:
                                     'post': postdict,
                                     'pre_node_value': val2,
                                     'post_node_value': val2}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
                     else:
                         count_pass = count_pass + 1
                         self._print_message(
@@ -2100,17 +2648,15 @@ class Operator:
                             'id': id_val,
                             'pre': predict,
                             'post': postdict}
-                        tresult['passed'].append(deepcopy(node_value_passed))
+                        self._add_passed(tresult, node_value_passed)
                 else:
                     self.logger_testop.error(colorama.Fore.RED +
                                              "ID gone missing!!", extra=self.log_detail)
-                    for length in range(len(k)):
-                        id_val[id_list[length]] = k[length][0].strip()
+                    id_val.update(id_values)
                     self.logger_testop.error(
                         "\nID list ' %s ' is not present in pre snapshots" %
                         iddict, extra=self.log_detail)
-                    tresult['failed'].append(
-                        {'id_missing_pre': deepcopy(id_val)})
+                    self._add_failed(tresult, {'id_missing_pre': id_val})
                     # tresult['id_miss_match'].append(iddict.copy())
                     self._print_message(
                         err_mssg,
@@ -2135,7 +2681,7 @@ class Operator:
 
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def delta(self, x_path, ele_list, err_mssg,
               info_mssg, teston, iter, id_list, xml1, xml2):
@@ -2157,7 +2703,8 @@ class Operator:
         count_fail = 0
         id_val = {}
 
-        pre_nodes, post_nodes = self._find_xpath(iter, x_path, xml1, xml2)
+        pre_index, post_index = self._id_indexes(iter, x_path, id_list, xml1, xml2)
+        pre_nodes, post_nodes = pre_index.nodes, post_index.nodes
 
         try:
             node_name = ele_list[0]
@@ -2181,13 +2728,13 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
             else:
                 # assuming one iterator has unique set of ids, i.e only one node matching to id
                 # making dictionary for id and its corresponding xpath
 
-                predata = self._get_data(id_list, pre_nodes)
-                postdata = self._get_data(id_list, post_nodes)
+                predata = self._index_data(pre_index)
+                postdata = self._index_data(post_index)
 
                 predata_keys = set(predata.keys())
                 postdata_keys = set(postdata.keys())
@@ -2196,13 +2743,9 @@ class Operator:
                 for k in keys_union:
                     # checking if id in first data set is present in second data
                     # set or not
-                    for length in range(len(k)):
-                        #iddict['id_' + str(length)] = k[length]
-                        iddict[
-                            'id_' + str(length)] = [k[length][i].strip() for i in range(len(k[length]))]
-
-                    for length in range(len(k)):
-                        id_val[id_list[length]] = k[length][0].strip()
+                    ids, id_values = (pre_index if k in predata else post_index).ids(k)
+                    iddict.update(ids)
+                    id_val.update(id_values)
 
                     if k in predata and k in postdata:
                         predict, postdict = self._get_nodevalue(
@@ -2210,8 +2753,8 @@ class Operator:
                         predict, postdict = self._get_nodevalue(
                             predict, postdict, predata[k], postdata[k], x_path, node_name, info_mssg)
                         if ele_list is not None:
-                            ele_xpath1 = predata.get(k).xpath(node_name)
-                            ele_xpath2 = postdata.get(k).xpath(node_name)
+                            ele_xpath1 = pre_index.elements(k, node_name)
+                            ele_xpath2 = post_index.elements(k, node_name)
                             if len(ele_xpath1) and len(ele_xpath2):
                                 val1 = float(
                                     ele_xpath1[0].text)  # value of desired node for pre snapshot
@@ -2241,8 +2784,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['failed'].append(
-                                            deepcopy(node_value_failed))
+                                        self._add_failed(tresult, node_value_failed)
                                     else:
                                         count_pass = count_pass + 1
                                         self._print_message(
@@ -2257,8 +2799,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['passed'].append(
-                                            deepcopy(node_value_passed))
+                                        self._add_passed(tresult, node_value_passed)
 
                                 # for positive percent change
                                 elif re.search('%', del_val) and (re.search('/+', del_val)):
@@ -2279,8 +2820,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['failed'].append(
-                                            deepcopy(node_value_failed))
+                                        self._add_failed(tresult, node_value_failed)
 
                                     else:
                                         count_pass = count_pass + 1
@@ -2296,8 +2836,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['passed'].append(
-                                            deepcopy(node_value_passed))
+                                        self._add_passed(tresult, node_value_passed)
 
                                 # absolute percent change
                                 elif re.search('%', del_val):
@@ -2319,8 +2858,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['failed'].append(
-                                            deepcopy(node_value_failed))
+                                        self._add_failed(tresult, node_value_failed)
                                     else:
                                         count_pass = count_pass + 1
                                         self._print_message(
@@ -2335,8 +2873,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['passed'].append(
-                                            deepcopy(node_value_passed))
+                                        self._add_passed(tresult, node_value_passed)
 
                                 # for negative change
                                 elif re.search('-', del_val):
@@ -2357,8 +2894,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['failed'].append(
-                                            deepcopy(node_value_failed))
+                                        self._add_failed(tresult, node_value_failed)
                                     else:
                                         count_pass = count_pass + 1
                                         self._print_message(
@@ -2373,8 +2909,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['passed'].append(
-                                            deepcopy(node_value_passed))
+                                        self._add_passed(tresult, node_value_passed)
 
                                  # for positive change
                                 elif re.search('\+', del_val):
@@ -2395,8 +2930,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['failed'].append(
-                                            deepcopy(node_value_failed))
+                                        self._add_failed(tresult, node_value_failed)
                                     else:
                                         count_pass = count_pass + 1
                                         self._print_message(
@@ -2411,8 +2945,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['passed'].append(
-                                            deepcopy(node_value_passed))
+                                        self._add_passed(tresult, node_value_passed)
                                 else:
                                     dvalue = float(delta_val.strip('%'))
                                     mvalue1 = val1 - dvalue
@@ -2432,8 +2965,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['failed'].append(
-                                            deepcopy(node_value_failed))
+                                        self._add_failed(tresult, node_value_failed)
                                     else:
                                         count_pass = count_pass + 1
                                         self._print_message(
@@ -2448,8 +2980,7 @@ class Operator:
                                             'post': postdict,
                                             'pre_node_value': val1,
                                             'post_node_value': val2}
-                                        tresult['passed'].append(
-                                            deepcopy(node_value_passed))
+                                        self._add_passed(tresult, node_value_passed)
                             else:
                                 self.logger_testop.error(
                                     colorama.Fore.RED +
@@ -2460,8 +2991,7 @@ class Operator:
                                 res = False
                                 count_fail = count_fail + 1
                     else:
-                        for length in range(len(k)):
-                            id_val[id_list[length]] = k[length][0].strip()
+                        id_val.update(id_values)
 
                         self.logger_testop.error(
                             colorama.Fore.RED +
@@ -2471,14 +3001,12 @@ class Operator:
                             self.logger_testop.error(
                                 "ID list '%s' is not present in post snapshot" %
                                 iddict, extra=self.log_detail)
-                            tresult['failed'].append(
-                                {'id_missing_post': deepcopy(id_val)})
+                            self._add_failed(tresult, {'id_missing_post': id_val})
                         else:
                             self.logger_testop.error(
                                 "ID list '%s' is not present in pre snapshot" %
                                 iddict, extra=self.log_detail)
-                            tresult['failed'].append(
-                                {'id_missing_pre': deepcopy(id_val)})
+                            self._add_failed(tresult, {'id_missing_pre': id_val})
                         self._print_message(
                             err_mssg,
                             iddict,
@@ -2502,7 +3030,7 @@ class Operator:
             self._print_result(msg, res)
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def regex(
             self, x_path, ele_list, err_mssg, info_mssg, teston, iter, id_list, xml1, xml2):
@@ -2545,7 +3073,7 @@ class Operator:
                     'post': postdict,
                     'actual_node_value': None,
                     'xpath_error': True}
-                tresult['failed'].append(deepcopy(node_value_failed))
+                self._add_failed(tresult, node_value_failed)
             else:
                 for i in range(len(post_nodes)):
                     # if length of pre node is less than post node, assign
@@ -2572,40 +3100,34 @@ class Operator:
                             if re.search(value, post_nodevalue):
                                 res = True
                                 count_pass = count_pass + 1
-                                self.logger_testop.debug(
-                                    jinja2.Template(
-                                        info_mssg.replace(
-                                            '-',
-                                            '_')).render(
-                                        iddict,
-                                        pre=predict,
-                                        post=postdict), extra=self.log_detail)
+                                self._print_message(
+                                    info_mssg.replace('-', '_'),
+                                    iddict,
+                                    predict,
+                                    postdict,
+                                    "debug")
                                 node_value_passed = {
                                     'id': id_val,
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['passed'].append(
-                                    deepcopy(node_value_passed))
+                                self._add_passed(tresult, node_value_passed)
 
                             else:
                                 res = False
                                 count_fail = count_fail + 1
-                                self.logger_testop.info(
-                                    jinja2.Template(
-                                        err_mssg.replace(
-                                            '-',
-                                            '_')).render(
-                                        iddict,
-                                        pre=predict,
-                                        post=postdict), extra=self.log_detail)
+                                self._print_message(
+                                    err_mssg.replace('-', '_'),
+                                    iddict,
+                                    predict,
+                                    postdict,
+                                    "info")
                                 node_value_failed = {
                                     'id': id_val,
                                     'pre': predict,
                                     'post': postdict,
                                     'actual_node_value': post_nodevalue}
-                                tresult['failed'].append(
-                                    deepcopy(node_value_failed))
+                                self._add_failed(tresult, node_value_failed)
                     else:
                         self.logger_testop.error(colorama.Fore.RED +
                                                  "ERROR!! Node <{}> not found at xpath <{}> for IDs: {}".format(element, x_path, id_val), extra=self.log_detail)
@@ -2616,7 +3138,7 @@ class Operator:
                             'pre': predict,
                             'post': postdict,
                             'actual_node_value': None}
-                        tresult['failed'].append(deepcopy(node_value_failed))
+                        self._add_failed(tresult, node_value_failed)
 
         if res is False:
             msg = 'All "%s" do not match with regex  "%s" [ %d matched / %d failed ]' % (
@@ -2628,7 +3150,7 @@ class Operator:
             self._print_result(msg, res)
         tresult['result'] = res
         tresult['count'] = {'pass': count_pass, 'fail': count_fail}
-        self.test_details[teston].append(tresult)
+        self.add_test_details(teston, tresult)
 
     def final_result(self, logs):
         """
@@ -5,16 +5,34 @@
 # All rights reserved.
 #
 
+import hashlib
 import logging
+from collections import defaultdict, deque
+from lxml import etree
+
 
 class XmlComparator:
 
-    def __init__(self):
+    def __init__(self, keys=None):
+        """
+        :param keys: optional dictionary of tag name and its key node (or list
+                     of key nodes), sibling nodes having these tags are matched
+                     by value of their key instead of their position
+        """
         self.logger_xml = logging.getLogger(__name__)
         self.tresult = {}
         self.tresult['result'] = True
         self.tresult['diff_on'] = []
         self.tresult['testoperation'] = "simple-diff"
+        if keys is not None and not isinstance(keys, dict):
+            self.logger_xml.error(
+                "ERROR!! xml_diff_keys should map tag names to their key nodes, "
+                "comparing nodes by position")
+            keys = None
+        self._fingerprints = {}
+        self.keys = {}
+        for tag, key in (keys or {}).items():
+            self.keys[tag] = [key] if isinstance(key, basestring) else list(key)
 
     def text_compare(self, text1, text2):
         if not text1 and not text2:
@@ -23,138 +41,185 @@ class XmlComparator:
             return True
         return (text1 or '').strip() == (text2 or '').strip()
 
-    def xml_compare(self, x1, x2, buffer):
-        flag = True
+    def fingerprint(self, node):
+        """
+        Hash of serialized subtree of node (including its tail), used to match
+        identical sibling nodes. Subtrees having same fingerprint have no
+        difference.
+        :param node: lxml Element
+        :return: sha1 digest
+        """
+        fp = self._fingerprints.get(node)
+        if fp is None:
+            fp = self._fingerprints[node] = hashlib.sha1(
+                etree.tostring(node)).digest()
+        return fp
+
+    def xml_compare(self, x1, x2, buffer, index1=None, index2=None):
+        """
+        Compare two trees node by node, trees which serialize the same are
+        skipped. Nodes are walked without recursion, differences are given to
+        buffer in document order.
+        When hash indexes of both trees are given, subtrees having same digest
+        are skipped without serializing them. Otherwise only whole trees are
+        serialized, serializing subtrees at each level would cost as much as
+        comparing them once per level.
+        :param x1: pre snapshot root
+        :param x2: post snapshot root
+        :param buffer: function called with message of each difference
+        :param index1: optional merkle.MerkleIndex of pre snapshot
+        :param index2: optional merkle.MerkleIndex of post snapshot
+        :return: test details, including list of differences
+        """
+        if index1 is None or index2 is None:
+            index1 = index2 = None
+            if etree.tostring(x1) == etree.tostring(x2):
+                return self.tresult
+        stack = [(x1, x2, 0, 0)]
+        while stack:
+            n1, n2, pos1, pos2 = stack.pop()
+            if index1 is not None and index1.digest(pos1) == index2.digest(pos2):
+                continue
+            cl1, cl2 = self.node_compare(n1, n2, buffer)
+            if self.keys:
+                pairs = self._match_children(n1, cl1, cl2, buffer)
+            else:
+                pairs = zip(cl1, cl2)
+            if index1 is not None:
+                at1 = index1.children(pos1)
+                at2 = index2.children(pos2)
+                if len(at1) == len(cl1) and len(at2) == len(cl2):
+                    if self.keys:
+                        at1 = dict(zip(cl1, at1))
+                        at2 = dict(zip(cl2, at2))
+                        pairs = [(c1, c2, at1[c1], at2[c2]) for c1, c2 in pairs]
+                    else:
+                        pairs = zip(cl1, cl2, at1, at2)
+                    # only children having different digest are pushed
+                    stack.extend(pair for pair in reversed(pairs)
+                                 if index1.digest(pair[2]) != index2.digest(pair[3]))
+                    continue
+                # index is not made from these trees
+                self.logger_xml.debug(
+                    "Hash index does not match snapshot, comparing without it")
+                index1 = index2 = None
+            stack.extend((c1, c2, None, None) for c1, c2 in reversed(pairs))
+        self._fingerprints.clear()
+        return self.tresult
+
+    def _add_diff(self, res, buffer, mssg):
+        res['result'] = False
+        self.tresult['diff_on'].append(res)
+        self.tresult['result'] = False
+        if mssg is not None:
+            buffer(mssg)
+
+    def node_compare(self, x1, x2, buffer):
+        """
+        Compare tag, attributes, text and number of children of two nodes
+        :return: children of both nodes
+        """
         if x1.tag != x2.tag:
             res = {}
-            flag = False
             res['pre_node_tag'] = x1.tag
             res['post_node_tag'] = x2.tag
-            res['result'] = flag
             res['testop'] = "tags_miss_match"
-            buffer(
-                "Tags do not match: \n   Pre: <%s>    Post: <%s>" %
-                (x1.tag, x2.tag))
-            self.tresult['diff_on'].append(res)
-            self.tresult['result'] = flag
+            self._add_diff(res, buffer,
+                           "Tags do not match: \n   Pre: <%s>    Post: <%s>" %
+                           (x1.tag, x2.tag))
 
-        for name, value in x1.attrib.items():
-            res = {}
-            if x2.attrib.get(name) != value:
-                flag = False
+        attrib1 = x1.attrib
+        attrib2 = x2.attrib
+        for name, value in attrib1.items():
+            if attrib2.get(name) != value:
+                res = {}
                 res['testop'] = "attribute_miss_match"
                 res['pre_node_tag'] = x1.tag
                 res['post_node_tag'] = x2.tag
-                res['result'] = flag
                 res['element'] = x1.tag
-                buffer("Attributes do not match:\n %s=%r, %s=%r for tag values <%s>"
-                       % (name, value, name, x2.attrib.get(name), x1.tag))
-                self.tresult['diff_on'].append(res)
-                self.tresult['result'] = flag
+                self._add_diff(res, buffer,
+                               "Attributes do not match:\n %s=%r, %s=%r for tag values <%s>"
+                               % (name, value, name, attrib2.get(name), x1.tag))
 
-        for name in x1.attrib.keys():
-            res = {}
-            if name not in x2.attrib.keys():
-                flag = False
+        for name in attrib1.keys():
+            if name not in attrib2:
+                res = {}
                 res['testop'] = "attribute_missing"
                 res['pre_node_tag'] = x1.tag
                 res['post_node_tag'] = x2.tag
-                res['result'] = flag
                 res['element'] = x1.tag
-                buffer("Attribute missing in Post snap:\n <%s> for tag value <%s>"
-                       % (name, x1.tag))
-                self.tresult['diff_on'].append(res)
-                self.tresult['result'] = flag
+                self._add_diff(res, buffer,
+                               "Attribute missing in Post snap:\n <%s> for tag value <%s>"
+                               % (name, x1.tag))
 
-        for name, value in x2.attrib.items():
-            res = {}
-            if x1.attrib.get(name) != value:
-                flag = False
+        for name, value in attrib2.items():
+            if attrib1.get(name) != value:
+                res = {}
                 res['testop'] = "attribute_miss_match"
                 res['pre_node_tag'] = x1.tag
                 res['post_node_tag'] = x2.tag
-                res['result'] = flag
                 res['element'] = x1.tag
-                self.tresult['diff_on'].append(res)
-                self.tresult['result'] = flag
+                self._add_diff(res, buffer,
+                               "Attributes do not match:\n %s=%r, %s=%r for tag values <%s>"
+                               % (name, value, name, attrib1.get(name), x2.tag))
 
-                buffer("Attributes do not match:\n %s=%r, %s=%r for tag values <%s>"
-                       % (name, value, name, x1.attrib.get(name), x2.tag))
-
-        for name in x2.attrib.keys():
-            res = {}
-            if name not in x1.attrib.keys():
-                flag = False
+        for name in attrib2.keys():
+            if name not in attrib1:
+                res = {}
                 res['pre_node_tag'] = x1.tag
                 res['post_node_tag'] = x2.tag
-                res['result'] = flag
                 res['element'] = x1.tag
                 res['testop'] = "attribute_miss_match"
-                self.tresult['diff_on'].append(res)
-                self.tresult['result'] = flag
-                buffer("Attribute missing in Pre snap:\n <%s> for tag value <%s>"
-                       % (name, x2.tag))
+                self._add_diff(res, buffer,
+                               "Attribute missing in Pre snap:\n <%s> for tag value <%s>"
+                               % (name, x2.tag))
 
         if not self.text_compare(x1.text, x2.text):
-            flag = False
+            parent = x1.getparent()
             res = {}
             res['testop'] = "value_miss_match"
             res['element'] = x1.tag
             res['pre_node_value'] = x1.text
             res['post_node_value'] = x2.text
-            res['result'] = flag
-
-            if x1.getparent() is not None:
-                res['parent_node'] = x1.getparent().tag
-                buffer(
-                    "<%s> value different: \n    Pre node text: %r    Post node text: %r    Parent node: <%s>" %
-                    (x1.tag, x1.text, x2.text, x1.getparent().tag))
+            if parent is not None:
+                res['parent_node'] = parent.tag
+                mssg = "<%s> value different: \n    Pre node text: %r    Post node text: %r    Parent node: <%s>" % \
+                    (x1.tag, x1.text, x2.text, parent.tag)
             else:
                 res['parent_node'] = None
-                buffer(
-                    "<%s> value different: \n    Pre node text: %r    Post node text: %r" %
-                    (x1.tag, x1.text, x2.text))
-
-            self.tresult['diff_on'].append(res)
-            self.tresult['result'] = flag
+                mssg = "<%s> value different: \n    Pre node text: %r    Post node text: %r" % \
+                    (x1.tag, x1.text, x2.text)
+            self._add_diff(res, buffer, mssg)
 
         if not self.text_compare(x1.tail, x2.tail):
-            flag = False
+            parent = x1.getparent()
             res = {}
             res['testop'] = "tail_different"
             res['element'] = x1.tag
             res['pre_node_value'] = x1.tail
             res['post_node_value'] = x2.tail
-            res['result'] = flag
-
-            if x1.getparent() is not None:
-                res['parent_node'] = x1.getparent().tag
-                buffer(
-                    "<%s> tail value different: Pre node tail: %r    Post node tail: %r    Parent node: <%s>" %
-                    (x1.tag, x1.tail, x2.tail, x1.getparent().tag))
+            if parent is not None:
+                res['parent_node'] = parent.tag
+                mssg = "<%s> tail value different: Pre node tail: %r    Post node tail: %r    Parent node: <%s>" % \
+                    (x1.tag, x1.tail, x2.tail, parent.tag)
             else:
                 res['parent_node'] = None
-                buffer(
-                    "<%s> tail value different: Pre node tail: %r    Post node tail: %r" %
-                    (x1.tag, x1.tail, x2.tail))
-            flag = False
-            self.tresult['diff_on'].append(res)
-            self.tresult['result'] = flag
+                mssg = "<%s> tail value different: Pre node tail: %r    Post node tail: %r" % \
+                    (x1.tag, x1.tail, x2.tail)
+            self._add_diff(res, buffer, mssg)
 
         cl1 = x1.getchildren()
         cl2 = x2.getchildren()
         if len(cl1) != len(cl2):
-            flag = False
             res = {}
-            childlist1 = [val1.tag for val1 in cl1]
-            childlist2 = [val2.tag for val2 in cl2]
+            childlist1 = set(val1.tag for val1 in cl1)
+            childlist2 = set(val2.tag for val2 in cl2)
             cval1 = [val1.tag for val1 in cl1 if val1.tag not in childlist2]
             cval2 = [val2.tag for val2 in cl2 if val2.tag not in childlist1]
             res['testop'] = "child_node_miss_match"
             res['element'] = x1.tag
             res['pre_node_no'] = len(cl1)
             res['post_node_no'] = len(cl2)
-            res['result'] = flag
 
             if len(cval1):
                 res["missing_nodes_in_post"] = ','.join(cval1)
@@ -165,11 +230,73 @@ class XmlComparator:
                 res["missing_nodes_in_pre"] = ','.join(cval2)
                 buffer("No of child nodes for tag <%s> differs\n   Pre_no: %i    Post_no: %i \n   Missing nodes in pre snapshots: <%s>"
                        % (x1.tag, len(cl1), len(cl2), ','.join(cval2)))
-            self.tresult['diff_on'].append(res)
-            self.tresult['result'] = flag
+            self._add_diff(res, buffer, None)
+        return cl1, cl2
 
-        for c1, c2 in zip(cl1, cl2):
-            if not self.xml_compare(c1, c2, buffer):
-                flag = False
-                self.tresult['result'] = flag
-        return self.tresult
+    def _key(self, node):
+        """
+        :return: value of key nodes of node, None if its tag has no key
+        """
+        key = self.keys.get(node.tag)
+        if key is None:
+            return None
+        return tuple((node.findtext(path) or '').strip() for path in key)
+
+    def _match_children(self, parent, cl1, cl2, buffer):
+        """
+        Match children of two nodes when keys are given. Nodes having a key
+        are matched by tag and value of key, other nodes are first matched
+        to identical nodes and then by position.
+        Nodes left without match are reported as missing.
+        :return: list of matched pre and post children, in order of pre children
+        """
+        keyed2 = defaultdict(deque)
+        identical2 = defaultdict(deque)
+        others2 = []
+        for c2 in cl2:
+            key = self._key(c2)
+            if key is not None:
+                keyed2[(c2.tag, key)].append(c2)
+            else:
+                identical2[self.fingerprint(c2)].append(c2)
+                others2.append(c2)
+
+        pairs = []
+        matched2 = set()
+        missing = []
+        others1 = []
+        for c1 in cl1:
+            key = self._key(c1)
+            if key is not None:
+                if keyed2[(c1.tag, key)]:
+                    c2 = keyed2[(c1.tag, key)].popleft()
+                    matched2.add(c2)
+                    pairs.append((c1, c2))
+                else:
+                    missing.append(('post', c1, key))
+            elif identical2[self.fingerprint(c1)]:
+                # nothing to compare in identical nodes
+                matched2.add(identical2[self.fingerprint(c1)].popleft())
+            else:
+                others1.append(c1)
+        others2 = [node for node in others2 if node not in matched2]
+        pairs.extend(zip(others1, others2))
+        missing.extend(('post', c1, None) for c1 in others1[len(others2):])
+        for c2 in cl2:
+            if c2 not in matched2:
+                key = self._key(c2)
+                if key is not None:
+                    missing.append(('pre', c2, key))
+        missing.extend(('pre', c2, None) for c2 in others2[len(others1):])
+
+        for snap, node, key in missing:
+            res = {}
+            res['testop'] = "node_missing_in_%s" % snap
+            res['element'] = node.tag
+            res['parent_node'] = parent.tag
+            res['key'] = list(key) if key is not None else None
+            key_mssg = " with key %s" % ', '.join(key) if key is not None else ""
+            self._add_diff(res, buffer,
+                           "Node <%s>%s missing in %s snapshot, parent node: <%s>"
+                           % (node.tag, key_mssg, snap, parent.tag))
+        return pairs
@@ -1,7 +1,12 @@
 import unittest
 import os
 import yaml
+import shutil
+import tempfile
+from lxml import etree
 from jnpr.jsnapy.check import Comparator
+from jnpr.jsnapy.testop import Operator
+from jnpr.jsnapy import checkpool
 from mock import patch, MagicMock
 from nose.plugins.attrib import attr
 
@@ -191,6 +196,211 @@ class TestCheck(unittest.TestCase):
                 "snap_no-diff_post")
             self.assertTrue(mock_compare.called)
 
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_snapshot_parsed_once(self, mock_path, mock_info):
+        self.chk = True
+        comp = Comparator()
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_no-diff.yml')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        with patch('jnpr.jsnapy.snapshot_cache.etree.parse', wraps=etree.parse) as mock_parse:
+            oper = comp.generate_test_files(
+                main_file,
+                self.hostname,
+                self.chk,
+                self.diff,
+                self.db,
+                self.snap_del,
+                "snap_no-diff_pre",
+                self.action,
+                "snap_no-diff_post")
+            self.assertEqual(mock_parse.call_count, 2)
+        self.assertEqual(oper.no_passed + oper.no_failed, 6)
+
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_compare_xml_identical(self, mock_path, mock_info):
+        self.chk = True
+        comp = Comparator()
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_empty_test.yml')
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        with patch('jnpr.jsnapy.check.XmlComparator.xml_compare') as mock_compare, \
+                patch('jnpr.jsnapy.snapshot_cache.etree.parse') as mock_parse:
+            oper = comp.generate_test_files(
+                main_file,
+                self.hostname,
+                self.chk,
+                self.diff,
+                self.db,
+                self.snap_del,
+                "snap_no-diff_pre",
+                self.action,
+                "snap_no-diff_pre")
+            self.assertFalse(mock_compare.called)
+            self.assertFalse(mock_parse.called)
+        self.assertEqual(oper.no_passed, 1)
+        self.assertEqual(oper.no_failed, 0)
+
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_identical_snapshots_not_compared(self, mock_path, mock_info):
+        self.chk = True
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_no-diff.yml')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        with patch('jnpr.jsnapy.check.Comparator.is_identical', return_value=False):
+            expected = Comparator(retention='all').generate_test_files(
+                main_file, self.hostname, self.chk, self.diff, self.db,
+                self.snap_del, "snap_no-diff_pre", self.action,
+                "snap_no-diff_pre")
+        with patch('jnpr.jsnapy.testop.Operator.no_diff') as mock_no_diff:
+            oper = Comparator(retention='all').generate_test_files(
+                main_file, self.hostname, self.chk, self.diff, self.db,
+                self.snap_del, "snap_no-diff_pre", self.action,
+                "snap_no-diff_pre")
+            self.assertFalse(mock_no_diff.called)
+        self.assertEqual(oper.no_passed, 6)
+        self.assertEqual(oper.no_failed, 0)
+        details = oper.test_details['show interfaces terse ge-*']
+        self.assertEqual([d['testoperation'] for d in details],
+                         ['no-diff', 'list-not-less', 'list-not-more'] * 2)
+        self.assertEqual(oper.test_results, expected.test_results)
+
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_identical_snapshots_delta(self, mock_path, mock_info):
+        self.chk = True
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_delta.yml')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        with patch('jnpr.jsnapy.testop.Operator.delta') as mock_delta:
+            Comparator().generate_test_files(
+                main_file, self.hostname, self.chk, self.diff, self.db,
+                self.snap_del, "snap_delta_pre", self.action, "snap_delta_pre")
+            self.assertTrue(mock_delta.called)
+
+    @patch('logging.Logger.error')
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_identical_snapshots_empty_element(self, mock_path, mock_info, mock_error):
+        self.chk = True
+        tmp_dir = tempfile.mkdtemp()
+        mock_path.return_value = tmp_dir
+        try:
+            test_file = os.path.join(tmp_dir, 'no-diff_empty_element.yml')
+            with open(test_file, 'w') as f:
+                f.write("test_empty:\n"
+                        "  - command: show interfaces terse ge-*\n"
+                        "  - iterate:\n"
+                        "      xpath: physical-interface\n"
+                        "      id: name\n"
+                        "      tests:\n"
+                        "        - no-diff: oper-status\n")
+            with open(os.path.join(
+                    tmp_dir, self.hostname + '_snap_empty_show_interfaces_terse_ge__.xml'), 'w') as f:
+                f.write("<interface-information><physical-interface>"
+                        "<name>ge-0/0/0</name><oper-status/>"
+                        "</physical-interface></interface-information>")
+            with patch('jnpr.jsnapy.testop.Operator.no_diff',
+                       autospec=True, side_effect=Operator.no_diff) as mock_no_diff:
+                oper = Comparator().generate_test_files(
+                    {'tests': [test_file]}, self.hostname, self.chk, self.diff,
+                    self.db, self.snap_del, "snap_empty", self.action,
+                    "snap_empty")
+                self.assertTrue(mock_no_diff.called)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(oper.no_passed, 0)
+        self.assertEqual(oper.no_failed, 1)
+
+    @patch('logging.Logger.error')
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_identical_snapshots_missing_nodes(self, mock_path, mock_info, mock_error):
+        self.chk = True
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            test_file = os.path.join(tmp_dir, 'no-diff_missing.yml')
+            with open(test_file, 'w') as f:
+                f.write("test_missing:\n"
+                        "  - command: show interfaces terse ge-*\n"
+                        "  - iterate:\n"
+                        "      xpath: missing-interface\n"
+                        "      tests:\n"
+                        "        - no-diff: oper-status\n")
+            oper = Comparator().generate_test_files(
+                {'tests': [test_file]}, self.hostname, self.chk, self.diff,
+                self.db, self.snap_del, "snap_no-diff_pre", self.action,
+                "snap_no-diff_pre")
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(oper.no_passed, 0)
+        self.assertEqual(oper.no_failed, 1)
+
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_snapcheck_in_memory(self, mock_path, mock_info):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_is-equal.yml')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        expected = Comparator().generate_test_files(
+            main_file, self.hostname, False, self.diff, self.db, self.snap_del,
+            "snap_is-equal_pre")
+        # reply is still attached to rpc-reply of device
+        rpc_reply = etree.Element('rpc-reply')
+        rpc_reply.append(etree.parse(os.path.join(
+            mock_path.return_value,
+            "10.216.193.114_snap_is-equal_pre_show_interfaces_terse_ge__.xml")).getroot())
+        comp = Comparator()
+        comp.replies = {('show_interfaces_terse_ge-*', 'xml'): rpc_reply[0]}
+        with patch('jnpr.jsnapy.snapshot_cache.etree.parse') as mock_parse:
+            oper = comp.generate_test_files(
+                main_file, self.hostname, False, self.diff, self.db, self.snap_del,
+                "snap_not_taken")
+            self.assertFalse(mock_parse.called)
+        self.assertEqual((oper.no_passed, oper.no_failed),
+                         (expected.no_passed, expected.no_failed))
+        self.assertEqual(oper.no_failed, 1)
+        self.assertIs(rpc_reply[0].getparent(), rpc_reply)
+
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_check_on_process_pool(self, mock_path, mock_info):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_is-equal.yml')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        expected = Comparator(retention='failures-only').generate_test_files(
+            main_file, self.hostname, False, self.diff, self.db, self.snap_del,
+            "snap_is-equal_pre")
+        pool = checkpool.get_pool(1)
+        try:
+            self.assertIs(checkpool.get_pool(2), pool)
+            oper = checkpool.run_check(
+                pool, main_file, self.hostname, False, self.diff, self.db,
+                self.snap_del, "snap_is-equal_pre", retention='failures-only')
+        finally:
+            checkpool.shutdown()
+        self.assertEqual((oper.device, oper.result, oper.no_passed, oper.no_failed),
+                         (expected.device, expected.result, expected.no_passed,
+                          expected.no_failed))
+        self.assertEqual(oper.retention, 'failures-only')
+        self.assertEqual(oper.test_results, expected.test_results)
+
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(TestCheck)
     unittest.TextTestRunner(verbosity=2).run(suite)
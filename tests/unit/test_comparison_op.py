@@ -1,6 +1,11 @@
 import unittest
+import json
 import yaml
+import pickle
 from jnpr.jsnapy.check import Comparator
+from jnpr.jsnapy import testop
+from jnpr.jsnapy.testop import NodeResult, node_result, xpath
+from lxml import etree
 from mock import patch
 from nose.plugins.attrib import attr
 import os
@@ -196,6 +201,9 @@ class TestComparisonOperator(unittest.TestCase):
             "snap_no-diff_post")
         self.assertEqual(oper.no_passed, 0)
         self.assertEqual(oper.no_failed, 6)
+        # every test is recorded, none of them failed with an error
+        self.assertEqual(
+            len(oper.test_results['show interfaces terse ge-*']), 6)
 
     @patch('jnpr.jsnapy.check.get_path')
     @patch('jnpr.jsnapy.sqlite_get.get_path')
@@ -246,6 +254,142 @@ class TestComparisonOperator(unittest.TestCase):
             "snap_no-diff_post1")
         self.assertEqual(oper.no_passed, 6)
         self.assertEqual(oper.no_failed, 0)
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_is_equal_node_result(self, mock_path):
+        self.chk = False
+        comp = Comparator()
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_is-equal.yml')
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        oper = comp.generate_test_files(
+            main_file,
+            self.hostname,
+            self.chk,
+            self.diff,
+            self.db,
+            self.snap_del,
+            "snap_is-equal_pre")
+        failed = oper.test_details['show interfaces terse ge-*'][0]['failed']
+        self.assertEqual(len(failed), 1)
+        self.assertIsInstance(failed[0], NodeResult)
+        # results are plain dicts on access, which can be serialized
+        results = oper.test_results
+        self.assertEqual(type(results['show interfaces terse ge-*'][0]['failed'][0]), dict)
+        self.assertEqual(json.loads(json.dumps(results)), results)
+        self.assertEqual(yaml.safe_load(yaml.safe_dump(results)), results)
+        self.assertEqual(failed[0], {'id': {'./name': 'ge-0/0/0'},
+                                     'pre': {'oper-status': 'down'},
+                                     'post': {'oper-status': 'down'},
+                                     'actual_node_value': 'down'})
+        self.assertEqual(pickle.loads(pickle.dumps(failed[0])), failed[0])
+
+    def test_node_result(self):
+        pre = {'admin-status': 'up'}
+        res1 = node_result({'id': {'name': 'ge-0/0/0'}, 'pre': pre, 'actual_node_value': 'up'})
+        pre['admin-status'] = 'down'
+        res2 = node_result({'id': {'name': 'ge-0/0/1'}, 'pre': pre, 'actual_node_value': 'down'})
+        self.assertEqual(res1['pre'], {'admin-status': 'up'})
+        self.assertEqual(res2['pre'], {'admin-status': 'down'})
+        self.assertIs(res1._keys, res2._keys)
+        self.assertEqual(eval(repr(res1)), res1.to_dict())
+        self.assertEqual(type(res1.to_dict()['id']), dict)
+        self.assertRaises(KeyError, lambda: res1['post'])
+        def assign():
+            res1['pre'] = {}
+        self.assertRaises(TypeError, assign)
+        self.assertRaises(AttributeError, setattr, res1, 'extra', 1)
+
+    def _no_diff_results(self, mock_path, comp, retention=None):
+        self.chk = True
+        conf_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'main_no-diff.yml')
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        config_file = open(conf_file, 'r')
+        main_file = yaml.load(config_file)
+        if retention is not None:
+            main_file['result_retention'] = retention
+        oper = comp.generate_test_files(
+            main_file,
+            self.hostname,
+            self.chk,
+            self.diff,
+            self.db,
+            self.snap_del,
+            "snap_no-diff_pre",
+            self.action,
+            "snap_no-diff_post")
+        self.assertEqual(oper.no_passed, 2)
+        self.assertEqual(oper.no_failed, 4)
+        return oper.test_results['show interfaces terse ge-*']
+
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_retention_failures_only(self, mock_path):
+        details = self._no_diff_results(mock_path, Comparator(), 'failures-only')
+        all_details = self._no_diff_results(mock_path, Comparator())
+        self.assertTrue(any(d['passed'] for d in all_details))
+        self.assertEqual([d['passed'] for d in details], [[]] * 6)
+        self.assertEqual([d['failed'] for d in details],
+                         [d['failed'] for d in all_details])
+        self.assertEqual([d['count'] for d in details],
+                         [d['count'] for d in all_details])
+
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_retention_counts_only(self, mock_path):
+        # retention given to Comparator overrides main config file
+        details = self._no_diff_results(
+            mock_path, Comparator(retention='counts-only'), 'failures-only')
+        self.assertEqual([(d['passed'], d['failed']) for d in details], [([], [])] * 6)
+        self.assertEqual(sum(d['count']['fail'] for d in details), 6)
+
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_id_index_shared(self, mock_path):
+        # three operators in each of two iterate blocks, pre and post nodes of
+        # each block are indexed once
+        with patch('jnpr.jsnapy.testop.IdIndex', wraps=testop.IdIndex) as mock_index:
+            self._no_diff_results(mock_path, Comparator())
+        self.assertEqual(mock_index.call_count, 4)
+        self.assertEqual(sorted(c[0][1] for c in mock_index.call_args_list),
+                         [['./name', './address-family/address-family-name',
+                           './address-family/interface-address/ifa-local']] * 2 +
+                         [['name']] * 2)
+
+    def test_xpath_compiled_once(self):
+        root = etree.fromstring("<a><b><c>1</c></b><b><c>2</c></b></a>")
+        with patch('jnpr.jsnapy.testop.etree.XPath', wraps=etree.XPath) as mock_xpath, \
+                patch.object(testop._xpath_cache, 'compiled', {}, create=True):
+            for node in xpath(root, "b"):
+                xpath(node, "c[. > 0] | self::b/c")
+        self.assertEqual([c.text for c in xpath(root, "b/c")], ['1', '2'])
+        compiled = [c[0][0] for c in mock_xpath.call_args_list]
+        self.assertEqual(sorted(compiled), ["b", "c[. > 0] | self::b/c"])
+
+    def test_block_nodes_shared(self):
+        root = etree.fromstring("<a><b><name>x</name><c>1</c></b>"
+                                "<b><name>y</name><c>2</c></b></a>")
+        op = testop.Operator()
+        with patch('jnpr.jsnapy.testop.xpath', wraps=xpath) as mock_xpath:
+            for test, ele_list in (('is-equal', ['c', '1']), ('not-equal', ['c', '1']),
+                                   ('exists', ['c'])):
+                op.define_operator({'hostname': None}, test, 'b', ele_list, 'err',
+                                   'info', 'show b', True, ['name'], None, root)
+        exprs = [c[0][1] for c in mock_xpath.call_args_list]
+        # block xpath, elements and ids are evaluated once for all operators
+        self.assertEqual([exprs.count(e) for e in ('b', 'c', 'name')], [1, 2, 2])
+        self.assertEqual([r['count'] for r in op.test_results['show b']],
+                         [{'pass': 1, 'fail': 1}, {'pass': 1, 'fail': 1},
+                          {'pass': 2, 'fail': 0}])
+        op.clear_node_cache()
+        op.define_operator({'hostname': None}, 'exists', 'b', ['c'], 'err',
+                           'info', 'show b', True, ['name'], None, root)
+        self.assertEqual(op.test_results['show b'][-1]['count'], {'pass': 2, 'fail': 0})
+
+    def test_xpath_syntax_error(self):
+        root = etree.fromstring("<a><b/></a>")
+        self.assertRaises(etree.XPathEvalError, xpath, root, "b[")
+        self.assertRaises(etree.XPathEvalError, xpath, root, "b[")
+
 
 with patch('logging.Logger') as mock_logger:
     if __name__ == "__main__":
@@ -0,0 +1,83 @@
+import unittest
+import os
+import shutil
+import tempfile
+import yaml
+from jnpr.jsnapy import compression
+from jnpr.jsnapy.check import Comparator
+from mock import patch
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(os.path.dirname(__file__), 'configs')
+        self.data = "<interface-information>" + \
+            "<physical-interface><name>ge-0/0/0</name></physical-interface>" * 100 + \
+            "</interface-information>"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        for codec in compression.available_codecs():
+            data = compression.compress(self.data, codec)
+            self.assertEqual(compression.detect(data), codec)
+            self.assertTrue(len(data) < len(self.data))
+            self.assertEqual(compression.decompress(data), self.data)
+
+    def test_plain_data(self):
+        self.assertIsNone(compression.detect(self.data))
+        self.assertEqual(compression.decompress(self.data), self.data)
+        self.assertEqual(compression.decompress(""), "")
+        # text output starting like bz2 or zlib data is not decompressed
+        for data in ["BZh91AY&SY output", "\x78\x9cText", "x\x01"]:
+            self.assertIsNone(compression.detect(data))
+            self.assertEqual(compression.decompress(data), data)
+            snap = os.path.join(self.tmp_dir, 'snap_text')
+            with open(snap, 'wb') as f:
+                f.write(data)
+            self.assertEqual(compression.read_snapshot(snap), data)
+
+    def test_open_snapshot(self):
+        for codec in compression.available_codecs():
+            snap = os.path.join(self.tmp_dir, 'snap_' + codec)
+            with open(snap, 'wb') as f:
+                f.write(compression.compress(self.data, codec))
+            self.assertEqual(compression.file_codec(snap), codec)
+            self.assertEqual(compression.read_snapshot(snap), self.data)
+
+    def test_get_codec(self):
+        self.assertIsNone(compression.get_codec(None))
+        self.assertIsNone(compression.get_codec(False))
+        self.assertEqual(compression.get_codec(True), 'gzip')
+        self.assertEqual(compression.get_codec('BZ2'), 'bz2')
+        with patch('jnpr.jsnapy.compression.zstandard', None):
+            self.assertEqual(compression.get_codec('zstd'), 'gzip')
+
+    @patch('logging.Logger.info')
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_check_compressed_snapshots(self, mock_path, mock_info):
+        for tag in ['pre', 'post']:
+            name = '10.216.193.114_snap_no-diff_%s_show_interfaces_terse_ge__.xml' % tag
+            with open(os.path.join(self.config_dir, name)) as f:
+                data = f.read()
+            with open(os.path.join(self.tmp_dir, name), 'wb') as f:
+                f.write(compression.compress(data, 'zlib'))
+        mock_path.side_effect = lambda section, value: \
+            self.config_dir if value == 'test_file_path' else self.tmp_dir
+        db = {'store_in_sqlite': False, 'check_from_sqlite': False, 'db_name': "",
+              'first_snap_id': None, 'second_snap_id': None}
+        main_file = yaml.load(open(os.path.join(self.config_dir, 'main_no-diff.yml')))
+        oper = Comparator().generate_test_files(
+            main_file, "10.216.193.114", True, False, db, False,
+            "snap_no-diff_pre", None, "snap_no-diff_post")
+        self.assertEqual(oper.no_passed, 2)
+        self.assertEqual(oper.no_failed, 4)
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCompression)
+    unittest.TextTestRunner(verbosity=2).run(suite)
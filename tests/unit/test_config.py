@@ -0,0 +1,52 @@
+import unittest
+import os
+import shutil
+import tempfile
+from jnpr.jsnapy import JsnapyConfig
+from mock import patch
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cfg_file = os.path.join(self.tmp_dir, 'jsnapy.cfg')
+        with open(self.cfg_file, 'w') as f:
+            f.write("[DEFAULT]\nsnapshot_path = /tmp/snaps\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_default_path(self):
+        cfg = JsnapyConfig(cfg_file=os.path.join(self.tmp_dir, 'missing.cfg'))
+        self.assertEqual(cfg.get('DEFAULT', 'test_file_path'), '/etc/jsnapy/testfiles')
+
+    def test_read_once(self):
+        cfg = JsnapyConfig(cfg_file=self.cfg_file)
+        with patch('ConfigParser.ConfigParser.read') as mock_read:
+            cfg.get('DEFAULT', 'snapshot_path')
+            cfg.get('DEFAULT', 'snapshot_path')
+            cfg.get('DEFAULT', 'test_file_path')
+            self.assertEqual(mock_read.call_count, 1)
+
+    def test_reload(self):
+        cfg = JsnapyConfig(cfg_file=self.cfg_file)
+        self.assertEqual(cfg.get('DEFAULT', 'snapshot_path'), '/tmp/snaps')
+        with open(self.cfg_file, 'w') as f:
+            f.write("[DEFAULT]\nsnapshot_path = /tmp/other\n")
+        self.assertEqual(cfg.get('DEFAULT', 'snapshot_path'), '/tmp/snaps')
+        cfg.reload()
+        self.assertEqual(cfg.get('DEFAULT', 'snapshot_path'), '/tmp/other')
+
+    def test_env_override(self):
+        with patch.dict(os.environ, {'JSNAPY_CFG': self.cfg_file,
+                                     'JSNAPY_TEST_FILE_PATH': '/tmp/tests'}):
+            cfg = JsnapyConfig()
+            self.assertEqual(cfg.get('DEFAULT', 'snapshot_path'), '/tmp/snaps')
+            self.assertEqual(cfg.get('DEFAULT', 'test_file_path'), '/tmp/tests')
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestConfig)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,106 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from jnpr.jsnapy import content_store
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestContentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.snap1 = os.path.join(self.tmp_dir, 'snap_pre_show_version.xml')
+        self.snap2 = os.path.join(self.tmp_dir, 'snap_post_show_version.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_store_same_data(self):
+        content_store.store_file("<a>1</a>", self.snap1)
+        content_store.store_file("<a>1</a>", self.snap2)
+        self.assertTrue(os.path.samefile(self.snap1, self.snap2))
+        self.assertEqual(len(os.listdir(content_store.blob_dir(self.snap1))), 1)
+        self.assertTrue(content_store.same_file(self.snap1, self.snap2))
+
+    def test_overwrite_linked_file(self):
+        content_store.store_file("<a>1</a>", self.snap1)
+        content_store.store_file("<a>1</a>", self.snap2)
+        content_store.store_file("<a>2</a>", self.snap2)
+        with open(self.snap1) as f:
+            self.assertEqual(f.read(), "<a>1</a>")
+        with open(self.snap2) as f:
+            self.assertEqual(f.read(), "<a>2</a>")
+        self.assertFalse(content_store.same_file(self.snap1, self.snap2))
+
+    def test_file_mode(self):
+        plain = os.path.join(self.tmp_dir, 'plain')
+        with open(plain, 'w') as f:
+            f.write("<a/>")
+        content_store.write_new(self.snap1, "<a/>")
+        content_store.store_file("<b/>", self.snap2)
+        mode = os.stat(plain).st_mode & 0o777
+        self.assertEqual(os.stat(self.snap1).st_mode & 0o777, mode)
+        self.assertEqual(os.stat(self.snap2).st_mode & 0o777, mode)
+
+    def test_store_from_threads(self):
+        snaps = [os.path.join(self.tmp_dir, 'snap_%d_show_version.xml' % i)
+                 for i in range(20)]
+        errors = []
+
+        def store(snap):
+            try:
+                for _ in range(20):
+                    content_store.store_file("<a>1</a>", snap)
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=store, args=(snap,)) for snap in snaps]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        for snap in snaps:
+            with open(snap) as f:
+                self.assertEqual(f.read(), "<a>1</a>")
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         sorted(['.blobs'] + [os.path.basename(snap) for snap in snaps]))
+
+    def test_sweep(self):
+        content_store.store_file("<a>1</a>", self.snap1)
+        content_store.store_file("<a>2</a>", self.snap1)
+        content_store.sweep(self.tmp_dir)
+        self.assertEqual(os.listdir(content_store.blob_dir(self.snap1)),
+                         [content_store.digest("<a>2</a>")])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ['.blobs', 'snap_pre_show_version.xml'])
+
+    def test_same_file_not_linked(self):
+        with open(self.snap1, 'w') as f:
+            f.write("<a>1</a>")
+        with open(self.snap2, 'w') as f:
+            f.write("<a>1</a>")
+        self.assertTrue(content_store.same_file(self.snap1, self.snap2))
+        self.assertFalse(content_store.same_file(self.snap1, self.snap1 + '_missing'))
+
+    def test_file_digest_sidecar(self):
+        with open(self.snap1, 'w') as f:
+            f.write("<a>1</a>")
+        with open(self.snap1 + content_store.DIGEST_SUFFIX, 'w') as f:
+            f.write("sha1 0123 8\n")
+        self.assertEqual(content_store.file_digest(self.snap1), "0123")
+
+    def test_file_digest_stale_sidecar(self):
+        with open(self.snap1, 'w') as f:
+            f.write("<a>12</a>")
+        with open(self.snap1 + content_store.DIGEST_SUFFIX, 'w') as f:
+            f.write("sha1 0123 8\n")
+        self.assertEqual(content_store.file_digest(self.snap1),
+                         content_store.digest("<a>12</a>"))
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestContentStore)
+    unittest.TextTestRunner(verbosity=2).run(suite)
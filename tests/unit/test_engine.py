@@ -0,0 +1,69 @@
+import unittest
+import time
+import threading
+from jnpr.jsnapy import engine
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestEngine(unittest.TestCase):
+
+    def test_max_sessions(self):
+        eng = engine.Engine(3)
+        lock = threading.Lock()
+        state = {'running': 0, 'most': 0}
+
+        def session(value):
+            with lock:
+                state['running'] += 1
+                state['most'] = max(state['most'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+            return value
+
+        futures = [eng.submit(session, i) for i in range(20)]
+        self.assertEqual([f.result(10) for f in futures], range(20))
+        self.assertEqual(state['most'], 3)
+
+    def test_workers_started(self):
+        eng = engine.Engine(100)
+        release = threading.Event()
+        futures = [eng.submit(release.wait, 10)]
+        self.assertEqual(eng._workers, 1)
+        futures += [eng.submit(release.wait, 10) for i in range(3)]
+        self.assertEqual(eng._workers, 4)
+        release.set()
+        self.assertEqual([f.result(10) for f in futures], [True] * 4)
+
+    def test_exception(self):
+        eng = engine.Engine(1)
+        done = []
+
+        def fail():
+            raise ValueError("connection refused")
+
+        future = eng.submit(fail)
+        self.assertRaises(ValueError, future.result, 10)
+        self.assertIsInstance(future.exception(), ValueError)
+        future.add_done_callback(done.append)
+        self.assertEqual(done, [future])
+        # engine keeps running jobs after a failed one
+        self.assertEqual(eng.submit(lambda: 'done').result(10), 'done')
+
+    def test_spawn(self):
+        eng = engine.Engine(1)
+        # spawned job waits for engine jobs without holding a session
+        future = engine.spawn(lambda: eng.submit(lambda x: x * 2, 21).result())
+        self.assertEqual(future.result(10), 42)
+        self.assertTrue(future.done())
+
+    def test_get_engine(self):
+        eng = engine.get_engine()
+        self.assertIs(engine.get_engine(), eng)
+        engine.get_engine(5)
+        self.assertEqual(eng.max_sessions, 5)
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestEngine)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -6,6 +6,9 @@ from mock import patch, MagicMock
 from contextlib import nested
 from nose.plugins.attrib import attr
 import argparse
+import threading
+import time
+from jnpr.jsnapy import jsnapy
 
 @attr('unit')
 class TestSnapAdmin(unittest.TestCase):
@@ -36,6 +39,27 @@ class TestSnapAdmin(unittest.TestCase):
             js.main_file)
         self.assertTrue(mock_parse.called)
 
+    @patch('jnpr.jsnapy.jsnapy.Comparator')
+    @patch('jnpr.jsnapy.jsnapy.Parser')
+    def test_snapcheck_in_memory(self, mock_parse, mock_comp):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace()
+        js = SnapAdmin()
+        conf_file = os.path.join(os.path.dirname(__file__),
+                     'configs', 'main.yml')
+        config_file = open(conf_file, 'r')
+        js.main_file = yaml.load(config_file)
+        js.main_file['in_memory'] = True
+        js.generate_rpc_reply(None, "snap_mock", self.hostname, js.main_file)
+        self.assertEqual(js.live_replies, {})
+        js.generate_rpc_reply(None, "snap_mock", self.hostname, js.main_file, True)
+        mock_parse.assert_called_with(pipeline=True, compress=None, dedup=False,
+                                      persist=True, merkle_index=False)
+        js.compare_tests(self.hostname, js.main_file, "snap_mock", None, "snapcheck")
+        self.assertIs(mock_comp.return_value.replies,
+                      mock_parse.return_value.reply_trees)
+        self.assertEqual(js.live_replies, {})
+
     @patch('jnpr.jsnapy.SnapAdmin.connect')
     def test_hostname(self, mock_connect ):
         argparse.ArgumentParser.parse_args = MagicMock()
@@ -460,6 +484,167 @@ class TestSnapAdmin(unittest.TestCase):
         js.get_hosts()
         self.assertEqual(js.db, self.db)   
 
+    @patch('argparse.ArgumentParser.exit')
+    @patch('jnpr.jsnapy.SnapAdmin.connect')
+    @patch('jnpr.jsnapy.jsnapy.get_path')
+    def test_multiple_device_details_order(self, mock_path, mock_connect, mock_arg):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(check=False,
+            diff=False, file=None, hostname=None, login=None, passwd=None, port=None, post_snapfile=None, pre_snapfile=None, snap=False, snapcheck=False, verbosity=None, version=False)
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        mock_connect.side_effect = lambda hostname, *args, **kwargs: hostname
+        js = SnapAdmin()
+        config_data = {'hosts': [{'include': 'devices.yml', 'group': 'MX'}],
+                       'max_workers': 2}
+        res = js.multiple_device_details(config_data['hosts'][0], config_data,
+                                         "mock_snap", "snapcheck", None)
+        hosts = ['10.209.16.203', '10.209.16.204', '10.209.16.205']
+        self.assertEqual(res, hosts)
+        self.assertEqual(js.host_list, hosts)
+        self.assertEqual(mock_connect.call_count, 3)
+
+    @patch('argparse.ArgumentParser.exit')
+    @patch('jnpr.jsnapy.SnapAdmin.connect')
+    def test_run_devices_error(self, mock_connect, mock_arg):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(check=False,
+            diff=False, file=None, hostname=None, login=None, passwd=None, port=None, post_snapfile=None, pre_snapfile=None, snap=False, snapcheck=False, verbosity=None, version=False)
+        mock_connect.side_effect = [Exception("connection refused"), "done"]
+        js = SnapAdmin()
+        jobs = [("1.1.1.1", ("1.1.1.1", None, None, "snap"), {}),
+                ("2.2.2.2", ("2.2.2.2", None, None, "snap"), {})]
+        res = js.run_devices(jobs, 1)
+        self.assertEqual(res, [None, "done"])
+
+    @patch('argparse.ArgumentParser.exit')
+    def test_get_workers(self, mock_arg):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(check=False,
+            diff=False, file=None, hostname=None, login=None, passwd=None, port=None, post_snapfile=None, pre_snapfile=None, snap=False, snapcheck=False, verbosity=None, version=False)
+        js = SnapAdmin()
+        self.assertEqual(js.get_workers({}), 10)
+        self.assertEqual(js.get_workers({'max_workers': 4}), 4)
+        js.args.workers = 7
+        self.assertEqual(js.get_workers({'max_workers': 4}), 7)
+        js.args.workers = 0
+        self.assertEqual(js.get_workers({}), 1)
+
+    @patch('argparse.ArgumentParser.exit')
+    @patch('jnpr.jsnapy.jsnapy.checkpool')
+    @patch('jnpr.jsnapy.SnapAdmin.connect')
+    @patch('jnpr.jsnapy.jsnapy.get_path')
+    def test_check_pool(self, mock_path, mock_connect, mock_pool, mock_arg):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(check=False,
+            diff=False, file=None, hostname=None, login=None, passwd=None, port=None, post_snapfile=None, pre_snapfile=None, snap=False, snapcheck=False, verbosity=None, version=False)
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = SnapAdmin()
+        mock_connect.side_effect = lambda hostname, username, password, pre, config, action, post, **kwargs: \
+            js.compare_tests(hostname, config, pre, post, action)
+        mock_pool.get_pool.return_value = "pool"
+        mock_pool.run_check.side_effect = lambda pool, config, hostname, *args: hostname
+        config_data = {'hosts': [{'include': 'devices.yml', 'group': 'MX'}],
+                       'check_processes': 4}
+        js.start_check_pool(config_data)
+        res = js.multiple_device_details(config_data['hosts'][0], config_data,
+                                         "mock_snap", "snapcheck", None)
+        self.assertEqual(res, ['10.209.16.203', '10.209.16.204', '10.209.16.205'])
+        mock_pool.get_pool.assert_called_once_with(4)
+        mock_pool.run_check.assert_called_with(
+            "pool", config_data, '10.209.16.205', False, False, js.db, False,
+            "mock_snap", "snapcheck", None, None)
+        # pool is kept for next calls
+        self.assertFalse(mock_pool.shutdown.called)
+        self.assertEqual(js.check_pool, "pool")
+        js.start_check_pool({'hosts': config_data['hosts']})
+        self.assertIsNone(js.check_pool)
+        js.stop_check_pool()
+        mock_pool.shutdown.assert_called_once_with()
+        # main config file given by name is read before thread is spawned
+        mock_pool.get_pool.reset_mock()
+        config_file = os.path.join(os.path.dirname(__file__), 'configs', 'main_pool.yml')
+        with open(config_file, 'w') as f:
+            yaml.dump(config_data, f)
+        try:
+            with patch('jnpr.jsnapy.jsnapy.engine.spawn') as mock_spawn:
+                mock_spawn.side_effect = lambda *args: mock_pool.get_pool.assert_called_once_with(4)
+                js.check_async(config_file, "mock_pre", "mock_post")
+                self.assertTrue(mock_spawn.called)
+        finally:
+            os.remove(config_file)
+
+    @patch('argparse.ArgumentParser.exit')
+    @patch('jnpr.jsnapy.SnapAdmin.extract_data')
+    @patch('jnpr.jsnapy.SnapAdmin.connect')
+    def test_session_engine(self, mock_connect, mock_extract, mock_arg):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(check=False,
+            diff=False, file=None, hostname=None, login=None, passwd=None, port=None, post_snapfile=None, pre_snapfile=None, snap=False, snapcheck=False, verbosity=None, version=False)
+        mock_connect.side_effect = [Exception("connection refused"), "done"]
+        js = SnapAdmin()
+        self.assertIsNone(js.get_engine({}))
+        session_engine = js.get_engine({'max_sessions': 2})
+        self.assertEqual(session_engine.max_sessions, 2)
+        jobs = [("1.1.1.1", ("1.1.1.1", None, None, "snap"), {}),
+                ("2.2.2.2", ("2.2.2.2", None, None, "snap"), {})]
+        res = js.run_devices(jobs, 1, session_engine)
+        self.assertEqual(res, [None, "done"])
+        mock_extract.return_value = ["result"]
+        future = js.snapcheck_async("main.yml", "mock_snap")
+        self.assertEqual(future.result(10), ["result"])
+        mock_extract.assert_called_with("main.yml", "mock_snap", "snapcheck")
+        # engine is used by async call only
+        self.assertIsNone(js.get_engine({}))
+
+    def test_prompts_not_mixed(self):
+        lock = threading.Lock()
+        state = {'asking': 0, 'most': 0}
+
+        def ask(prompt):
+            with lock:
+                state['asking'] += 1
+                state['most'] = max(state['most'], state['asking'])
+            time.sleep(0.01)
+            with lock:
+                state['asking'] -= 1
+            return prompt
+
+        threads = [threading.Thread(target=jsnapy._ask, args=(ask, "user"))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(state['most'], 1)
+
+    @patch('argparse.ArgumentParser.exit')
+    def test_sqlite_retention_parameters(self, mock_arg):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(check=False,
+            diff=False, file=None, hostname=None, login=None, passwd=None, port=None, post_snapfile=None, pre_snapfile=None, snap=False, snapcheck=False, verbosity=None, version=False)
+        js = SnapAdmin()
+        config_data = {'sqlite': [{'store_in_sqlite': True, 'database_name': 'jbb.db',
+                                   'max_snapshots': 10, 'max_snapshot_age': 7}]}
+        js.chk_database(config_data, "mock_snap", None, snap=True)
+        self.db['store_in_sqlite'] = True
+        self.db['db_name'] = 'jbb.db'
+        self.db['max_snapshots'] = 10
+        self.db['max_age_days'] = 7
+        self.assertEqual(js.db, self.db)
+    @patch('argparse.ArgumentParser.exit')
+    @patch('jnpr.jsnapy.jsnapy.Comparator')
+    def test_check_retention(self, mock_comp, mock_arg):
+        argparse.ArgumentParser.parse_args = MagicMock()
+        argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(check=False,
+            diff=False, file=None, hostname=None, login=None, passwd=None, port=None, post_snapfile=None, pre_snapfile=None, snap=False, snapcheck=False, verbosity=None, version=False)
+        js = SnapAdmin()
+        with patch('jnpr.jsnapy.SnapAdmin.extract_data') as mock_extract:
+            js.check("main.yml", "mock_pre", "mock_post", retention='counts-only')
+            mock_extract.assert_called_once_with("main.yml", "mock_pre", "check", "mock_post")
+        js.compare_tests(self.hostname, {}, "mock_pre", "mock_post", "check")
+        mock_comp.assert_called_once_with(retention='counts-only')
+
+
 with nested(
     patch('sys.exit'),
     patch('argparse.ArgumentParser.print_help'),
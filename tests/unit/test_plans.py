@@ -0,0 +1,99 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from jnpr.jsnapy import plans
+from mock import patch
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestPlans(unittest.TestCase):
+
+    def setUp(self):
+        plans.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'plans')
+        self.test_file = os.path.join(self.tmp_dir, 'test_interfaces.yml')
+        with open(self.test_file, 'w') as f:
+            f.write("test_interfaces_terse:\n"
+                    "  - command: show interfaces terse | display xml\n"
+                    "  - iterate:\n"
+                    "      id: ./name, admin-status\n"
+                    "      xpath: physical-interface\n"
+                    "      tests:\n"
+                    "        - is-equal: oper-status , up\n"
+                    "          err: 'down'\n"
+                    "test_version:\n"
+                    "  - rpc: get-software-information\n"
+                    "    format: text\n")
+
+    def tearDown(self):
+        plans.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_command_plan(self):
+        with patch('jnpr.jsnapy.plans.get_path', return_value=self.cache_dir):
+            plan = plans.load_test_file(self.test_file)
+        self.assertEqual(sorted(plan.tests_included), ['test_interfaces_terse', 'test_version'])
+        command = plan.command('test_interfaces_terse')
+        self.assertIs(plan.command('test_interfaces_terse'), command)
+        self.assertEqual((command.name, command.teston, command.reply_format, command.is_command),
+                         ('show_interfaces_terse', 'show interfaces terse', 'xml', True))
+        block = command.blocks()[0]
+        self.assertEqual((block.x_path, block.id_list, block.iter),
+                         ('physical-interface', ['./name', 'admin-status'], True))
+        self.assertEqual(block.testcases, [
+            ('is-equal', ['oper-status', 'up'], 'down',
+             plans.default_info_mssg({}, ['oper-status']))])
+        self.assertEqual(command.stream_paths(), frozenset(['physical-interface']))
+        rpc = plan.command('test_version')
+        self.assertEqual((rpc.name, rpc.reply_format, rpc.is_command, rpc.blocks()),
+                         ('get-software-information', 'text', False, []))
+        self.assertRaises(KeyError, plan.command, 'test_missing')
+
+    def test_loaded_once(self):
+        with patch('jnpr.jsnapy.plans.get_path', return_value=self.cache_dir), \
+                patch('jnpr.jsnapy.plans.yaml.load', wraps=plans.yaml.load) as mock_load:
+            plan = plans.load_test_file(self.test_file)
+            self.assertIs(plans.load_test_file(self.test_file), plan)
+            self.assertEqual(mock_load.call_count, 1)
+            self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+            # next run takes parsed file from cache directory
+            plans.clear()
+            self.assertEqual(plans.load_test_file(self.test_file).data, plan.data)
+            self.assertEqual(mock_load.call_count, 1)
+            # changed file is parsed again
+            with open(self.test_file, 'a') as f:
+                f.write("tests_include:\n  - test_version\n")
+            self.assertEqual(plans.load_test_file(self.test_file).tests_included,
+                             ['test_version'])
+            self.assertEqual(mock_load.call_count, 2)
+
+    def test_cache_format(self):
+        with patch('jnpr.jsnapy.plans.get_path', return_value=self.cache_dir):
+            plan = plans.load_test_file(self.test_file)
+            cache_file = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+            with open(cache_file) as f:
+                self.assertEqual(json.load(f), plan.data)
+            # cache file of another user is not trusted
+            with open(cache_file, 'w') as f:
+                json.dump({'test_planted': [{'rpc': 'get-config'}]}, f)
+            with patch('jnpr.jsnapy.plans.os.getuid', return_value=os.stat(cache_file).st_uid + 1):
+                plans.clear()
+                self.assertEqual(plans.load_test_file(self.test_file).data, plan.data)
+            # and is replaced by file parsed again
+            with open(cache_file) as f:
+                self.assertEqual(json.load(f), plan.data)
+
+    def test_no_cache_dir(self):
+        cache_dir = os.path.join(self.tmp_dir, 'missing', 'plans')
+        with patch('jnpr.jsnapy.plans.get_path', return_value=cache_dir):
+            plan = plans.load_test_file(self.test_file)
+        self.assertIn('test_version', plan.data)
+        self.assertFalse(os.path.exists(cache_dir))
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPlans)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -1,8 +1,13 @@
 import unittest
 import yaml
 import os
+import shutil
+import tempfile
+from lxml import etree
 from jnpr.jsnapy.snap import Parser
 from jnpr.jsnapy import SnapAdmin
+from jnpr.jsnapy import merkle
+from jnpr.jsnapy import compression
 import jnpr.junos.device
 from mock import patch, mock_open, ANY, call, MagicMock
 from contextlib import nested
@@ -38,7 +43,8 @@ class TestSnap(unittest.TestCase):
             passwd="xyz")
         dev.open()
         m_op = mock_open()
-        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open:
+        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open, \
+                patch('jnpr.jsnapy.snap.content_store.write_new'):
             prs.generate_reply(
                 test_file,
                 dev,
@@ -69,8 +75,9 @@ class TestSnap(unittest.TestCase):
         m_op = mock_open()
         with nested (
                 patch('jnpr.jsnapy.snap.open', m_op, create=True),
-                patch('jnpr.jsnapy.jsnapy.get_path')
-        )as (m_open, mock_path):
+                patch('jnpr.jsnapy.jsnapy.get_path'),
+                patch('jnpr.jsnapy.snap.content_store.write_new')
+        )as (m_open, mock_path, mock_write):
             mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
             js.generate_rpc_reply(
                 dev,
@@ -158,7 +165,8 @@ class TestSnap(unittest.TestCase):
             passwd="xyz")
         dev.open()
         m_op = mock_open()
-        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open:
+        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open, \
+                patch('jnpr.jsnapy.snap.content_store.write_new'):
             prs.generate_reply(
                 test_file,
                 dev,
@@ -254,6 +262,112 @@ class TestSnap(unittest.TestCase):
             mock_rpc.assert_called_once_with('get_interface_information')
             mock_config.assert_called_once_with(options={'format': 'xml'})
 
+    @patch('jnpr.jsnapy.snap.Parser._write_file')
+    @patch('jnpr.jsnapy.snap.etree')
+    def test_rpc_pipeline(self, mock_etree, mock_write):
+        prs = Parser(pipeline=True)
+        test_file = os.path.join(os.path.dirname(__file__),
+                                 'configs', 'test_rpc_2.yml')
+        test_file = open(test_file, 'r')
+        test_file = yaml.load(test_file)
+        dev = jnpr.junos.device.Device(
+            host="10.216.193.114",
+            user="xyz",
+            passwd="abc")
+        with nested(
+                patch('jnpr.junos.rpcmeta._RpcMetaExec.__getattr__'),
+                patch('jnpr.junos.rpcmeta._RpcMetaExec.get_config')
+        ) as (mock_rpc, mock_config):
+            prs.generate_reply(
+                test_file,
+                dev,
+                "10.216.193.114_snap_mock",
+                "10.216.193.114",
+                self.db)
+            self.assertEqual(mock_write.call_count, 2)
+            self.assertEqual(mock_write.call_args_list[0][0][0],
+                             mock_config.return_value)
+            self.assertEqual(mock_write.call_args_list[1][0][0],
+                             mock_rpc.return_value.return_value)
+            self.assertIsNone(prs._writer)
+
+    def test_write_file_dedup(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            prs = Parser(dedup=True)
+            reply = etree.fromstring("<software-information/>")
+            pre = os.path.join(tmp_dir, "10.216.193.114_pre_show_version.xml")
+            post = os.path.join(tmp_dir, "10.216.193.114_post_show_version.xml")
+            prs._write_file(reply, 'xml', pre)
+            prs._write_file(reply, 'xml', post)
+            self.assertTrue(os.path.samefile(pre, post))
+            with open(post) as f:
+                self.assertEqual(f.read(), "<software-information/>")
+            # rewriting a linked snapshot leaves other snapshots of blob as they are
+            prs._write_file(True, 'xml', pre)
+            Parser()._write_file(etree.fromstring("<a/>"), 'xml', pre)
+            with open(pre) as f:
+                self.assertEqual(f.read(), "<a/>")
+            with open(post) as f:
+                self.assertEqual(f.read(), "<software-information/>")
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @patch('jnpr.jsnapy.snap.Parser._write_file')
+    def test_rpc_not_persisted(self, mock_write):
+        prs = Parser(persist=False)
+        dev = MagicMock()
+        reply = etree.fromstring("<software-information/>")
+        dev.rpc.get_software_information.return_value = reply
+        test_file = {'test_version': [{'rpc': 'get-software-information'}]}
+        prs.generate_reply(test_file, dev, "snap_mock", self.hostname, self.db)
+        self.assertFalse(mock_write.called)
+        self.assertIs(prs.reply_trees[('get-software-information', 'xml')], reply)
+
+    @patch('jnpr.jsnapy.snap.Parser._write_file')
+    def test_same_request_taken_once(self, mock_write):
+        prs = Parser()
+        dev = MagicMock()
+        test_file1 = {'test_terse': [{'command': 'show interfaces terse'}],
+                      'test_bgp': [{'rpc': 'get-bgp-neighbor-information'},
+                                   {'kwargs': {'instance': 'a', 'detail': True}}]}
+        test_file2 = {'test_terse_2': [{'command': 'show interfaces terse'}],
+                      'test_bgp_2': [{'rpc': 'get-bgp-neighbor-information'},
+                                     {'kwargs': {'detail': True, 'instance': 'a'}}],
+                      'test_bgp_3': [{'rpc': 'get-bgp-neighbor-information'},
+                                     {'kwargs': {'instance': 'b'}}]}
+        prs.generate_reply(test_file1, dev, "snap_mock", self.hostname, self.db)
+        prs.generate_reply(test_file2, dev, "snap_mock", self.hostname, self.db)
+        self.assertEqual(dev.rpc.cli.call_count, 1)
+        self.assertEqual(dev.rpc.get_bgp_neighbor_information.call_count, 2)
+        self.assertEqual(mock_write.call_count, 3)
+        self.assertEqual(prs.command_list, ['show interfaces terse'])
+
+    def test_write_file_merkle(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            reply = etree.fromstring("<software-information><host-name>r1</host-name>"
+                                     "</software-information>")
+            pre = os.path.join(tmp_dir, "10.216.193.114_pre_show_version.xml")
+            # index is stored only if asked for
+            Parser()._write_file(reply, 'xml', pre)
+            self.assertFalse(os.path.exists(pre + merkle.MERKLE_SUFFIX))
+            prs = Parser(compress='gzip', merkle_index=True)
+            prs._write_file(reply, 'xml', pre)
+            # and is compressed like snapshot
+            with open(pre + merkle.MERKLE_SUFFIX, 'rb') as f:
+                self.assertEqual(compression.detect(f.read()), 'gzip')
+            self.assertEqual(os.stat(pre + merkle.MERKLE_SUFFIX).st_mode, os.stat(pre).st_mode)
+            index = merkle.read_file(pre)
+            self.assertEqual(len(index), 2)
+            self.assertEqual(index.digests, merkle.build(reply).digests)
+            # index of older content of snapshot file is not used
+            with open(pre, 'w') as f:
+                f.write("<software-information/>")
+            self.assertIsNone(merkle.read_file(pre))
+        finally:
+            shutil.rmtree(tmp_dir)
+
     @patch('jnpr.jsnapy.snap.Parser._write_file')
     @patch('jnpr.jsnapy.snap.etree')
     def test_rpc_5(self, mock_etree, mock_parse):
@@ -316,7 +430,8 @@ class TestSnap(unittest.TestCase):
         m_op = mock_open()
         self.db['store_in_sqlite'] = True
         self.db['db_name'] = "abc.db"
-        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open:
+        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open, \
+                patch('jnpr.jsnapy.snap.content_store.write_new'):
             prs.generate_reply(
                 test_file,
                 dev,
@@ -343,7 +458,8 @@ class TestSnap(unittest.TestCase):
             passwd="xyz")
         dev.open()
         m_op = mock_open()
-        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open:
+        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open, \
+                patch('jnpr.jsnapy.snap.content_store.write_new'):
             prs.generate_reply(
                 test_file,
                 dev,
@@ -375,7 +491,8 @@ class TestSnap(unittest.TestCase):
         m_op = mock_open()
         self.db['store_in_sqlite'] = True
         self.db['db_name'] = "abc.db"
-        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open:
+        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open, \
+                patch('jnpr.jsnapy.snap.content_store.write_new'):
             prs.generate_reply(
                 test_file,
                 dev,
@@ -415,7 +532,8 @@ class TestSnap(unittest.TestCase):
         m_op = mock_open()
         self.db['store_in_sqlite'] = True
         self.db['db_name'] = "abc.db"
-        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open:
+        with patch('jnpr.jsnapy.snap.open', m_op, create=True) as m_open, \
+                patch('jnpr.jsnapy.snap.content_store.write_new'):
             prs.generate_reply(
                 test_file,
                 dev,
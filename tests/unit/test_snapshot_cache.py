@@ -0,0 +1,76 @@
+import unittest
+import os
+import shutil
+import tempfile
+from lxml import etree
+from jnpr.jsnapy.snapshot_cache import SnapshotCache
+from jnpr.jsnapy import compression
+from mock import patch
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestSnapshotCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.snap_file = os.path.join(
+            os.path.dirname(__file__),
+            'configs',
+            '10.216.193.114_snap_no-diff_pre_show_interfaces_terse_ge__.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse_file_once(self):
+        cache = SnapshotCache()
+        with patch('jnpr.jsnapy.snapshot_cache.etree.parse', wraps=etree.parse) as mock_parse:
+            doc1 = cache.parse_file(self.snap_file)
+            doc2 = cache.parse_file(self.snap_file)
+            self.assertIs(doc1, doc2)
+            self.assertEqual(mock_parse.call_count, 1)
+        self.assertEqual(cache.size, os.stat(self.snap_file).st_size)
+
+    def test_parse_file_changed(self):
+        cache = SnapshotCache()
+        snap = os.path.join(self.tmp_dir, 'snap.xml')
+        with open(snap, 'w') as f:
+            f.write("<a><b>1</b></a>")
+        doc1 = cache.parse_file(snap)
+        with open(snap, 'w') as f:
+            f.write("<a><b>22</b></a>")
+        doc2 = cache.parse_file(snap)
+        self.assertIsNot(doc1, doc2)
+        self.assertEqual(doc2.find('b').text, '22')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 16)
+
+    def test_compressed_file_size(self):
+        cache = SnapshotCache()
+        snap = os.path.join(self.tmp_dir, 'snap.xml')
+        data = "<a>%s</a>" % ("<b>1</b>" * 1000)
+        with open(snap, 'wb') as f:
+            f.write(compression.compress(data, 'gzip'))
+        self.assertEqual(len(cache.parse_file(snap).findall('b')), 1000)
+        # cache size follows size of parsed data, not of compressed file
+        self.assertEqual(cache.size, len(data))
+
+    def test_parse_string(self):
+        cache = SnapshotCache()
+        data = "<a><b>1</b></a>"
+        self.assertIs(cache.parse_string(data), cache.parse_string(data))
+        self.assertIs(cache.parse_string(u"<a><b>1</b></a>"), cache.parse_string(data))
+        # data is not kept in cache
+        self.assertNotIn(data, [key[1] for key in cache._docs])
+
+    def test_eviction(self):
+        cache = SnapshotCache(max_bytes=20)
+        first = cache.parse_string("<a><b>1</b></a>")
+        cache.parse_string("<a><b>2</b></a>")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 15)
+        self.assertIsNot(cache.parse_string("<a><b>1</b></a>"), first)
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSnapshotCache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -1,7 +1,11 @@
 import unittest
 import os
-from jnpr.jsnapy.sqlite_store import JsnapSqlite
+import sqlite3
+import threading
+from jnpr.jsnapy.sqlite_store import JsnapSqlite, batch_writes, get_connection, \
+    remove_unused_blobs
 from jnpr.jsnapy.sqlite_get import SqliteExtractXml
+from jnpr.jsnapy.compression import compress
 from mock import patch
 from nose.plugins.attrib import attr
 
@@ -21,7 +25,8 @@ class TestSqlite(unittest.TestCase):
 
     def tearDown(self):
         db_filename = os.path.join(os.path.dirname(__file__), 'configs', 'mock_test.db')
-        os.remove(db_filename)
+        if os.path.exists(db_filename):
+            os.remove(db_filename)
 
     @patch('sys.exit')
     @patch('jnpr.jsnapy.sqlite_store.get_path')
@@ -115,6 +120,193 @@ class TestSqlite(unittest.TestCase):
             self.assertNotEqual(c_list[0][0].find(err), -1)
 
 
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    def test_sqlite_pooled_connection(self, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = JsnapSqlite("10.216.193.114", self.db)
+        js2 = JsnapSqlite("10.216.193.115", self.db)
+        pooled = get_connection(js.db_filename)
+        self.assertIs(pooled, get_connection(js2.db_filename))
+        self.assertEqual(pooled.tables, set(['table_10__216__193__114',
+                                             'table_10__216__193__115']))
+        mode = pooled.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    def test_sqlite_batch_writes(self, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = JsnapSqlite("10.216.193.114", self.db)
+        with batch_writes():
+            js.insert_data(self.db_dict2)
+            js.insert_data(self.db_dict2)
+            reader = sqlite3.connect(js.db_filename)
+            count = reader.execute("SELECT count(*) FROM table_10__216__193__114").fetchone()[0]
+            self.assertEqual(count, 0)
+        count = reader.execute("SELECT count(*) FROM table_10__216__193__114").fetchone()[0]
+        self.assertEqual(count, 2)
+        reader.close()
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    def test_sqlite_batch_writes_isolated(self, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = JsnapSqlite("10.216.193.114", self.db)
+        js2 = JsnapSqlite("10.216.193.115", self.db)
+        reader = sqlite3.connect(js.db_filename)
+        query = "SELECT count(*) FROM %s"
+        bad_dict = dict(self.db_dict2, filename=['not', 'a', 'name'])
+        with patch('logging.Logger.error') as mock_log, batch_writes():
+            js.insert_data(self.db_dict2)
+            # other thread commits only its own insert, and its failure rolls
+            # back nothing of this batch
+            def other():
+                js2.insert_data(self.db_dict2)
+                self.assertRaises(sqlite3.Error, js2.insert_data, bad_dict)
+            t = threading.Thread(target=other)
+            t.start()
+            t.join()
+            self.assertEqual(reader.execute(query % js2.table_name).fetchone()[0], 1)
+            self.assertEqual(reader.execute(query % js.table_name).fetchone()[0], 0)
+            js.insert_data(bad_dict)
+            js.insert_data(self.db_dict2)
+        self.assertTrue(mock_log.called)
+        self.assertEqual(reader.execute(query % js.table_name).fetchone()[0], 2)
+        reader.close()
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    @patch('jnpr.jsnapy.sqlite_get.get_path')
+    def test_sqlite_retention(self, mock_spath, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        mock_spath.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = JsnapSqlite("10.216.193.114", self.db, max_snapshots=2)
+        for data in ["data_1", "data_2", "data_3"]:
+            self.db_dict2['data'] = data
+            js.insert_data(self.db_dict2)
+        extr = SqliteExtractXml(self.db)
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 0), ("data_3", "text"))
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 1), ("data_2", "text"))
+        with patch('logging.Logger.error'):
+            self.assertEqual(extr.get_xml_using_snap_id(
+                "10.216.193.114", "show version", 2), ("None", None))
+        self.assertEqual(extr.get_xml_using_snapname(
+            "10.216.193.114", "show version", "mock_snap"), ("data_3", "text"))
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    @patch('jnpr.jsnapy.sqlite_get.get_path')
+    def test_sqlite_legacy_table(self, mock_spath, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        mock_spath.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        db_filename = os.path.join(os.path.dirname(__file__), 'configs', self.db)
+        con = sqlite3.connect(db_filename)
+        con.execute("""create table table_10__216__193__114 (id integer not null, filename text,
+                    cli_command text, snap_name text, data_format text, data text)""")
+        for age, data in [(0, "new_data"), (1, "old_data")]:
+            con.execute("insert into table_10__216__193__114 values (?, 'file', 'show version', 'mock_snap', 'text', ?)",
+                        (age, data))
+        con.commit()
+        con.close()
+        extr = SqliteExtractXml(self.db)
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 1), ("old_data", "text"))
+        js = JsnapSqlite("10.216.193.114", self.db)
+        self.db_dict2['data'] = "latest_data"
+        js.insert_data(self.db_dict2)
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 0), ("latest_data", "text"))
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 2), ("old_data", "text"))
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    @patch('jnpr.jsnapy.sqlite_get.get_path')
+    def test_sqlite_get_all_using_snapname(self, mock_spath, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        mock_spath.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = JsnapSqlite("10.216.193.114", self.db)
+        js.insert_data(self.db_dict2)
+        self.db_dict2['data'] = "mock_data_2"
+        js.insert_data(self.db_dict2)
+        self.db_dict2['cli_command'] = "show chassis fpc"
+        self.db_dict2['format'] = "xml"
+        js.insert_data(self.db_dict2)
+        self.db_dict2['snap_name'] = "other_snap"
+        js.insert_data(self.db_dict2)
+        extr = SqliteExtractXml(self.db)
+        snaps = extr.get_all_using_snapname("10.216.193.114", "mock_snap")
+        self.assertEqual(snaps, {'show version': ("mock_data_2", "text"),
+                                 'show chassis fpc': ("mock_data_2", "xml")})
+
+    @patch('jnpr.jsnapy.sqlite_get.get_path')
+    def test_sqlite_get_all_legacy(self, mock_spath):
+        mock_spath.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        extr = SqliteExtractXml("jbb.db")
+        snaps = extr.get_all_using_snapname("10.216.193.114", "snap_no-diff_pre")
+        self.assertEqual(snaps.keys(), ['show_interfaces_terse_ge-*'])
+        data, data_format = extr.get_xml_using_snapname(
+            "10.216.193.114", 'show_interfaces_terse_ge-*', "snap_no-diff_pre")
+        self.assertEqual(snaps['show_interfaces_terse_ge-*'], (data, data_format))
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    @patch('jnpr.jsnapy.sqlite_get.get_path')
+    def test_sqlite_compressed_data(self, mock_spath, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        mock_spath.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = JsnapSqlite("10.216.193.114", self.db)
+        self.db_dict2['data'] = sqlite3.Binary(compress("<output>mock_data</output>", 'zlib'))
+        js.insert_data(self.db_dict2)
+        extr = SqliteExtractXml(self.db)
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 0), ("<output>mock_data</output>", "text"))
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    @patch('jnpr.jsnapy.sqlite_get.get_path')
+    def test_sqlite_dedup(self, mock_spath, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        mock_spath.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        js = JsnapSqlite("10.216.193.114", self.db, max_snapshots=2)
+        js2 = JsnapSqlite("10.216.193.115", self.db)
+        js.insert_data(self.db_dict2)
+        js.insert_data(self.db_dict2)
+        js2.insert_data(self.db_dict2)
+        con = get_connection(js.db_filename).conn
+        self.assertEqual(con.execute("SELECT count(*) FROM snapshot_blobs").fetchone()[0], 1)
+        extr = SqliteExtractXml(self.db)
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 1), ("mock_data", "text"))
+        self.assertEqual(extr.get_all_using_snapname("10.216.193.115", "mock_snap"),
+                         {'show version': ("mock_data", "text")})
+        # blobs are removed once no snapshot of any device refers to them
+        for data in ["data_1", "data_2", "data_3"]:
+            self.db_dict2['data'] = data
+            js.insert_data(self.db_dict2)
+        # once per run, not in each write
+        self.assertEqual(con.execute("SELECT count(*) FROM snapshot_blobs").fetchone()[0], 4)
+        remove_unused_blobs()
+        blobs = [row[0] for row in con.execute("SELECT data FROM snapshot_blobs ORDER BY data")]
+        self.assertEqual(blobs, ["data_2", "data_3", "mock_data"])
+
+    @patch('jnpr.jsnapy.sqlite_store.get_path')
+    @patch('jnpr.jsnapy.sqlite_get.get_path')
+    def test_sqlite_table_without_hash(self, mock_spath, mock_path):
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        mock_spath.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        db_filename = os.path.join(os.path.dirname(__file__), 'configs', self.db)
+        con = sqlite3.connect(db_filename)
+        con.execute("""create table table_10__216__193__114 (id integer not null, filename text,
+                    cli_command text, snap_name text, data_format text, data text, taken_at real)""")
+        con.execute("insert into table_10__216__193__114 values (0, 'file', 'show version', 'mock_snap', 'text', 'old_data', 0)")
+        con.commit()
+        con.close()
+        extr = SqliteExtractXml(self.db)
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 0), ("old_data", "text"))
+        js = JsnapSqlite("10.216.193.114", self.db)
+        js.insert_data(self.db_dict2)
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 0), ("mock_data", "text"))
+        self.assertEqual(extr.get_xml_using_snap_id(
+            "10.216.193.114", "show version", 1), ("old_data", "text"))
+
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(TestSqlite)
     unittest.TextTestRunner(verbosity=2).run(suite)
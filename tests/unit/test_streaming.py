@@ -0,0 +1,87 @@
+import unittest
+import os
+import yaml
+from io import BytesIO
+from lxml import etree
+from jnpr.jsnapy import streaming
+from jnpr.jsnapy.check import Comparator
+from mock import patch
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.db = dict()
+        self.db['store_in_sqlite'] = False
+        self.db['check_from_sqlite'] = False
+        self.db['db_name'] = "jbb.db"
+        self.db['first_snap_id'] = None
+        self.data = ("<rpc-reply><route-table><name>inet.0</name>"
+                     "<rt><dest>10.0.0.0/8</dest><entry><nh>1.1.1.1</nh></entry></rt>"
+                     "<rt><dest>20.0.0.0/8</dest></rt><summary>2</summary>"
+                     "</route-table><cli>show route</cli></rpc-reply>")
+
+    def test_stream_paths(self):
+        test = {'iterate': {'xpath': 'route-table/rt', 'id': './dest, entry/nh',
+                            'tests': [{'exists': 'entry/nh',
+                                       'err': "{{post['dest']}} has no next hop"}]}}
+        self.assertEqual(streaming.stream_paths([test]), frozenset(['route-table/rt']))
+        test['iterate']['id'] = '../name'
+        self.assertIsNone(streaming.stream_paths([test]))
+        test['iterate']['id'] = 'dest'
+        test['iterate']['tests'].append({'all-same': 'dest, //summary'})
+        self.assertIsNone(streaming.stream_paths([test]))
+        item = {'item': {'xpath': 'route-table[name="inet.0"]',
+                         'tests': [{'exists': 'rt'}]}}
+        self.assertIsNone(streaming.stream_paths([item]))
+        self.assertIsNone(streaming.stream_paths([]))
+
+    def test_parse_paths(self):
+        full = etree.parse(BytesIO(self.data))
+        for x_path in ['route-table/rt', '/rpc-reply/route-table/rt', '//rt']:
+            doc = streaming.parse_paths(BytesIO(self.data), [x_path])
+            self.assertEqual([etree.tostring(e) for e in doc.xpath(x_path)],
+                             [etree.tostring(e) for e in full.xpath(x_path)])
+            self.assertEqual(doc.xpath('//summary | //name | //cli'), [])
+        doc = streaming.parse_paths(BytesIO(self.data), ['cli', '//rt/dest'])
+        self.assertEqual(etree.tostring(doc),
+                         "<rpc-reply><route-table><rt><dest>10.0.0.0/8</dest></rt>"
+                         "<rt><dest>20.0.0.0/8</dest></rt></route-table>"
+                         "<cli>show route</cli></rpc-reply>")
+
+    def _check(self, mock_path, conf_name):
+        conf_file = os.path.join(os.path.dirname(__file__), 'configs', conf_name)
+        mock_path.return_value = os.path.join(os.path.dirname(__file__), 'configs')
+        main_file = yaml.load(open(conf_file, 'r'))
+        main_file['streaming'] = True
+        with patch('jnpr.jsnapy.streaming.parse_paths',
+                   wraps=streaming.parse_paths) as mock_parse:
+            oper = Comparator().generate_test_files(
+                main_file, "10.216.193.114", True, False, self.db, False,
+                "snap_no-diff_pre", None, "snap_no-diff_post")
+        return oper, mock_parse
+
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_check_streaming(self, mock_path):
+        oper, mock_parse = self._check(mock_path, 'main_streaming.yml')
+        self.assertEqual(mock_parse.call_count, 2)
+        self.assertEqual(set(mock_parse.call_args[0][1]),
+                         set(['physical-interface', '//physical-interface/logical-interface']))
+        self.assertEqual(oper.no_passed, 1)
+        self.assertEqual(oper.no_failed, 2)
+        self.assertEqual([r['count'] for r in oper.test_results['show interfaces terse ge-*']],
+                         [{'fail': 3, 'pass': 18}, {'fail': 1, 'pass': 19}, {'fail': 0, 'pass': 3}])
+
+    @patch('jnpr.jsnapy.check.get_path')
+    def test_check_not_streamable(self, mock_path):
+        # ids and nodes under ../ need complete snapshot
+        oper, mock_parse = self._check(mock_path, 'main_no-diff.yml')
+        self.assertEqual(mock_parse.call_count, 0)
+        self.assertEqual(oper.no_passed, 2)
+        self.assertEqual(oper.no_failed, 4)
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStreaming)
+    unittest.TextTestRunner(verbosity=2).run(suite)
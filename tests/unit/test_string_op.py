@@ -1,6 +1,10 @@
 import unittest
 import yaml
+import re
+import logging
+import jinja2
 from jnpr.jsnapy.check import Comparator
+from jnpr.jsnapy.testop import Operator, RenderedMessage, get_placeholders
 from mock import patch
 import os
 from nose.plugins.attrib import attr
@@ -137,6 +141,63 @@ class TestStringOperators(unittest.TestCase):
         self.assertEqual(oper.no_passed, 1)
         self.assertEqual(oper.no_failed, 0)
 
+    def test_message_template_cached(self):
+        op = Operator()
+        mssg = "Interface {{id_0}} is {{post['oper-status']}} in cached template test"
+        with patch('jnpr.jsnapy.testop.jinja2.Template', wraps=jinja2.Template) as mock_template, \
+                patch.object(op.logger_testop, 'isEnabledFor', return_value=True), \
+                patch.object(op.logger_testop, 'info') as mock_info:
+            for i in range(3):
+                op._print_message(mssg, {'id_0': i}, {}, {'oper-status': 'up'})
+        self.assertEqual(mock_template.call_count, 1)
+        self.assertEqual(str(mock_info.call_args_list[2][0][1]),
+                         "Interface 2 is up in cached template test")
+
+    def test_message_not_rendered(self):
+        op = Operator()
+        with patch('jnpr.jsnapy.testop.get_template') as mock_template, \
+                patch.object(op.logger_testop, 'isEnabledFor', return_value=False), \
+                patch.object(op.logger_testop, 'debug') as mock_debug:
+            op._print_message("{{post['name']}}", {}, {}, {'name': 'ge-0/0/0'}, "debug")
+        self.assertFalse(mock_template.called)
+        self.assertFalse(mock_debug.called)
+
+    def test_message_rendered_by_handler(self):
+        op = Operator()
+        mssg = "Interface {{id_0}} is {{post['oper-status']}} in lazy message test"
+        iddict = {'id_0': 'ge-0/0/0'}
+        postdict = {'oper-status': 'up'}
+        with patch.object(op.logger_testop, 'isEnabledFor', return_value=True), \
+                patch.object(op.logger_testop, 'info') as mock_info:
+            op._print_message(mssg, iddict, {}, postdict)
+        message = mock_info.call_args[0][1]
+        self.assertIsInstance(message, RenderedMessage)
+        postdict['oper-status'] = 'down'
+        self.assertEqual(str(message), "Interface ge-0/0/0 is up in lazy message test")
+
+    def test_message_rendered_once_as_unicode(self):
+        op = Operator()
+        mssg = u"Interface {{id_0}} is {{post['description']}} in unicode message test"
+        with patch.object(op.logger_testop, 'isEnabledFor', return_value=True), \
+                patch.object(op.logger_testop, 'info') as mock_info:
+            op._print_message(mssg, {'id_0': 'ge-0/0/0'}, {}, {'description': u'r\xe9seau'})
+        args = mock_info.call_args[0]
+        record = logging.LogRecord('jnpr.jsnapy.testop', logging.INFO, __file__, 0,
+                                   args[0], args[1:], None)
+        with patch.object(args[1].template, 'render', wraps=args[1].template.render) as mock_render:
+            for i in range(3):
+                self.assertEqual(record.getMessage(),
+                                 u"Interface ge-0/0/0 is r\xe9seau in unicode message test")
+        self.assertEqual(mock_render.call_count, 1)
+
+    def test_placeholders_parsed_once(self):
+        mssg = "{{pre['admin-status']}} to {{post['admin-status']}} for {{id_0}} in placeholder test"
+        with patch('jnpr.jsnapy.testop.re.findall', wraps=re.findall) as mock_findall:
+            self.assertEqual(get_placeholders(mssg),
+                             (('pre', 'admin-status'), ('post', 'admin-status')))
+            get_placeholders(mssg)
+        self.assertEqual(mock_findall.call_count, 1)
+
 with patch('logging.Logger') as mock_logger:
     if __name__ == "__main__":
         suite = unittest.TestLoader().loadTestsFromTestCase(
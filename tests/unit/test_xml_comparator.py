@@ -0,0 +1,114 @@
+import unittest
+from lxml import etree
+from jnpr.jsnapy.xml_comparator import XmlComparator
+from jnpr.jsnapy import merkle
+from mock import patch
+from nose.plugins.attrib import attr
+
+
+@attr('unit')
+class TestXmlComparator(unittest.TestCase):
+
+    def setUp(self):
+        self.pre = etree.fromstring(
+            "<route-table><table-name>inet.0</table-name>"
+            "<rt><rt-destination>10.0.0.0/8</rt-destination><nh>1.1.1.1</nh></rt>"
+            "<rt><rt-destination>20.0.0.0/8</rt-destination><nh>2.2.2.2</nh></rt>"
+            "<rt><rt-destination>30.0.0.0/8</rt-destination><nh>3.3.3.3</nh></rt>"
+            "</route-table>")
+
+    def _compare(self, post, keys=None):
+        result = []
+        tresult = XmlComparator(keys=keys).xml_compare(self.pre, post, result.append)
+        return tresult, result
+
+    def test_value_changed(self):
+        post = etree.fromstring(etree.tostring(self.pre).replace('2.2.2.2', '4.4.4.4'))
+        tresult, result = self._compare(post)
+        self.assertFalse(tresult['result'])
+        self.assertEqual(result, ["<nh> value different: \n    Pre node text: '2.2.2.2'"
+                                  "    Post node text: '4.4.4.4'    Parent node: <rt>"])
+        self.assertEqual(tresult['diff_on'][0]['testop'], 'value_miss_match')
+        tresult, result = self._compare(etree.fromstring(etree.tostring(self.pre)))
+        self.assertTrue(tresult['result'])
+        self.assertEqual(result, [])
+
+    def test_serialized_once(self):
+        post = etree.fromstring(etree.tostring(self.pre).replace('2.2.2.2', '4.4.4.4'))
+        with patch('jnpr.jsnapy.xml_comparator.etree.tostring',
+                   wraps=etree.tostring) as mock_tostring:
+            tresult, result = self._compare(post)
+        # only whole trees are serialized, not each subtree again
+        self.assertEqual(mock_tostring.call_count, 2)
+        self.assertEqual(len(result), 1)
+
+    def test_node_removed(self):
+        post = etree.fromstring(etree.tostring(self.pre))
+        post.remove(post[1])
+        tresult, result = self._compare(post)
+        # compared by position, every node after removed one differs
+        self.assertEqual(len(result), 4)
+        tresult, result = self._compare(post, keys={'rt': 'rt-destination'})
+        self.assertEqual([d['testop'] for d in tresult['diff_on']],
+                         ['child_node_miss_match', 'node_missing_in_post'])
+        self.assertEqual(tresult['diff_on'][1]['key'], ['10.0.0.0/8'])
+        self.assertEqual(result, ["Node <rt> with key 10.0.0.0/8 missing in post "
+                                  "snapshot, parent node: <route-table>"])
+
+    def test_nodes_reordered(self):
+        post = etree.fromstring(etree.tostring(self.pre))
+        post.append(post[1])
+        post[-1].find('nh').text = '5.5.5.5'
+        tresult, result = self._compare(post, keys={'rt': ['rt-destination']})
+        self.assertEqual(result, ["<nh> value different: \n    Pre node text: '1.1.1.1'"
+                                  "    Post node text: '5.5.5.5'    Parent node: <rt>"])
+
+    def test_invalid_keys(self):
+        comparator = XmlComparator(keys=['rt'])
+        self.assertEqual(comparator.keys, {})
+
+    def test_deep_tree(self):
+        pre = post = None
+        for _ in range(5000):
+            pre = etree.Element('a') if pre is None else etree.SubElement(pre, 'a')
+            post = etree.Element('a') if post is None else etree.SubElement(post, 'a')
+        post.text = 'x'
+        result = []
+        tresult = XmlComparator().xml_compare(pre.getroottree().getroot(),
+                                              post.getroottree().getroot(), result.append)
+        self.assertFalse(tresult['result'])
+        self.assertEqual(len(result), 1)
+
+    def test_merkle_index(self):
+        post = etree.fromstring(etree.tostring(self.pre).replace('2.2.2.2', '4.4.4.4'))
+        index1 = merkle.build(self.pre)
+        index2 = merkle.build(post)
+        self.assertEqual(len(index1), 11)
+        self.assertEqual(index1.children(0), [1, 2, 5, 8])
+        self.assertEqual(merkle.MerkleIndex.loads(index1.dumps('abc'), 'abc').digests,
+                         index1.digests)
+        self.assertIsNone(merkle.MerkleIndex.loads(index1.dumps('abc'), 'def'))
+        result = []
+        with patch('jnpr.jsnapy.xml_comparator.etree.tostring') as mock_tostring:
+            tresult = XmlComparator().xml_compare(self.pre, post, result.append,
+                                                  index1, index2)
+            # unchanged subtrees are skipped using their digest
+            self.assertFalse(mock_tostring.called)
+        self.assertEqual(result, ["<nh> value different: \n    Pre node text: '2.2.2.2'"
+                                  "    Post node text: '4.4.4.4'    Parent node: <rt>"])
+        # whitespace around values is not a difference
+        post = etree.fromstring(etree.tostring(self.pre).replace('>inet.0<', '> inet.0 <'))
+        self.assertEqual(merkle.build(post).digests, index1.digests)
+
+    def test_merkle_index_mismatch(self):
+        post = etree.fromstring(etree.tostring(self.pre).replace('2.2.2.2', '4.4.4.4'))
+        other = etree.fromstring("<route-table><rt/></route-table>")
+        result = []
+        XmlComparator().xml_compare(self.pre, post, result.append,
+                                    merkle.build(other), merkle.build(post))
+        # index made for another tree is not used
+        self.assertEqual(len(result), 1)
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestXmlComparator)
+    unittest.TextTestRunner(verbosity=2).run(suite)